@@ -0,0 +1,404 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+⏱️ Benchmark de Embeddings ARIA
+==============================
+Compara la latencia de búsqueda de ARIAEmbeddingsSupabase entre el modo
+'local' (índice vectorial en memoria) y el modo 'rpc' (pgvector en Postgres).
+
+Para probar contra un Postgres+pgvector local:
+    supabase start                       # CLI de Supabase (Postgres + pgvector + PostgREST)
+    psql "$DB_URL" -f schema_supabase.sql
+    SUPABASE_URL=http://localhost:54321 SUPABASE_ANON_KEY=... python benchmark_embeddings.py --filas 5000
+
+Uso: python benchmark_embeddings.py [--filas N] [--consultas N]
+     python benchmark_embeddings.py --cuantizacion [--filas N]   # sin Supabase
+     python benchmark_embeddings.py --particiones [--filas N]    # sin Supabase
+     python benchmark_embeddings.py --almacen [--filas N]        # sin Supabase
+     python benchmark_embeddings.py --codificadores              # sin Supabase
+     python benchmark_embeddings.py --microlotes [--hilos N]     # sin Supabase
+     python benchmark_embeddings.py --topk [--tamanos 10000,100000,1000000]  # sin Supabase
+"""
+
+import sys
+import os
+import time
+import argparse
+import threading
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+CATEGORIA_BENCHMARK = 'benchmark'
+
+
+def print_header(title):
+    """Imprime una cabecera formateada"""
+    print(f"\n{'='*50}")
+    print(f"⏱️ {title}")
+    print(f"{'='*50}")
+
+
+def percentiles(tiempos):
+    """Calcular p50/p95/p99 en milisegundos"""
+    ms = np.array(tiempos) * 1000
+    return {
+        'p50': round(float(np.percentile(ms, 50)), 2),
+        'p95': round(float(np.percentile(ms, 95)), 2),
+        'p99': round(float(np.percentile(ms, 99)), 2)
+    }
+
+
+def sembrar_datos(system, filas, dimension=384, semilla=0):
+    """Insertar filas sintéticas en la categoría de benchmark"""
+    rng = np.random.default_rng(semilla)
+    lote = []
+    for i in range(filas):
+        lote.append({
+            'texto': f'texto de benchmark {i}',
+            'embedding': rng.normal(size=dimension).astype(np.float32).tolist(),
+            'categoria': CATEGORIA_BENCHMARK,
+            'fuente': 'benchmark'
+        })
+        if len(lote) == 500:
+            system.supabase.table('aria_embeddings').insert(lote).execute()
+            lote = []
+    if lote:
+        system.supabase.table('aria_embeddings').insert(lote).execute()
+
+
+def medir_busquedas(system, consultas, categoria=None):
+    """Medir la latencia de buscar_similares y buscar_conocimiento"""
+    tiempos_similares = []
+    tiempos_conocimiento = []
+
+    for consulta in consultas:
+        inicio = time.perf_counter()
+        system.buscar_similares(consulta, limite=5, categoria=categoria, umbral_similitud=0.0)
+        tiempos_similares.append(time.perf_counter() - inicio)
+
+        inicio = time.perf_counter()
+        system.buscar_conocimiento(consulta, limite=3)
+        tiempos_conocimiento.append(time.perf_counter() - inicio)
+
+    return {
+        'buscar_similares': percentiles(tiempos_similares),
+        'buscar_conocimiento': percentiles(tiempos_conocimiento)
+    }
+
+
+def benchmark_modos(filas, num_consultas):
+    """Comparar los modos 'local' y 'rpc' sobre el mismo corpus"""
+    from core.aria_embeddings_supabase import ARIAEmbeddingsSupabase
+
+    consultas = [f'consulta de prueba número {i}' for i in range(num_consultas)]
+    resultados = {}
+
+    system = ARIAEmbeddingsSupabase(modo_busqueda='local')
+    print_header(f"SEMBRANDO {filas} FILAS")
+    sembrar_datos(system, filas, system.embedding_dim)
+
+    try:
+        for modo in ARIAEmbeddingsSupabase.MODOS_BUSQUEDA:
+            system.modo_busqueda = modo
+            if modo == 'local':
+                # La construcción del índice no cuenta como latencia de búsqueda
+                system.recargar_indice()
+            # Calentar el modelo antes de medir
+            system.generar_embedding('calentamiento')
+
+            print_header(f"MODO {modo.upper()}")
+            resultados[modo] = medir_busquedas(system, consultas)
+            for metodo, valores in resultados[modo].items():
+                print(f"✅ {metodo}: {valores}")
+    finally:
+        system.limpiar_categoria(CATEGORIA_BENCHMARK)
+
+    return resultados
+
+
+def benchmark_cuantizacion(filas, num_consultas, k=5, dimension=384, semilla=0):
+    """Informe de memoria, latencia y recall@k de float16/int8 frente a float32"""
+    from core.aria_vector_index import ARIAVectorIndex
+
+    rng = np.random.default_rng(semilla)
+    vectores = rng.normal(size=(filas, dimension)).astype(np.float32)
+    datos = [{'id': i + 1, 'embedding': v, 'categoria': 'benchmark'} for i, v in enumerate(vectores)]
+    consultas = rng.normal(size=(num_consultas, dimension)).astype(np.float32)
+
+    indices = {}
+    for precision in ('float32', 'float16', 'int8'):
+        indice = ARIAVectorIndex(dimension, capacidad_inicial=filas, precision=precision)
+        indice.agregar(datos)
+        indices[precision] = indice
+
+    # El índice float32 es la referencia exacta
+    referencia = [{r['id'] for r in indices['float32'].buscar(q, k)} for q in consultas]
+
+    print_header(f"CUANTIZACIÓN ({filas} filas, recall@{k})")
+    for precision, indice in indices.items():
+        tiempos = []
+        aciertos = 0
+        for q, esperados in zip(consultas, referencia):
+            inicio = time.perf_counter()
+            resultados = indice.buscar(q, k)
+            tiempos.append(time.perf_counter() - inicio)
+            aciertos += len(esperados & {r['id'] for r in resultados})
+
+        print(f"✅ {precision}: memoria={indice.memoria_bytes() / 1e6:.1f} MB "
+              f"latencia={percentiles(tiempos)} recall={aciertos / (k * len(consultas)):.3f}")
+
+
+def benchmark_particiones(filas, num_consultas, k=5, dimension=384, semilla=0):
+    """Latencia de búsquedas filtradas por categoría: índice plano frente a particionado"""
+    from core.aria_vector_index import ARIAVectorIndex, ARIAPartitionedIndex
+
+    # Distribución sesgada como la real: casi todo son conversaciones
+    proporciones = {'conversation': 0.90, 'conversational_learning': 0.08, 'manual': 0.02}
+    rng = np.random.default_rng(semilla)
+    vectores = rng.normal(size=(filas, dimension)).astype(np.float32)
+    categorias = rng.choice(list(proporciones), size=filas, p=list(proporciones.values()))
+    datos = [{'id': i + 1, 'embedding': v, 'categoria': c}
+             for i, (v, c) in enumerate(zip(vectores, categorias))]
+    consultas = rng.normal(size=(num_consultas, dimension)).astype(np.float32)
+
+    plano = ARIAVectorIndex(dimension, capacidad_inicial=filas)
+    plano.agregar(datos)
+    particionado = ARIAPartitionedIndex(dimension)
+    particionado.agregar(datos)
+
+    print_header(f"PARTICIONES POR CATEGORÍA ({filas} filas)")
+    for categoria in [None] + list(proporciones):
+        for nombre, indice in (('plano', plano), ('particionado', particionado)):
+            tiempos = []
+            for q in consultas:
+                inicio = time.perf_counter()
+                indice.buscar(q, k, categoria=categoria)
+                tiempos.append(time.perf_counter() - inicio)
+            filas_categoria = int((categorias == categoria).sum()) if categoria else filas
+            print(f"✅ {categoria or 'global'} ({filas_categoria} filas) {nombre}: {percentiles(tiempos)}")
+
+
+def benchmark_almacen(filas, num_consultas, k=5, dimension=384, semilla=0):
+    """Latencia del almacén mapeado en disco frente al índice residente en RAM"""
+    import tempfile
+    from core.aria_vector_index import ARIAPartitionedIndex
+    from core.aria_vector_store import ARIAVectorStore, ARIAVectorStoreWriter
+
+    rng = np.random.default_rng(semilla)
+    vectores = rng.normal(size=(filas, dimension)).astype(np.float32)
+    datos = [{'id': i + 1, 'embedding': v, 'categoria': 'benchmark', 'texto': f'texto {i}'}
+             for i, v in enumerate(vectores)]
+    consultas = rng.normal(size=(num_consultas, dimension)).astype(np.float32)
+
+    indice = ARIAPartitionedIndex(dimension)
+    indice.agregar(datos)
+
+    print_header(f"ALMACÉN MAPEADO ({filas} filas)")
+    with tempfile.TemporaryDirectory() as directorio:
+        for precision in ('float32', 'float16'):
+            ruta = os.path.join(directorio, precision)
+            escritor = ARIAVectorStoreWriter(ruta, dimension, precision)
+            escritor.agregar(datos)
+            escritor.publicar()
+            escritor.cerrar()
+            almacen = ARIAVectorStore(ruta)
+            tamano = sum(os.path.getsize(os.path.join(ruta, f)) for f in os.listdir(ruta))
+
+            tiempos = []
+            aciertos = 0
+            for q in consultas:
+                esperados = {r['id'] for r in indice.buscar(q, k)}
+                inicio = time.perf_counter()
+                resultados = almacen.buscar(q, k)
+                tiempos.append(time.perf_counter() - inicio)
+                aciertos += len(esperados & {r['id'] for r in resultados})
+            print(f"✅ mmap {precision}: disco={tamano / 1e6:.1f} MB latencia={percentiles(tiempos)} "
+                  f"recall={aciertos / (k * len(consultas)):.3f}")
+
+    tiempos = []
+    for q in consultas:
+        inicio = time.perf_counter()
+        indice.buscar(q, k)
+        tiempos.append(time.perf_counter() - inicio)
+    print(f"✅ RAM float32: memoria={indice.memoria_bytes() / 1e6:.1f} MB latencia={percentiles(tiempos)}")
+
+
+def benchmark_codificadores(num_consultas, textos_lote=256, tamano_lote=64):
+    """
+    Paridad, latencia por texto y throughput de los backends del modelo
+
+    Devuelve False si algún backend queda por debajo de su umbral de paridad.
+    """
+    from core.aria_encoder_backends import BACKENDS, cargar_codificador, verificar_paridad
+
+    frases = [
+        "Los tequeños son una comida venezolana hecha de queso y masa",
+        "Python es un lenguaje de programación versátil",
+        "¿Cómo puedo conectar mi aplicación con Supabase?",
+        "hola",
+        "La inteligencia artificial ayuda a automatizar tareas repetitivas en el trabajo diario",
+        "Me siento un poco triste hoy, ¿me cuentas un chiste?",
+    ]
+    textos = [f"{frases[i % len(frases)]} ({i})" for i in range(textos_lote)]
+
+    print_header("BACKENDS DEL CODIFICADOR")
+    referencia = None
+    aprobados = True
+    for backend in BACKENDS:
+        try:
+            codificador = cargar_codificador('all-MiniLM-L6-v2', backend)
+        except Exception as e:
+            print(f"⚠️ {backend}: no disponible ({e})")
+            continue
+        codificador.encode(['calentamiento'], normalize_embeddings=True)
+
+        tiempos = []
+        for i in range(num_consultas):
+            inicio = time.perf_counter()
+            codificador.encode([textos[i % len(textos)]], normalize_embeddings=True)
+            tiempos.append(time.perf_counter() - inicio)
+
+        inicio = time.perf_counter()
+        codificador.encode(textos, batch_size=tamano_lote, normalize_embeddings=True)
+        throughput = len(textos) / (time.perf_counter() - inicio)
+
+        if referencia is None:
+            referencia = codificador
+            paridad = 'referencia'
+        else:
+            paridad = verificar_paridad(referencia, codificador, textos, backend=backend)
+            aprobados = aprobados and paridad['aprobado']
+        icono = '❌' if isinstance(paridad, dict) and not paridad['aprobado'] else '✅'
+        print(f"{icono} {backend}: latencia={percentiles(tiempos)} throughput={throughput:.0f} textos/s paridad={paridad}")
+    return aprobados
+
+
+def benchmark_topk(num_consultas, tamanos, k=5, dimension=384, semilla=0, umbral=0.1):
+    """Ranking completo (un dict por fila + sort) frente a la selección top-k del índice"""
+    from core.aria_vector_index import ARIAVectorIndex
+
+    rng = np.random.default_rng(semilla)
+    consultas = rng.normal(size=(num_consultas, dimension)).astype(np.float32)
+    consultas /= np.linalg.norm(consultas, axis=1, keepdims=True)
+
+    print_header(f"TOP-{k}: SORT COMPLETO FRENTE A ARGPARTITION")
+    for filas in tamanos:
+        vectores = rng.normal(size=(filas, dimension)).astype(np.float32)
+        vectores /= np.linalg.norm(vectores, axis=1, keepdims=True)
+        datos = [{'id': i + 1, 'categoria': 'benchmark'} for i in range(filas)]
+
+        indice = ARIAVectorIndex(dimension, capacidad_inicial=filas)
+        for inicio in range(0, filas, 100_000):
+            indice.agregar([{**fila, 'embedding': v} for fila, v in
+                            zip(datos[inicio:inicio + 100_000], vectores[inicio:inicio + 100_000])])
+
+        # El ranking ingenuo es lento con 1M filas: basta con unas pocas consultas
+        for umbral_consulta in (None, umbral):
+            tiempos_sort = []
+            for q in consultas[:min(num_consultas, 5)]:
+                inicio = time.perf_counter()
+                similitudes = vectores @ q
+                resultados = [{**fila, 'similitud': float(s)} for fila, s in zip(datos, similitudes)]
+                resultados.sort(key=lambda x: x['similitud'], reverse=True)
+                if umbral_consulta is not None:
+                    resultados = [r for r in resultados if r['similitud'] >= umbral_consulta]
+                esperados = [r['id'] for r in resultados[:k]]
+                tiempos_sort.append(time.perf_counter() - inicio)
+                assert [r['id'] for r in indice.buscar(q, k, umbral_similitud=umbral_consulta)] == esperados
+
+            tiempos_topk = []
+            for q in consultas:
+                inicio = time.perf_counter()
+                indice.buscar(q, k, umbral_similitud=umbral_consulta)
+                tiempos_topk.append(time.perf_counter() - inicio)
+
+            etiqueta = f"umbral={umbral_consulta}" if umbral_consulta is not None else "sin umbral"
+            print(f"✅ {filas} filas ({etiqueta}): sort={percentiles(tiempos_sort)} top-k={percentiles(tiempos_topk)}")
+        del indice, vectores, datos
+
+
+def benchmark_microlotes(num_consultas, hilos=16, backend='torch'):
+    """Throughput con peticiones concurrentes: encode por petición frente a micro-lotes"""
+    from core.aria_encoder_backends import cargar_codificador
+    from core.aria_batching_encoder import ARIABatchingEncoder
+
+    print_header(f"MICRO-LOTES ({hilos} hilos x {num_consultas} textos, {backend})")
+    try:
+        modelo = cargar_codificador('all-MiniLM-L6-v2', backend)
+    except Exception as e:
+        print(f"⚠️ {backend}: no disponible ({e})")
+        return
+    modelo.encode(['calentamiento'], normalize_embeddings=True)
+
+    def medir(codificar):
+        tiempos = []
+        candado = threading.Lock()
+
+        def cliente(h):
+            propios = []
+            for i in range(num_consultas):
+                inicio = time.perf_counter()
+                codificar(f"consulta {h}-{i} sobre comida venezolana y programación")
+                propios.append(time.perf_counter() - inicio)
+            with candado:
+                tiempos.extend(propios)
+
+        inicio = time.perf_counter()
+        trabajadores = [threading.Thread(target=cliente, args=(h,)) for h in range(hilos)]
+        for t in trabajadores:
+            t.start()
+        for t in trabajadores:
+            t.join()
+        return len(tiempos) / (time.perf_counter() - inicio), percentiles(tiempos)
+
+    throughput, latencia = medir(lambda texto: modelo.encode([texto], normalize_embeddings=True)[0])
+    print(f"✅ Encode por petición: throughput={throughput:.0f} textos/s latencia={latencia}")
+
+    codificador = ARIABatchingEncoder(modelo)
+    throughput, latencia = medir(codificador.codificar)
+    estadisticas = codificador.estadisticas()
+    codificador.cerrar()
+    print(f"✅ Micro-lotes: throughput={throughput:.0f} textos/s latencia={latencia} "
+          f"lote_medio={estadisticas['tamano_medio_lote']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de búsqueda de embeddings')
+    parser.add_argument('--filas', type=int, default=2000, help='Filas sintéticas a insertar')
+    parser.add_argument('--consultas', type=int, default=50, help='Consultas a medir por modo')
+    parser.add_argument('--cuantizacion', action='store_true',
+                        help='Informe de recall y memoria de float16/int8 (sin Supabase)')
+    parser.add_argument('--particiones', action='store_true',
+                        help='Búsquedas por categoría con índice plano y particionado (sin Supabase)')
+    parser.add_argument('--almacen', action='store_true',
+                        help='Almacén mapeado en disco frente al índice en RAM (sin Supabase)')
+    parser.add_argument('--codificadores', action='store_true',
+                        help='Paridad y rendimiento de los backends torch/onnx/onnx-int8 (sin Supabase)')
+    parser.add_argument('--microlotes', action='store_true',
+                        help='Throughput con peticiones concurrentes con y sin micro-lotes (sin Supabase)')
+    parser.add_argument('--hilos', type=int, default=16, help='Peticiones concurrentes para --microlotes')
+    parser.add_argument('--topk', action='store_true',
+                        help='Ranking con sort completo frente a selección top-k (sin Supabase)')
+    parser.add_argument('--tamanos', default='10000,100000,1000000', help='Filas de cada tamaño para --topk')
+    args = parser.parse_args()
+
+    if args.cuantizacion:
+        benchmark_cuantizacion(args.filas, args.consultas)
+    elif args.particiones:
+        benchmark_particiones(args.filas, args.consultas)
+    elif args.almacen:
+        benchmark_almacen(args.filas, args.consultas)
+    elif args.codificadores:
+        if not benchmark_codificadores(args.consultas):
+            sys.exit(1)
+    elif args.microlotes:
+        benchmark_microlotes(args.consultas, args.hilos)
+    elif args.topk:
+        benchmark_topk(args.consultas, [int(t) for t in args.tamanos.split(',')])
+    else:
+        benchmark_modos(args.filas, args.consultas)
+
+
+if __name__ == "__main__":
+    main()
@@ -26,6 +26,11 @@ CREATE TABLE IF NOT EXISTS public.aria_conversations (
     user_satisfaction INTEGER CHECK (user_satisfaction >= 1 AND user_satisfaction <= 5)
 );
 
+-- Id del mensaje de /chat: la cola de trabajos reintenta el guardado con un upsert
+-- por message_id, así que un reintento tras una caída no duplica la conversación
+ALTER TABLE public.aria_conversations ADD COLUMN IF NOT EXISTS message_id VARCHAR(64);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_aria_conversations_message_id ON public.aria_conversations(message_id);
+
 -- Crear tabla de sesiones de aprendizaje
 CREATE TABLE IF NOT EXISTS public.aria_learning_sessions (
     id SERIAL PRIMARY KEY,
@@ -64,6 +69,245 @@ CREATE TABLE IF NOT EXISTS public.aria_concept_relations (
     UNIQUE(concept_a, concept_b)
 );
 
+-- Extensión pgvector para los embeddings
+CREATE EXTENSION IF NOT EXISTS vector;
+
+-- Crear tabla de embeddings de textos (all-MiniLM-L6-v2, 384 dimensiones)
+CREATE TABLE IF NOT EXISTS public.aria_embeddings (
+    id BIGSERIAL PRIMARY KEY,
+    texto TEXT NOT NULL,
+    embedding vector(384) NOT NULL,
+    categoria VARCHAR(100) DEFAULT 'general',
+    subcategoria VARCHAR(100),
+    fuente VARCHAR(100) DEFAULT 'conversation',
+    idioma VARCHAR(10) DEFAULT 'es',
+    metadatos JSONB DEFAULT '{}'::jsonb,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+-- Crear tabla de conocimiento estructurado con embeddings
+CREATE TABLE IF NOT EXISTS public.aria_knowledge_vectors (
+    id BIGSERIAL PRIMARY KEY,
+    concepto VARCHAR(255) NOT NULL,
+    descripcion TEXT NOT NULL,
+    embedding vector(384) NOT NULL,
+    categoria VARCHAR(100) DEFAULT 'knowledge',
+    tags TEXT[] DEFAULT '{}',
+    confianza REAL DEFAULT 0.8 CHECK (confianza >= 0 AND confianza <= 1),
+    ejemplos TEXT[] DEFAULT '{}',
+    relaciones JSONB DEFAULT '{}'::jsonb,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+-- Payload cuantizado opcional (ARIA_EMBEDDINGS_PRECISION=float16|int8):
+-- bytes del vector en base64 y escala por vector para int8
+ALTER TABLE public.aria_embeddings ADD COLUMN IF NOT EXISTS embedding_q TEXT;
+ALTER TABLE public.aria_embeddings ADD COLUMN IF NOT EXISTS embedding_escala REAL;
+ALTER TABLE public.aria_knowledge_vectors ADD COLUMN IF NOT EXISTS embedding_q TEXT;
+ALTER TABLE public.aria_knowledge_vectors ADD COLUMN IF NOT EXISTS embedding_escala REAL;
+
+-- Sincronización incremental de los índices locales (ARIAVectorSync):
+-- updated_at marca las filas modificadas y las lápidas registran los borrados
+ALTER TABLE public.aria_embeddings ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW();
+ALTER TABLE public.aria_knowledge_vectors ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW();
+
+CREATE TABLE IF NOT EXISTS public.aria_vector_lapidas (
+    id BIGSERIAL PRIMARY KEY,
+    tabla VARCHAR(100) NOT NULL,
+    fila_id BIGINT NOT NULL,
+    deleted_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+CREATE OR REPLACE FUNCTION public.aria_tocar_updated_at()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    NEW.updated_at = NOW();
+    RETURN NEW;
+END;
+$$;
+
+-- Una sola inserción por sentencia: limpiar_categoria borra miles de filas de golpe
+CREATE OR REPLACE FUNCTION public.aria_registrar_lapidas()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    INSERT INTO public.aria_vector_lapidas (tabla, fila_id)
+    SELECT TG_TABLE_NAME, id FROM filas_borradas;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_aria_embeddings_updated_at ON public.aria_embeddings;
+CREATE TRIGGER trg_aria_embeddings_updated_at BEFORE UPDATE ON public.aria_embeddings
+    FOR EACH ROW EXECUTE FUNCTION public.aria_tocar_updated_at();
+DROP TRIGGER IF EXISTS trg_aria_knowledge_vectors_updated_at ON public.aria_knowledge_vectors;
+CREATE TRIGGER trg_aria_knowledge_vectors_updated_at BEFORE UPDATE ON public.aria_knowledge_vectors
+    FOR EACH ROW EXECUTE FUNCTION public.aria_tocar_updated_at();
+
+DROP TRIGGER IF EXISTS trg_aria_embeddings_lapidas ON public.aria_embeddings;
+CREATE TRIGGER trg_aria_embeddings_lapidas AFTER DELETE ON public.aria_embeddings
+    REFERENCING OLD TABLE AS filas_borradas
+    FOR EACH STATEMENT EXECUTE FUNCTION public.aria_registrar_lapidas();
+DROP TRIGGER IF EXISTS trg_aria_knowledge_vectors_lapidas ON public.aria_knowledge_vectors;
+CREATE TRIGGER trg_aria_knowledge_vectors_lapidas AFTER DELETE ON public.aria_knowledge_vectors
+    REFERENCING OLD TABLE AS filas_borradas
+    FOR EACH STATEMENT EXECUTE FUNCTION public.aria_registrar_lapidas();
+
+-- Las lápidas antiguas pueden purgarse; los índices más atrasados se corrigen con la reconciliación:
+--   DELETE FROM public.aria_vector_lapidas WHERE deleted_at < NOW() - INTERVAL '30 days';
+
+-- Deduplicación por contenido: hash SHA-256 del texto (o del concepto) normalizado,
+-- calculado en Python (hash_contenido). Un texto repetido en la misma categoría no crea
+-- otra fila: el upsert incrementa 'frecuencia'. Las filas anteriores (hash NULL) no
+-- chocan con el índice único; para fusionarlas ejecutar una vez desde Python:
+--   ARIAEmbeddingsSupabase().migrar_deduplicacion('aria_embeddings')
+--   ARIAEmbeddingsSupabase().migrar_deduplicacion('aria_knowledge_vectors')
+ALTER TABLE public.aria_embeddings ADD COLUMN IF NOT EXISTS contenido_hash TEXT;
+ALTER TABLE public.aria_embeddings ADD COLUMN IF NOT EXISTS frecuencia INTEGER DEFAULT 1;
+ALTER TABLE public.aria_knowledge_vectors ADD COLUMN IF NOT EXISTS contenido_hash TEXT;
+ALTER TABLE public.aria_knowledge_vectors ADD COLUMN IF NOT EXISTS frecuencia INTEGER DEFAULT 1;
+-- Último lote que tocó la fila: repetir un upsert ya confirmado (reintento de un trabajo
+-- o de la escritura diferida tras un timeout) no vuelve a sumar 'frecuencia'. Sólo
+-- protege la repetición inmediata: si otro lote con clave tocó la fila entre medias,
+-- la repetición vuelve a contar
+ALTER TABLE public.aria_embeddings ADD COLUMN IF NOT EXISTS lote_id TEXT;
+ALTER TABLE public.aria_knowledge_vectors ADD COLUMN IF NOT EXISTS lote_id TEXT;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_aria_embeddings_contenido ON public.aria_embeddings(categoria, contenido_hash);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_aria_knowledge_vectors_contenido ON public.aria_knowledge_vectors(categoria, contenido_hash);
+
+-- Upsert masivo: 'filas' es el array JSON que enviaría un insert normal (sin repetidos
+-- dentro del mismo array); devuelve tanto las filas nuevas como las existentes actualizadas
+CREATE OR REPLACE FUNCTION public.aria_upsert_embeddings(filas JSONB)
+RETURNS SETOF public.aria_embeddings
+LANGUAGE sql
+AS $$
+    INSERT INTO public.aria_embeddings AS e
+        (texto, embedding, embedding_q, embedding_escala, categoria, subcategoria,
+         fuente, idioma, metadatos, contenido_hash, frecuencia, lote_id)
+    SELECT f.texto, f.embedding, f.embedding_q, f.embedding_escala,
+           COALESCE(f.categoria, 'general'), f.subcategoria, COALESCE(f.fuente, 'conversation'),
+           COALESCE(f.idioma, 'es'), COALESCE(f.metadatos, '{}'::jsonb), f.contenido_hash,
+           COALESCE(f.frecuencia, 1), f.lote_id
+    FROM jsonb_populate_recordset(NULL::public.aria_embeddings, filas) f
+    ON CONFLICT (categoria, contenido_hash) DO UPDATE
+        SET frecuencia = CASE WHEN e.lote_id = EXCLUDED.lote_id THEN e.frecuencia
+                              ELSE e.frecuencia + EXCLUDED.frecuencia END,
+            lote_id = COALESCE(EXCLUDED.lote_id, e.lote_id)
+    RETURNING e.*;
+$$;
+
+CREATE OR REPLACE FUNCTION public.aria_upsert_knowledge(filas JSONB)
+RETURNS SETOF public.aria_knowledge_vectors
+LANGUAGE sql
+AS $$
+    INSERT INTO public.aria_knowledge_vectors AS k
+        (concepto, descripcion, embedding, embedding_q, embedding_escala, categoria, tags,
+         confianza, ejemplos, relaciones, contenido_hash, frecuencia, lote_id)
+    SELECT f.concepto, f.descripcion, f.embedding, f.embedding_q, f.embedding_escala,
+           COALESCE(f.categoria, 'knowledge'), COALESCE(f.tags, '{}'), COALESCE(f.confianza, 0.8),
+           COALESCE(f.ejemplos, '{}'), COALESCE(f.relaciones, '{}'::jsonb), f.contenido_hash,
+           COALESCE(f.frecuencia, 1), f.lote_id
+    FROM jsonb_populate_recordset(NULL::public.aria_knowledge_vectors, filas) f
+    -- El hash es el del concepto: una descripción nueva reemplaza a la anterior (y su vector)
+    ON CONFLICT (categoria, contenido_hash) DO UPDATE
+        SET frecuencia = CASE WHEN k.lote_id = EXCLUDED.lote_id THEN k.frecuencia
+                              ELSE k.frecuencia + EXCLUDED.frecuencia END,
+            lote_id = COALESCE(EXCLUDED.lote_id, k.lote_id),
+            confianza = GREATEST(k.confianza, EXCLUDED.confianza),
+            descripcion = EXCLUDED.descripcion,
+            embedding = EXCLUDED.embedding,
+            embedding_q = EXCLUDED.embedding_q,
+            embedding_escala = EXCLUDED.embedding_escala
+    RETURNING k.*;
+$$;
+
+-- Conteo de filas por categoría mantenido por triggers: /embeddings/stats lee
+-- una fila por categoría en lugar de descargar las tablas (categoría NULL = '')
+CREATE TABLE IF NOT EXISTS public.aria_vector_conteos (
+    tabla VARCHAR(100) NOT NULL,
+    categoria VARCHAR(100) NOT NULL,
+    total BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (tabla, categoria)
+);
+
+-- Los triggers con tablas de transición sólo admiten un evento: el mismo cuerpo
+-- sirve para INSERT, DELETE y UPDATE (en éste sólo cuentan los cambios de categoría)
+CREATE OR REPLACE FUNCTION public.aria_contar_categorias()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO public.aria_vector_conteos AS c (tabla, categoria, total)
+        SELECT TG_TABLE_NAME, COALESCE(categoria, ''), COUNT(*) FROM filas_nuevas GROUP BY 2
+        ON CONFLICT (tabla, categoria) DO UPDATE SET total = c.total + EXCLUDED.total;
+    ELSIF TG_OP = 'DELETE' THEN
+        INSERT INTO public.aria_vector_conteos AS c (tabla, categoria, total)
+        SELECT TG_TABLE_NAME, COALESCE(categoria, ''), -COUNT(*) FROM filas_viejas GROUP BY 2
+        ON CONFLICT (tabla, categoria) DO UPDATE SET total = c.total + EXCLUDED.total;
+    ELSE
+        INSERT INTO public.aria_vector_conteos AS c (tabla, categoria, total)
+        SELECT TG_TABLE_NAME, d.categoria, SUM(d.delta) FROM (
+            SELECT COALESCE(n.categoria, '') AS categoria, 1 AS delta
+            FROM filas_viejas o JOIN filas_nuevas n USING (id)
+            WHERE o.categoria IS DISTINCT FROM n.categoria
+            UNION ALL
+            SELECT COALESCE(o.categoria, ''), -1
+            FROM filas_viejas o JOIN filas_nuevas n USING (id)
+            WHERE o.categoria IS DISTINCT FROM n.categoria
+        ) d GROUP BY d.categoria
+        ON CONFLICT (tabla, categoria) DO UPDATE SET total = c.total + EXCLUDED.total;
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_aria_embeddings_conteo_insert ON public.aria_embeddings;
+CREATE TRIGGER trg_aria_embeddings_conteo_insert AFTER INSERT ON public.aria_embeddings
+    REFERENCING NEW TABLE AS filas_nuevas
+    FOR EACH STATEMENT EXECUTE FUNCTION public.aria_contar_categorias();
+DROP TRIGGER IF EXISTS trg_aria_embeddings_conteo_delete ON public.aria_embeddings;
+CREATE TRIGGER trg_aria_embeddings_conteo_delete AFTER DELETE ON public.aria_embeddings
+    REFERENCING OLD TABLE AS filas_viejas
+    FOR EACH STATEMENT EXECUTE FUNCTION public.aria_contar_categorias();
+DROP TRIGGER IF EXISTS trg_aria_embeddings_conteo_update ON public.aria_embeddings;
+CREATE TRIGGER trg_aria_embeddings_conteo_update AFTER UPDATE ON public.aria_embeddings
+    REFERENCING OLD TABLE AS filas_viejas NEW TABLE AS filas_nuevas
+    FOR EACH STATEMENT EXECUTE FUNCTION public.aria_contar_categorias();
+DROP TRIGGER IF EXISTS trg_aria_knowledge_vectors_conteo_insert ON public.aria_knowledge_vectors;
+CREATE TRIGGER trg_aria_knowledge_vectors_conteo_insert AFTER INSERT ON public.aria_knowledge_vectors
+    REFERENCING NEW TABLE AS filas_nuevas
+    FOR EACH STATEMENT EXECUTE FUNCTION public.aria_contar_categorias();
+DROP TRIGGER IF EXISTS trg_aria_knowledge_vectors_conteo_delete ON public.aria_knowledge_vectors;
+CREATE TRIGGER trg_aria_knowledge_vectors_conteo_delete AFTER DELETE ON public.aria_knowledge_vectors
+    REFERENCING OLD TABLE AS filas_viejas
+    FOR EACH STATEMENT EXECUTE FUNCTION public.aria_contar_categorias();
+DROP TRIGGER IF EXISTS trg_aria_knowledge_vectors_conteo_update ON public.aria_knowledge_vectors;
+CREATE TRIGGER trg_aria_knowledge_vectors_conteo_update AFTER UPDATE ON public.aria_knowledge_vectors
+    REFERENCING OLD TABLE AS filas_viejas NEW TABLE AS filas_nuevas
+    FOR EACH STATEMENT EXECUTE FUNCTION public.aria_contar_categorias();
+
+-- Recuento completo (carga inicial o corrección); bloquea las escrituras mientras cuenta
+CREATE OR REPLACE FUNCTION public.aria_recontar_vectores()
+RETURNS VOID
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    LOCK TABLE public.aria_embeddings, public.aria_knowledge_vectors IN SHARE MODE;
+    DELETE FROM public.aria_vector_conteos;
+    INSERT INTO public.aria_vector_conteos (tabla, categoria, total)
+    SELECT 'aria_embeddings', COALESCE(categoria, ''), COUNT(*) FROM public.aria_embeddings GROUP BY 2
+    UNION ALL
+    SELECT 'aria_knowledge_vectors', COALESCE(categoria, ''), COUNT(*) FROM public.aria_knowledge_vectors GROUP BY 2;
+END;
+$$;
+
+SELECT public.aria_recontar_vectores();
+
 -- Crear índices para mejorar performance
 CREATE INDEX IF NOT EXISTS idx_aria_knowledge_concept ON public.aria_knowledge(concept);
 CREATE INDEX IF NOT EXISTS idx_aria_knowledge_category ON public.aria_knowledge(category);
@@ -72,6 +316,84 @@ CREATE INDEX IF NOT EXISTS idx_aria_conversations_timestamp ON public.aria_conve
 CREATE INDEX IF NOT EXISTS idx_aria_learning_session_id ON public.aria_learning_sessions(session_id);
 CREATE INDEX IF NOT EXISTS idx_aria_apis_name ON public.aria_discovered_apis(api_name);
 
+CREATE INDEX IF NOT EXISTS idx_aria_embeddings_categoria ON public.aria_embeddings(categoria);
+CREATE INDEX IF NOT EXISTS idx_aria_knowledge_vectors_categoria ON public.aria_knowledge_vectors(categoria);
+CREATE INDEX IF NOT EXISTS idx_aria_embeddings_updated_at ON public.aria_embeddings(updated_at);
+CREATE INDEX IF NOT EXISTS idx_aria_knowledge_vectors_updated_at ON public.aria_knowledge_vectors(updated_at);
+CREATE INDEX IF NOT EXISTS idx_aria_vector_lapidas_tabla ON public.aria_vector_lapidas(tabla, id);
+
+-- Los embeddings se guardan normalizados (L2): coseno y producto escalar coinciden.
+-- Migración de filas antiguas desde Python: ARIAEmbeddingsSupabase().migrar_normalizacion(tabla)
+-- o en SQL con pgvector >= 0.7: UPDATE public.aria_embeddings SET embedding = l2_normalize(embedding);
+
+-- Índices vectoriales HNSW (distancia coseno). En pgvector < 0.5 usar ivfflat:
+--   USING ivfflat (embedding vector_cosine_ops) WITH (lists = 100)
+CREATE INDEX IF NOT EXISTS idx_aria_embeddings_hnsw ON public.aria_embeddings
+    USING hnsw (embedding vector_cosine_ops);
+CREATE INDEX IF NOT EXISTS idx_aria_knowledge_vectors_hnsw ON public.aria_knowledge_vectors
+    USING hnsw (embedding vector_cosine_ops);
+
+-- Búsqueda semántica dentro de Postgres: sólo las top-k filas viajan por la red
+-- Uso desde Python: supabase.rpc('match_aria_embeddings', {...}).execute()
+CREATE OR REPLACE FUNCTION public.match_aria_embeddings(
+    query_embedding vector(384),
+    match_threshold FLOAT DEFAULT 0.7,
+    match_count INT DEFAULT 5,
+    filtro_categoria TEXT DEFAULT NULL
+)
+RETURNS TABLE (
+    id BIGINT,
+    texto TEXT,
+    categoria VARCHAR,
+    subcategoria VARCHAR,
+    fuente VARCHAR,
+    idioma VARCHAR,
+    metadatos JSONB,
+    created_at TIMESTAMP WITH TIME ZONE,
+    similitud FLOAT
+)
+LANGUAGE sql STABLE
+AS $$
+    SELECT e.id, e.texto, e.categoria, e.subcategoria, e.fuente, e.idioma,
+           e.metadatos, e.created_at,
+           1 - (e.embedding <=> query_embedding) AS similitud
+    FROM public.aria_embeddings e
+    WHERE (filtro_categoria IS NULL OR e.categoria = filtro_categoria)
+      AND 1 - (e.embedding <=> query_embedding) >= match_threshold
+    ORDER BY e.embedding <=> query_embedding
+    LIMIT match_count;
+$$;
+
+CREATE OR REPLACE FUNCTION public.match_aria_knowledge(
+    query_embedding vector(384),
+    match_threshold FLOAT DEFAULT -1,
+    match_count INT DEFAULT 3,
+    filtro_categoria TEXT DEFAULT NULL
+)
+RETURNS TABLE (
+    id BIGINT,
+    concepto VARCHAR,
+    descripcion TEXT,
+    categoria VARCHAR,
+    tags TEXT[],
+    confianza REAL,
+    ejemplos TEXT[],
+    relaciones JSONB,
+    created_at TIMESTAMP WITH TIME ZONE,
+    similitud FLOAT
+)
+LANGUAGE sql STABLE
+AS $$
+    SELECT k.id, k.concepto, k.descripcion, k.categoria, k.tags, k.confianza,
+           k.ejemplos, k.relaciones, k.created_at,
+           1 - (k.embedding <=> query_embedding) AS similitud
+    FROM public.aria_knowledge_vectors k
+    WHERE (filtro_categoria IS NULL OR k.categoria = filtro_categoria)
+      AND 1 - (k.embedding <=> query_embedding) >= match_threshold
+    ORDER BY k.embedding <=> query_embedding
+    LIMIT match_count;
+$$;
+
 -- Insertar algunos datos de ejemplo
 INSERT INTO public.aria_knowledge (concept, description, category, confidence) VALUES
 ('saludo', 'Forma de iniciar una conversación de manera amigable', 'social', 0.9),
@@ -98,4 +420,12 @@ SELECT 'aria_learning_sessions', COUNT(*) FROM public.aria_learning_sessions
 UNION ALL
 SELECT 'aria_discovered_apis', COUNT(*) FROM public.aria_discovered_apis
 UNION ALL
-SELECT 'aria_concept_relations', COUNT(*) FROM public.aria_concept_relations;
\ No newline at end of file
+SELECT 'aria_concept_relations', COUNT(*) FROM public.aria_concept_relations
+UNION ALL
+SELECT 'aria_embeddings', COUNT(*) FROM public.aria_embeddings
+UNION ALL
+SELECT 'aria_knowledge_vectors', COUNT(*) FROM public.aria_knowledge_vectors
+UNION ALL
+SELECT 'aria_vector_lapidas', COUNT(*) FROM public.aria_vector_lapidas
+UNION ALL
+SELECT 'aria_vector_conteos', COUNT(*) FROM public.aria_vector_conteos;
\ No newline at end of file
@@ -27,11 +27,13 @@ parent_dir = os.path.dirname(current_dir)
 sys.path.insert(0, current_dir)
 sys.path.insert(0, parent_dir)
 
-from flask import Flask, request, jsonify, render_template, send_from_directory
+from flask import Flask, Response, request, jsonify, render_template, send_from_directory
 from flask_cors import CORS
 import json
 import time
 import uuid
+import atexit
+import threading
 from datetime import datetime, timezone
 import logging
 import re
@@ -48,7 +50,9 @@ except ImportError as e:
 
 # Importar sistema de embeddings con Supabase
 try:
-    from core.aria_embeddings_supabase import ARIAEmbeddingsSupabase, crear_embedding_system
+    from core.aria_embeddings_supabase import (
+        ARIAEmbeddingsSupabase, ContextoConsulta, crear_embedding_system, hash_contenido
+    )
     EMBEDDINGS_AVAILABLE = True
     print("🧠 Sistema de embeddings Supabase cargado")
 except ImportError as e:
@@ -109,6 +113,12 @@ except ImportError:
     SPANISH_APIS_AVAILABLE = False
     print("⚠️ APIs en español no disponibles")
 
+from core.aria_pipeline import ARIAPipeline
+from core.aria_job_queue import ARIAJobQueue
+from core.aria_metrics import metricas, DURACION_CHAT
+from core.aria_response_cache import ARIAResponseCache
+from core.aria_knowledge_index import ARIAKnowledgeCache
+
 # Configurar Flask
 app = Flask(__name__, 
            template_folder='../frontend/public',
@@ -128,32 +138,16 @@ class ARIASuperServer:
         self.conversation_count = 0
         self.start_time = datetime.now(timezone.utc)
         
-        # Sistema emocional con Supabase
+        # Sistemas que se cargan en segundo plano (modelo de embeddings, Supabase, caches):
+        # hasta que estén listos se responde sólo con búsqueda por palabras clave
         self.emotion_detector = None
-        self.emotion_system_type = EMOTION_SYSTEM
-        
-        if EMOTION_SYSTEM == "supabase":
-            try:
-                # Obtener API key de EdenAI si está disponible
-                eden_api_key = os.getenv('EDENAI_API_KEY', '')
-                self.emotion_detector = init_emotion_detector_supabase(eden_api_key)
-                print("✅ Sistema emocional Supabase inicializado")
-            except Exception as e:
-                print(f"⚠️ Error inicializando emociones Supabase: {e}")
-                self.emotion_system_type = "basic"
-        elif EMOTION_SYSTEM == "legacy":
-            try:
-                # Usar sistema emocional legacy
-                eden_api_key = os.getenv('EDENAI_API_KEY', '')
-                if eden_api_key:
-                    init_emotion_detector(eden_api_key)
-                print("✅ Sistema emocional legacy inicializado")
-            except Exception as e:
-                print(f"⚠️ Error inicializando emociones legacy: {e}")
-                self.emotion_system_type = "basic"
-        else:
-            self.emotion_system_type = "basic"
-            print("📦 Usando sistema emocional básico")
+        self.emotion_system_type = "basic"
+        self.superbase = None
+        self.embeddings_system = None
+        self.estado_preparacion = 'iniciando'
+        self.error_preparacion = None
+        self.tiempo_preparacion = None
+        self.preparado = threading.Event()
         
         # Sistema de emociones mejorado (mantenido para compatibilidad)
         self.emotions = {
@@ -176,34 +170,127 @@ class ARIASuperServer:
         }
         
         # Cache local para rendimiento - DEBE estar antes de _initialize_superbase()
-        self.knowledge_cache = {}
+        # (indexado por términos: las búsquedas no recorren todos los conceptos)
+        self.knowledge_cache = ARIAKnowledgeCache(capacidad=self._capacidad_cache_conocimiento())
         self.api_cache = {}
         
+        # Etapas de cada mensaje (búsquedas, emociones, APIs, escrituras) en un pool acotado
+        self.pipeline = ARIAPipeline(
+            hilos=int(os.getenv('ARIA_PIPELINE_HILOS', '16')),
+            timeout=float(os.getenv('ARIA_PIPELINE_TIMEOUT_MS', '3000')) / 1000.0,
+            espera_cola=float(os.getenv('ARIA_PIPELINE_COLA_MS', '3000')) / 1000.0
+        )
+        self.timeouts_etapas = self._cargar_timeouts_etapas(os.getenv('ARIA_PIPELINE_TIMEOUTS'))
+        
+        # Trabajo posterior a la respuesta (conversación, aprendizaje, historial emocional)
+        # en una cola persistente: /chat no espera a las escrituras y nada se pierde al caerse
+        self.cola_trabajos = self._crear_cola_trabajos()
+        
+        # Respuestas de mensajes repetidos; las escrituras de conocimiento las invalidan
+        tamano_cache = int(os.getenv('ARIA_CACHE_RESPUESTAS_TAM', '1024'))
+        self.cache_respuestas = ARIAResponseCache(
+            capacidad=tamano_cache,
+            ttl=float(os.getenv('ARIA_CACHE_RESPUESTAS_TTL', '300'))
+        ) if tamano_cache > 0 else None
+        
+        # Indicadores que /metrics calcula en cada lectura
+        metricas.indicador('aria_pipeline_busy_threads', 'Hilos del pool de etapas ocupados',
+                           lambda: self.pipeline.estadisticas()['ocupados'])
+        metricas.indicador('aria_job_queue_pending', 'Trabajos pendientes en la cola persistente',
+                           lambda: self.cola_trabajos.estadisticas()['pendientes'] if self.cola_trabajos else None)
+        metricas.indicador('aria_write_behind_depth', 'Filas pendientes de la escritura diferida de embeddings',
+                           lambda: self.embeddings_system.escritura_diferida.profundidad
+                           if self.embeddings_system and self.embeddings_system.escritura_diferida else None)
+        
+        # Cargar el resto sin bloquear el arranque de Flask
+        # (ARIA_PREPARACION_SINCRONA=1 espera a que termine, útil en scripts)
+        if os.getenv('ARIA_PREPARACION_SINCRONA', '0') == '1':
+            self._preparar_sistemas()
+        else:
+            threading.Thread(target=self._preparar_sistemas, name='aria-preparacion', daemon=True).start()
+        
+        print(f"🚀 ARIA Super Server inicializado - Sesión: {self.session_id[:8]}")
+    
+    def _preparar_sistemas(self):
+        """Inicializar emociones, Super Base, caches y embeddings (hilo de preparación)"""
+        inicio = time.time()
+        self.estado_preparacion = 'calentando'
+        errores = []
+        
+        try:
+            self._inicializar_emociones()
+        except Exception as e:
+            errores.append(f"emociones: {e}")
+        
         # Inicializar Super Base si está disponible
         if SUPERBASE_AVAILABLE:
             self.superbase = aria_superbase
+            self.superbase.observadores_conocimiento.append(self.invalidar_respuestas)
             self._initialize_superbase()
         else:
-            self.superbase = None
             print("📝 Usando almacenamiento en memoria")
         
         # Inicializar sistema de embeddings si está disponible
         if EMBEDDINGS_AVAILABLE:
             try:
-                self.embeddings_system = crear_embedding_system()
-                if self.embeddings_system:
+                embeddings_system = crear_embedding_system()
+                if embeddings_system:
+                    # Encode de prueba y carga de índices: la primera petición real no los paga
+                    embeddings_system.calentar()
+                    # Sólo se publica cuando ya está caliente
+                    self.embeddings_system = embeddings_system
                     print("🧠 Sistema de embeddings Supabase inicializado")
                 else:
                     print("⚠️ No se pudo inicializar sistema de embeddings")
-                    self.embeddings_system = None
+                    errores.append("embeddings: no se pudo crear el sistema")
             except Exception as e:
                 print(f"⚠️ Error inicializando embeddings: {e}")
-                self.embeddings_system = None
+                errores.append(f"embeddings: {e}")
         else:
-            self.embeddings_system = None
             print("📝 Sistema de embeddings no disponible")
         
-        print(f"🚀 ARIA Super Server inicializado - Sesión: {self.session_id[:8]}")
+        # Los trabajos (también los pendientes del arranque anterior) necesitan los sistemas listos
+        if self.cola_trabajos:
+            self.cola_trabajos.iniciar()
+        
+        self.error_preparacion = '; '.join(errores) or None
+        self.tiempo_preparacion = round(time.time() - inicio, 2)
+        self.estado_preparacion = 'degradado' if errores else 'listo'
+        self.preparado.set()
+        print(f"✅ Preparación completada en {self.tiempo_preparacion}s (estado: {self.estado_preparacion})")
+    
+    def _inicializar_emociones(self):
+        """Inicializar el sistema emocional configurado"""
+        emotion_system_type = EMOTION_SYSTEM
+        
+        if EMOTION_SYSTEM == "supabase":
+            try:
+                # Obtener API key de EdenAI si está disponible
+                eden_api_key = os.getenv('EDENAI_API_KEY', '')
+                self.emotion_detector = init_emotion_detector_supabase(eden_api_key)
+                if self.cola_trabajos:
+                    # El historial emocional se escribe desde la cola, no durante la detección
+                    self.emotion_detector.diferir_historial = \
+                        lambda fila: self.cola_trabajos.encolar('historial_emocional', fila)
+                print("✅ Sistema emocional Supabase inicializado")
+            except Exception as e:
+                print(f"⚠️ Error inicializando emociones Supabase: {e}")
+                emotion_system_type = "basic"
+        elif EMOTION_SYSTEM == "legacy":
+            try:
+                # Usar sistema emocional legacy
+                eden_api_key = os.getenv('EDENAI_API_KEY', '')
+                if eden_api_key:
+                    init_emotion_detector(eden_api_key)
+                print("✅ Sistema emocional legacy inicializado")
+            except Exception as e:
+                print(f"⚠️ Error inicializando emociones legacy: {e}")
+                emotion_system_type = "basic"
+        else:
+            emotion_system_type = "basic"
+            print("📦 Usando sistema emocional básico")
+        
+        self.emotion_system_type = emotion_system_type
     
     def _initialize_superbase(self):
         """Inicializar Super Base con datos de sesión"""
@@ -233,6 +320,10 @@ class ARIASuperServer:
         except Exception as e:
             print(f"⚠️ Error inicializando Super Base: {e}")
     
+    def _capacidad_cache_conocimiento(self) -> int:
+        """Conceptos máximos del cache local (0 = sin límite)"""
+        return int(os.getenv('ARIA_CACHE_CONOCIMIENTO_TAM', '10000'))
+    
     def _load_knowledge_cache(self):
         """Cargar conocimiento frecuente en cache"""
         try:
@@ -240,16 +331,56 @@ class ARIASuperServer:
                 return
                 
             # Cargar conceptos más confiables
+            # (se construye aparte y se publica de una vez: las peticiones ya lo están leyendo)
             knowledge = self.superbase.get_knowledge()
+            cache = ARIAKnowledgeCache(capacidad=self._capacidad_cache_conocimiento())
             for item in knowledge[:50]:  # Top 50
                 concept = item.get('concept', '')
-                self.knowledge_cache[concept] = item
+                cache[concept] = item
+            self.knowledge_cache = cache
             
             print(f"📚 Cache cargado con {len(self.knowledge_cache)} conceptos")
             
         except Exception as e:
             print(f"⚠️ Error cargando cache: {e}")
     
+    def _crear_cola_trabajos(self) -> Optional[ARIAJobQueue]:
+        """Abrir la cola de trabajos y registrar sus manejadores (None si está desactivada)"""
+        ruta = os.getenv('ARIA_COLA_RUTA', os.path.join('data', 'aria_trabajos.sqlite'))
+        if not ruta:
+            return None
+        try:
+            cola = ARIAJobQueue(
+                ruta,
+                hilos=int(os.getenv('ARIA_COLA_HILOS', '2')),
+                reintentos=int(os.getenv('ARIA_COLA_REINTENTOS', '5'))
+            )
+        except Exception as e:
+            logger.error(f"❌ Cola de trabajos no disponible ({e}): las escrituras se harán en segundo plano sin persistir")
+            return None
+        
+        cola.registrar('guardar_conversacion', self._trabajo_guardar_conversacion)
+        cola.registrar('embeddings_conversacion', self._trabajo_embeddings_conversacion)
+        cola.registrar('aprender_conceptos', self._trabajo_aprender_conceptos)
+        cola.registrar('historial_emocional', self._trabajo_historial_emocional)
+        atexit.register(cola.cerrar)
+        return cola
+    
+    def _cargar_timeouts_etapas(self, texto: Optional[str]) -> Dict[str, float]:
+        """Timeouts por etapa en segundos desde JSON en milisegundos ({"apis": 2000, ...})"""
+        if not texto:
+            return {}
+        try:
+            return {etapa: float(ms) / 1000.0 for etapa, ms in json.loads(texto).items()}
+        except (ValueError, TypeError, AttributeError) as e:
+            logger.error(f"❌ ARIA_PIPELINE_TIMEOUTS inválido ({e}): se usa el timeout general")
+            return {}
+    
+    def invalidar_respuestas(self):
+        """Dejar de servir las respuestas cacheadas (el conocimiento cambió)"""
+        if self.cache_respuestas:
+            self.cache_respuestas.invalidar()
+    
     def process_message(self, user_message: str, context: Dict = None) -> Dict[str, Any]:
         """Procesar mensaje del usuario con integración Super Base"""
         start_time = time.time()
@@ -259,40 +390,89 @@ class ARIASuperServer:
             # Detectar idioma
             language = self._detect_language(user_message)
             
-            # Buscar conocimiento relevante
-            relevant_knowledge = self._search_knowledge(user_message)
-            
-            # Generar respuesta inteligente
-            response_data = self._generate_intelligent_response(
-                user_message, relevant_knowledge, language
-            )
-            
-            # Actualizar emociones
-            self._update_emotions(user_message, response_data)
-            
-            # Almacenar conversación en Super Base
-            if self.superbase:
-                self._store_conversation(user_message, response_data)
-            
-            # Aprender de la conversación
-            self._learn_from_conversation(user_message, response_data)
-            
-            # Preparar respuesta completa
-            response_time = time.time() - start_time
-            
-            final_response = {
+            # Un message_id del cliente evita duplicar las escrituras si reintenta el mismo mensaje
+            mensaje_id = (context or {}).get('message_id') or uuid.uuid4().hex
+            
+            # Mensaje repetido: se reutiliza la respuesta y sólo se recalculan los campos volátiles
+            if self.cache_respuestas:
+                version_cache = self.cache_respuestas.version
+                cacheada = self.cache_respuestas.obtener(user_message, language)
+                if cacheada is not None:
+                    return self._responder_desde_cache(user_message, cacheada, mensaje_id, start_time)
+            
+            # Grafo de etapas: las esperas de red independientes (embeddings, Super Base,
+            # APIs españolas, EdenAI) corren a la vez y cada una tiene su timeout
+            timeout = self.timeouts_etapas.get
+            plan = self.pipeline.plan()
+            
+            # Codificar el mensaje una sola vez para todas las búsquedas de la petición
+            plan.etapa('contexto',
+                       lambda: self.embeddings_system.crear_contexto(user_message) if self.embeddings_system else None,
+                       timeout=timeout('contexto'))
+            plan.etapa('embeddings', lambda contexto: self._buscar_en_embeddings(user_message, contexto),
+                       depende=('contexto',), timeout=timeout('embeddings'), defecto=[])
+            plan.etapa('cache', lambda: self._buscar_en_cache(user_message),
+                       timeout=timeout('cache'), defecto=[])
+            # Super Base se consulta siempre en paralelo; sólo se usa si faltan resultados
+            plan.etapa('superbase', lambda: self._buscar_en_superbase(user_message),
+                       timeout=timeout('superbase'), defecto=[])
+            plan.etapa('apis', lambda: self._consultar_apis_espanolas(user_message, language),
+                       timeout=timeout('apis'), defecto={})
+            plan.etapa('emocion_usuario', lambda: self._detectar_emocion(user_message, usuario=True),
+                       timeout=timeout('emocion_usuario'))
+            plan.etapa('sugerencias', lambda: self._get_suggested_topics(user_message),
+                       timeout=timeout('sugerencias'), fabrica_defecto=lambda: self._sugerencias_generales()[:3])
+            
+            plan.etapa('conocimiento',
+                       lambda embeddings, cache, superbase: self._combinar_conocimiento(
+                           user_message, embeddings, cache, superbase),
+                       depende=('embeddings', 'cache', 'superbase'), timeout=timeout('conocimiento'), defecto=[])
+            plan.etapa('respuesta',
+                       lambda knowledge, contexto, apis: self._generate_intelligent_response(
+                           user_message, knowledge, language, contexto, resultado_apis=apis),
+                       depende=('conocimiento', 'contexto', 'apis'), timeout=timeout('respuesta'),
+                       fabrica_defecto=lambda: self._create_friendly_general_response(user_message, language))
+            plan.etapa('emocion_aria',
+                       lambda response_data: self._detectar_emocion(response_data.get('response', ''), usuario=False),
+                       depende=('respuesta',), timeout=timeout('emocion_aria'))
+            plan.etapa('emociones',
+                       lambda response_data, user_emotion, aria_emotion: self._aplicar_emociones(
+                           user_message, response_data, user_emotion, aria_emotion),
+                       depende=('respuesta', 'emocion_usuario', 'emocion_aria'), timeout=timeout('emociones'))
+            
+            resultados = plan.ejecutar()
+            relevant_knowledge = resultados['conocimiento']
+            response_data = resultados['respuesta']
+            
+            # Escrituras a la cola: la respuesta no espera a Super Base ni a embeddings
+            self._encolar_post_respuesta(user_message, response_data, mensaje_id)
+            
+            # Campos que dependen sólo del mensaje y del conocimiento (los que se cachean)
+            estables = {
                 'response': response_data['response'],
-                'emotion': self.current_emotion,
                 'confidence': response_data.get('confidence', 0.8),
                 'knowledge_used': relevant_knowledge[:3],  # Top 3
                 'apis_called': response_data.get('apis_used', []),
                 'language_detected': language,
-                'response_time': round(response_time, 3),
-                'conversation_count': self.conversation_count,
-                'session_id': self.session_id[:8],
-                'superbase_enabled': self.superbase is not None,
                 'learning_insights': response_data.get('learning_insights', []),
-                'suggested_topics': self._get_suggested_topics(user_message)
+                'suggested_topics': resultados['sugerencias']
+            }
+            informe = plan.informe()
+            
+            # Sólo se cachean respuestas completas: sin etapas caducadas ni sistemas a medio cargar
+            if self.cache_respuestas and self.preparado.is_set() and not informe['timed_out'] and not informe['failed']:
+                self.cache_respuestas.guardar(user_message, language, {
+                    'estables': estables,
+                    'response_data': {k: response_data.get(k) for k in ('response', 'confidence', 'knowledge_sources', 'apis_used')}
+                }, version_cache)
+            
+            # Preparar respuesta completa
+            final_response = {
+                **estables,
+                **self._campos_volatiles(start_time),
+                'cached': False,
+                # Etapas que no llegaron a tiempo: la respuesta se armó sin ellas
+                'pipeline': informe
             }
             
             return final_response
@@ -301,6 +481,34 @@ class ARIASuperServer:
             logger.error(f"Error procesando mensaje: {e}")
             return self._create_error_response(str(e))
     
+    def _responder_desde_cache(self, user_message: str, cacheada: Dict, mensaje_id: str,
+                               start_time: float) -> Dict[str, Any]:
+        """Respuesta cacheada con emoción, contadores y tiempos recalculados"""
+        response_data = dict(cacheada['response_data'])
+        
+        # Emoción con el detector local: un acierto no llama a EdenAI
+        self._update_emotions_fallback(user_message, response_data)
+        
+        # La conversación se registra igual que en un fallo del cache
+        self._encolar_post_respuesta(user_message, response_data, mensaje_id)
+        
+        return {**cacheada['estables'], **self._campos_volatiles(start_time), 'cached': True}
+    
+    def _campos_volatiles(self, start_time: float) -> Dict[str, Any]:
+        """Campos de la respuesta que cambian en cada petición (nunca se cachean)"""
+        response_time = time.time() - start_time
+        DURACION_CHAT.observar(response_time)
+        return {
+            'emotion': self.current_emotion,
+            'response_time': round(response_time, 3),
+            'conversation_count': self.conversation_count,
+            'session_id': self.session_id[:8],
+            'superbase_enabled': self.superbase is not None,
+            # Mientras el modelo se calienta sólo hay búsqueda por palabras clave
+            'degraded': self.embeddings_system is None and self.estado_preparacion != 'listo',
+            'readiness': self.estado_preparacion
+        }
+    
     def _detect_language(self, text: str) -> str:
         """Detectar idioma del texto"""
         # Palabras comunes en español
@@ -319,79 +527,93 @@ class ARIASuperServer:
         else:
             return 'auto'
     
-    def _search_knowledge(self, query: str) -> List[Dict]:
-        """Buscar conocimiento relevante usando embeddings y búsqueda tradicional"""
+    def _buscar_en_embeddings(self, query: str, contexto: 'ContextoConsulta' = None) -> List[Dict]:
+        """Textos similares y conocimiento estructurado desde los índices de embeddings"""
         relevant_knowledge = []
+        if not self.embeddings_system:
+            return relevant_knowledge
         
         try:
-            # 1. Buscar usando embeddings si está disponible
-            if self.embeddings_system:
-                try:
-                    # Buscar textos similares con embeddings
-                    embedding_results = self.embeddings_system.buscar_similares(
-                        query, limite=5, umbral_similitud=0.6
-                    )
-                    
-                    for result in embedding_results:
-                        knowledge_item = {
-                            'concept': result['texto'][:50] + '...' if len(result['texto']) > 50 else result['texto'],
-                            'description': result['texto'],
-                            'confidence': result['similitud'],
-                            'source': f"embeddings_{result['categoria']}",
-                            'category': result['categoria'],
-                            'metadata': result.get('metadatos', {})
-                        }
-                        relevant_knowledge.append(knowledge_item)
-                    
-                    # Buscar conocimiento estructurado
-                    knowledge_results = self.embeddings_system.buscar_conocimiento(query, limite=3)
-                    
-                    for result in knowledge_results:
-                        knowledge_item = {
-                            'concept': result['concepto'],
-                            'description': result['descripcion'],
-                            'confidence': result['similitud'],
-                            'source': 'knowledge_vectors',
-                            'category': result['categoria'],
-                            'tags': result.get('tags', [])
-                        }
-                        relevant_knowledge.append(knowledge_item)
-                        
-                    logger.info(f"🧠 Embeddings encontró {len(embedding_results + knowledge_results)} resultados")
-                    
-                except Exception as e:
-                    logger.error(f"Error en búsqueda con embeddings: {e}")
-            
-            # 2. Buscar en cache local (búsqueda tradicional)
-            for concept, data in self.knowledge_cache.items():
-                if any(word.lower() in concept.lower() or word.lower() in data.get('description', '').lower() 
-                       for word in query.split()):
-                    if data not in relevant_knowledge:  # Evitar duplicados
-                        relevant_knowledge.append(data)
+            # Buscar textos similares con embeddings
+            embedding_results = self.embeddings_system.buscar_similares(
+                query, limite=5, umbral_similitud=0.6, contexto=contexto,
+                campos=('texto', 'categoria')
+            )
             
-            # 3. Buscar en Super Base si está disponible y necesitamos más resultados
-            if self.superbase and len(relevant_knowledge) < 5:
-                try:
-                    superbase_results = self.superbase.search_knowledge(query)
-                    for result in superbase_results[:3]:
-                        # Verificar que no esté duplicado
-                        if not any(r.get('concept') == result.get('concept') for r in relevant_knowledge):
-                            relevant_knowledge.append(result)
-                except Exception as e:
-                    logger.error(f"Error en búsqueda SuperBase: {e}")
+            for result in embedding_results:
+                knowledge_item = {
+                    'concept': result['texto'][:50] + '...' if len(result['texto']) > 50 else result['texto'],
+                    'description': result['texto'],
+                    'confidence': result['similitud'],
+                    'source': f"embeddings_{result['categoria']}",
+                    'category': result['categoria']
+                }
+                relevant_knowledge.append(knowledge_item)
             
-            # Ordenar por confianza/similitud
-            relevant_knowledge.sort(key=lambda x: x.get('confidence', 0), reverse=True)
+            # Buscar conocimiento estructurado
+            knowledge_results = self.embeddings_system.buscar_conocimiento(
+                query, limite=3, contexto=contexto,
+                campos=('concepto', 'descripcion', 'categoria', 'tags')
+            )
             
-            logger.info(f"🔍 Búsqueda de conocimiento: {len(relevant_knowledge)} resultados para '{query}'")
+            for result in knowledge_results:
+                knowledge_item = {
+                    'concept': result['concepto'],
+                    'description': result['descripcion'],
+                    'confidence': result['similitud'],
+                    'source': 'knowledge_vectors',
+                    'category': result['categoria'],
+                    'tags': result.get('tags', [])
+                }
+                relevant_knowledge.append(knowledge_item)
+                
+            logger.info(f"🧠 Embeddings encontró {len(embedding_results + knowledge_results)} resultados")
             
         except Exception as e:
-            logger.error(f"Error buscando conocimiento: {e}")
+            logger.error(f"Error en búsqueda con embeddings: {e}")
+        
+        return relevant_knowledge
+    
+    def _buscar_en_cache(self, query: str) -> List[Dict]:
+        """Conceptos del cache local que contienen alguna palabra (o prefijo) de la consulta"""
+        return self.knowledge_cache.buscar(query)
+    
+    def _buscar_en_superbase(self, query: str) -> List[Dict]:
+        """Búsqueda de conocimiento en Super Base (hasta 3 resultados)"""
+        if not self.superbase:
+            return []
+        try:
+            return self.superbase.search_knowledge(query)[:3]
+        except Exception as e:
+            logger.error(f"Error en búsqueda SuperBase: {e}")
+            return []
+    
+    def _combinar_conocimiento(self, query: str, embeddings: List[Dict], cache: List[Dict],
+                               superbase: List[Dict]) -> List[Dict]:
+        """Unir los resultados de cada fuente sin duplicados y quedarse con los 7 mejores"""
+        relevant_knowledge = list(embeddings)
+        for data in cache:
+            if data not in relevant_knowledge:  # Evitar duplicados
+                relevant_knowledge.append(data)
+        
+        # Super Base sólo completa cuando las fuentes locales dan menos de 5 resultados
+        if len(relevant_knowledge) < 5:
+            for result in superbase:
+                # Verificar que no esté duplicado
+                if not any(r.get('concept') == result.get('concept') for r in relevant_knowledge):
+                    relevant_knowledge.append(result)
+        
+        # Ordenar por confianza/similitud
+        relevant_knowledge.sort(key=lambda x: x.get('confidence', 0), reverse=True)
+        
+        logger.info(f"🔍 Búsqueda de conocimiento: {len(relevant_knowledge)} resultados para '{query}'")
         
         return relevant_knowledge[:7]  # Top 7 resultados
     
-    def _generate_intelligent_response(self, user_message: str, knowledge: List[Dict], language: str) -> Dict[str, Any]:
-        """Generar respuesta inteligente basada en conocimiento"""
+    def _generate_intelligent_response(self, user_message: str, knowledge: List[Dict], language: str,
+                                       contexto: 'ContextoConsulta' = None,
+                                       resultado_apis: Optional[Dict] = None) -> Dict[str, Any]:
+        """Generar respuesta inteligente basada en conocimiento (resultado_apis: consulta ya hecha)"""
         response_data = {
             'response': '',
             'confidence': 0.5,
@@ -406,7 +628,7 @@ class ARIASuperServer:
             
             # 🧠 BUSCAR RESPUESTA DIRECTA EN EMBEDDINGS PRIMERO
             if self.embeddings_system:
-                respuesta_directa = self._buscar_respuesta_directa(user_message)
+                respuesta_directa = self._buscar_respuesta_directa(user_message, contexto)
                 if respuesta_directa:
                     response_data.update(respuesta_directa)
                     return response_data
@@ -426,7 +648,7 @@ class ARIASuperServer:
             
             # Mejorar respuesta con APIs españolas si están disponibles
             if SPANISH_APIS_AVAILABLE and language == 'es':
-                enhanced_response = self._enhance_with_spanish_apis(user_message, response_data)
+                enhanced_response = self._enhance_with_spanish_apis(user_message, response_data, resultado_apis)
                 if enhanced_response:
                     response_data.update(enhanced_response)
             
@@ -440,11 +662,13 @@ class ARIASuperServer:
         
         return response_data
     
-    def _buscar_respuesta_directa(self, user_message: str) -> Dict[str, Any]:
+    def _buscar_respuesta_directa(self, user_message: str, contexto: 'ContextoConsulta' = None) -> Dict[str, Any]:
         """Buscar respuesta directa usando embeddings para mensajes comunes"""
         try:
             # Buscar conocimiento específico que tenga respuesta sugerida
-            conocimiento_results = self.embeddings_system.buscar_conocimiento(user_message, limite=1)
+            conocimiento_results = self.embeddings_system.buscar_conocimiento(
+                user_message, limite=1, contexto=contexto, campos=('concepto', 'relaciones')
+            )
             
             for result in conocimiento_results:
                 relaciones = result.get('relaciones', {})
@@ -465,7 +689,9 @@ class ARIASuperServer:
                 user_message, 
                 limite=1, 
                 categoria='conversacion_ejemplo',
-                umbral_similitud=0.75
+                umbral_similitud=0.75,
+                contexto=contexto,
+                campos=('subcategoria', 'metadatos')
             )
             
             for result in conversacion_results:
@@ -478,7 +704,8 @@ class ARIASuperServer:
                     respuesta_results = self.embeddings_system.buscar_similares(
                         categoria_conv,
                         limite=1,
-                        categoria='conversacion_ejemplo'
+                        categoria='conversacion_ejemplo',
+                        campos=('texto', 'subcategoria', 'metadatos')
                     )
                     
                     for resp in respuesta_results:
@@ -659,14 +886,22 @@ class ARIASuperServer:
             'learning_opportunity': True
         }
     
-    def _enhance_with_spanish_apis(self, user_message: str, response_data: Dict) -> Dict[str, Any]:
-        """Mejorar respuesta con APIs en español"""
+    def _consultar_apis_espanolas(self, user_message: str, language: str) -> Dict:
+        """Consulta a las APIs españolas (vacía si no aplica al mensaje)"""
+        if not SPANISH_APIS_AVAILABLE or language != 'es':
+            return {}
+        return aria_spanish_apis.search_comprehensive(user_message) or {}
+    
+    def _enhance_with_spanish_apis(self, user_message: str, response_data: Dict,
+                                   api_result: Optional[Dict] = None) -> Dict[str, Any]:
+        """Mejorar respuesta con APIs en español (api_result=None consulta en el momento)"""
         enhancement = {'apis_used': []}
         
         try:
             if SPANISH_APIS_AVAILABLE:
                 # Intentar usar APIs españolas para mejorar la respuesta
-                api_result = aria_spanish_apis.search_comprehensive(user_message)
+                if api_result is None:
+                    api_result = aria_spanish_apis.search_comprehensive(user_message)
                 if api_result and api_result.get('success'):
                     enhancement['apis_used'].append('spanish_knowledge_api')
                     # Agregar información adicional si está disponible
@@ -700,63 +935,57 @@ class ARIASuperServer:
         
         return insights
     
-    def _update_emotions(self, user_message: str, response_data: Dict):
-        """Actualizar estado emocional de ARIA usando Supabase"""
+    def _detectar_emocion(self, texto: str, usuario: bool) -> Optional[Dict]:
+        """Emoción del mensaje del usuario o de la respuesta de ARIA (None con el sistema básico)"""
+        if self.emotion_system_type == "supabase":
+            return detect_user_emotion_supabase(texto) if usuario else detect_aria_emotion_supabase(texto)
+        if self.emotion_system_type == "legacy":
+            return detect_user_emotion(texto) if usuario else detect_aria_emotion(texto)
+        return None
+    
+    def _aplicar_emociones(self, user_message: str, response_data: Dict,
+                           user_emotion: Optional[Dict], aria_emotion: Optional[Dict]) -> str:
+        """Actualizar el estado emocional con las detecciones que hayan llegado"""
+        if user_emotion is None and aria_emotion is None:
+            # Sistema básico, o las dos detecciones fallaron o caducaron
+            self._update_emotions_fallback(user_message, response_data)
+            return self.current_emotion
+        
+        user_emotion = user_emotion or {}
+        aria_emotion = aria_emotion or {}
         
         if self.emotion_system_type == "supabase":
-            try:
-                # Detectar emoción del usuario
-                user_emotion = detect_user_emotion_supabase(user_message)
-                
-                # Detectar emoción de la respuesta de ARIA
-                aria_response = response_data.get('response', '')
-                aria_emotion = detect_aria_emotion_supabase(aria_response)
-                
-                # Actualizar estado emocional con datos de Supabase
-                if user_emotion.get('success'):
-                    self.current_emotion = user_emotion.get('emotion', 'neutral')
-                    
-                    # Almacenar información emocional en response_data
-                    response_data['user_emotion'] = {
-                        'emotion': user_emotion.get('emotion'),
-                        'name': user_emotion.get('emotion_name'),
-                        'color': user_emotion.get('color'),
-                        'confidence': user_emotion.get('confidence')
-                    }
-                
-                if aria_emotion.get('success'):
-                    response_data['aria_emotion'] = {
-                        'emotion': aria_emotion.get('emotion'),
-                        'name': aria_emotion.get('emotion_name'),
-                        'color': aria_emotion.get('color'),
-                        'confidence': aria_emotion.get('confidence')
-                    }
-                
-                print(f"🎭 Emociones detectadas - Usuario: {user_emotion.get('emotion_name', 'N/A')}, ARIA: {aria_emotion.get('emotion_name', 'N/A')}")
-                
-            except Exception as e:
-                print(f"⚠️ Error en detección emocional Supabase: {e}")
-                self._update_emotions_fallback(user_message, response_data)
-                
-        elif self.emotion_system_type == "legacy":
-            try:
-                # Usar sistema emocional legacy
-                user_emotion = detect_user_emotion(user_message)
-                aria_emotion = detect_aria_emotion(response_data.get('response', ''))
-                
-                if user_emotion.get('success'):
-                    self.current_emotion = user_emotion.get('emotion', 'neutral')
-                    response_data['user_emotion'] = user_emotion
+            # Actualizar estado emocional con datos de Supabase
+            if user_emotion.get('success'):
+                self.current_emotion = user_emotion.get('emotion', 'neutral')
                 
-                if aria_emotion.get('success'):
-                    response_data['aria_emotion'] = aria_emotion
-                    
-            except Exception as e:
-                print(f"⚠️ Error en detección emocional legacy: {e}")
-                self._update_emotions_fallback(user_message, response_data)
+                # Almacenar información emocional en response_data
+                response_data['user_emotion'] = {
+                    'emotion': user_emotion.get('emotion'),
+                    'name': user_emotion.get('emotion_name'),
+                    'color': user_emotion.get('color'),
+                    'confidence': user_emotion.get('confidence')
+                }
+            
+            if aria_emotion.get('success'):
+                response_data['aria_emotion'] = {
+                    'emotion': aria_emotion.get('emotion'),
+                    'name': aria_emotion.get('emotion_name'),
+                    'color': aria_emotion.get('color'),
+                    'confidence': aria_emotion.get('confidence')
+                }
+            
+            print(f"🎭 Emociones detectadas - Usuario: {user_emotion.get('emotion_name', 'N/A')}, ARIA: {aria_emotion.get('emotion_name', 'N/A')}")
         else:
-            # Sistema básico
-            self._update_emotions_fallback(user_message, response_data)
+            # Sistema emocional legacy
+            if user_emotion.get('success'):
+                self.current_emotion = user_emotion.get('emotion', 'neutral')
+                response_data['user_emotion'] = user_emotion
+            
+            if aria_emotion.get('success'):
+                response_data['aria_emotion'] = aria_emotion
+        
+        return self.current_emotion
     
     def _update_emotions_fallback(self, user_message: str, response_data: Dict):
         """Sistema emocional básico como fallback"""
@@ -796,132 +1025,215 @@ class ARIASuperServer:
         else:
             return 'neutral'
     
-    def _store_conversation(self, user_message: str, response_data: Dict):
-        """Almacenar conversación en Super Base"""
-        try:
-            if not self.superbase:
-                return
-            
-            conversation_data = {
+    def _encolar_post_respuesta(self, user_message: str, response_data: Dict, mensaje_id: str):
+        """Persistir los trabajos posteriores a la respuesta (o lanzarlos en segundo plano sin cola)"""
+        trabajos = {
+            'embeddings_conversacion': {
+                'mensaje_id': mensaje_id,
                 'user_message': user_message,
-                'aria_response': response_data['response'],
-                'emotion_state': self.current_emotion,
+                'response': response_data.get('response', ''),
                 'confidence': response_data.get('confidence', 0.5),
+                'knowledge_sources': response_data.get('knowledge_sources', 0),
                 'apis_used': response_data.get('apis_used', []),
-                'knowledge_accessed': response_data.get('concepts_used', []),
+                'emotion': self.current_emotion,
                 'session_id': self.session_id,
-                'language': response_data.get('language', 'es'),
-                'response_time': response_data.get('response_time', 0)
+                'conversation_count': self.conversation_count,
+                'timestamp': datetime.now(timezone.utc).isoformat()
+            },
+            'aprender_conceptos': {
+                'mensaje_id': mensaje_id,
+                'user_message': user_message,
+                'emotion': self.current_emotion,
+                'session_id': self.session_id
             }
-            
-            self.superbase.store_conversation(**conversation_data)
-            
-        except Exception as e:
-            logger.error(f"Error almacenando conversación: {e}")
-    
-    def _learn_from_conversation(self, user_message: str, response_data: Dict):
-        """Aprender de la conversación actual y almacenar en embeddings"""
-        try:
-            # Extraer conceptos clave del mensaje del usuario
-            key_concepts = self._extract_key_concepts(user_message)
-            
-            # Almacenar conversación completa en embeddings si está disponible
-            if self.embeddings_system:
+        }
+        if self.superbase:
+            trabajos['guardar_conversacion'] = self._datos_conversacion(user_message, response_data, mensaje_id)
+        
+        for tipo, payload in trabajos.items():
+            if self.cola_trabajos:
                 try:
-                    # Almacenar mensaje del usuario
-                    self.embeddings_system.agregar_texto(
-                        texto=user_message,
-                        categoria='conversation',
-                        subcategoria='user_message',
-                        fuente='chat_interaction',
-                        metadatos={
-                            'session_id': self.session_id,
-                            'conversation_count': self.conversation_count,
-                            'emotion': self.current_emotion,
-                            'timestamp': datetime.now(timezone.utc).isoformat()
-                        }
-                    )
-                    
-                    # Almacenar respuesta de ARIA
-                    self.embeddings_system.agregar_texto(
-                        texto=response_data.get('response', ''),
-                        categoria='conversation',
-                        subcategoria='aria_response',
-                        fuente='aria_generation',
-                        metadatos={
-                            'session_id': self.session_id,
-                            'confidence': response_data.get('confidence', 0.5),
-                            'knowledge_used': len(response_data.get('knowledge_sources', 0)),
-                            'apis_used': response_data.get('apis_used', [])
-                        }
-                    )
-                    
-                    logger.info("💾 Conversación almacenada en embeddings")
-                    
+                    self.cola_trabajos.encolar(tipo, payload, clave=f"{tipo}:{mensaje_id}")
+                    continue
                 except Exception as e:
-                    logger.error(f"Error almacenando conversación en embeddings: {e}")
-            
-            # Almacenar conceptos nuevos como conocimiento estructurado (EXCLUYENDO SALUDOS BÁSICOS)
-            saludos_basicos = {'hola', 'hello', 'hi', 'hey', 'buenos', 'días', 'tardes', 'noches', 'buen', 'día', 'gracias', 'thanks', 'bye', 'adiós', 'chao'}
+                    logger.error(f"❌ No se pudo encolar {tipo} ({e}): se ejecuta en segundo plano")
+            manejador = getattr(self, f"_trabajo_{tipo}")
+            self.pipeline.en_segundo_plano(tipo, manejador, payload)
+    
+    def _datos_conversacion(self, user_message: str, response_data: Dict, mensaje_id: str) -> Dict[str, Any]:
+        """Argumentos de store_conversation para un turno"""
+        return {
+            'message_id': mensaje_id,
+            'user_message': user_message,
+            'aria_response': response_data['response'],
+            'emotion_state': self.current_emotion,
+            'confidence': response_data.get('confidence', 0.5),
+            'apis_used': response_data.get('apis_used', []),
+            'session_id': self.session_id
+        }
+    
+    # ==================== TRABAJOS DE LA COLA ====================
+    # Se ejecutan al menos una vez: lanzan excepción para que la cola reintente
+    # y repetirlos no duplica filas (upserts por message_id / concepto y
+    # deduplicación por contenido_hash). Los inserts de embeddings llevan la clave
+    # del trabajo como clave de lote: repetir uno ya confirmado no vuelve a sumar
+    # 'frecuencia' (salvo que otro lote haya tocado la fila entre medias). Con Supabase
+    # conectado no se recurre al almacenamiento en memoria: un fallo se reintenta.
+    
+    def _supabase_conectado(self) -> bool:
+        """True si Super Base escribe en Supabase (y no en su fallback en memoria)"""
+        return self.superbase is not None and getattr(self.superbase, 'connected', False)
+    
+    def _trabajo_guardar_conversacion(self, datos: Dict):
+        """Almacenar un turno en aria_conversations (upsert por message_id)"""
+        if self.superbase:
+            self.superbase.store_conversation(**datos, lanzar=self._supabase_conectado())
+    
+    def _sistema_embeddings_trabajo(self):
+        """
+        Sistema de embeddings para un trabajo de la cola
+        
+        None si el módulo no está instalado (nunca habrá dónde escribir); si está
+        instalado pero el sistema no se pudo crear, lanza para que el trabajo se
+        reintente (o quede en fallidos para reintentar_fallidos) en vez de perderse.
+        """
+        if not EMBEDDINGS_AVAILABLE:
+            return None
+        if self.embeddings_system is None:
+            raise RuntimeError(f"sistema de embeddings no disponible (estado: {self.estado_preparacion})")
+        return self.embeddings_system
+    
+    def _clave_lote(self, datos: Dict, tipo: str) -> Optional[str]:
+        """Clave del trabajo como clave de lote (None en trabajos encolados sin mensaje_id)"""
+        return f"{tipo}:{datos['mensaje_id']}" if datos.get('mensaje_id') else None
+    
+    def _filas_distintas(self, elementos: List[Dict], campo: str) -> int:
+        """
+        Filas que debe devolver el upsert de un lote: los elementos con el mismo
+        (categoria, contenido_hash) se unen en una sola ("hola" / "Hola")
+        """
+        return len({(e.get('categoria'), hash_contenido(e[campo])) for e in elementos if e.get(campo)})
+    
+    def _trabajo_embeddings_conversacion(self, datos: Dict):
+        """Almacenar mensaje del usuario y respuesta de ARIA en embeddings en un solo lote"""
+        embeddings_system = self._sistema_embeddings_trabajo()
+        if embeddings_system is None:
+            return
+        
+        textos = [
+            {
+                'texto': datos['user_message'],
+                'categoria': 'conversation',
+                'subcategoria': 'user_message',
+                'fuente': 'chat_interaction',
+                'metadatos': {
+                    'session_id': datos['session_id'],
+                    'conversation_count': datos['conversation_count'],
+                    'emotion': datos['emotion'],
+                    'timestamp': datos['timestamp']
+                }
+            },
+            {
+                'texto': datos['response'],
+                'categoria': 'conversation',
+                'subcategoria': 'aria_response',
+                'fuente': 'aria_generation',
+                'metadatos': {
+                    'session_id': datos['session_id'],
+                    'confidence': datos['confidence'],
+                    'knowledge_used': datos['knowledge_sources'],
+                    'apis_used': datos['apis_used']
+                }
+            }
+        ]
+        esperados = self._filas_distintas(textos, 'texto')
+        # Sin escritura diferida: la cola ya reintenta y tiene que saber si el insert falló
+        agregados = embeddings_system.agregar_textos_lote(
+            textos, diferir=False, clave_lote=self._clave_lote(datos, 'embeddings_conversacion')
+        )
+        if agregados < esperados:
+            raise RuntimeError(f"sólo {agregados}/{esperados} textos de la conversación almacenados")
+        
+        logger.info("💾 Conversación almacenada en embeddings")
+    
+    def _trabajo_aprender_conceptos(self, datos: Dict):
+        """Almacenar los conceptos nuevos del mensaje como conocimiento estructurado"""
+        user_message = datos['user_message']
+        session_id = datos['session_id']
+        embeddings_system = self._sistema_embeddings_trabajo()
+        
+        # Extraer conceptos clave del mensaje del usuario
+        key_concepts = self._extract_key_concepts(user_message)
+        
+        # Almacenar conceptos nuevos como conocimiento estructurado (EXCLUYENDO SALUDOS BÁSICOS)
+        saludos_basicos = {'hola', 'hello', 'hi', 'hey', 'buenos', 'días', 'tardes', 'noches', 'buen', 'día', 'gracias', 'thanks', 'bye', 'adiós', 'chao'}
+        nuevos_conocimientos = []
+        
+        for concept in key_concepts:
+            # FILTRAR saludos básicos para evitar almacenarlos como "conceptos técnicos"
+            if concept.lower() in saludos_basicos:
+                logger.info(f"🚫 Saludo básico '{concept}' no almacenado como concepto técnico")
+                continue
             
-            for concept in key_concepts:
-                # FILTRAR saludos básicos para evitar almacenarlos como "conceptos técnicos"
-                if concept.lower() in saludos_basicos:
-                    logger.info(f"🚫 Saludo básico '{concept}' no almacenado como concepto técnico")
-                    continue
-                    
-                if concept not in self.knowledge_cache:
-                    
-                    # Almacenar en cache local
-                    self.knowledge_cache[concept] = {
-                        'concept': concept,
-                        'description': f"Concepto mencionado en conversación: {user_message[:100]}",
-                        'category': 'conversational',
-                        'source': 'user_interaction',
-                        'confidence': 0.4
-                    }
-                    
-                    # Almacenar en SuperBase tradicional
-                    if self.superbase:
-                        try:
-                            self.superbase.store_knowledge(
-                                concept=concept,
-                                description=f"Concepto mencionado en conversación: {user_message[:100]}",
-                                category='conversational',
-                                source='user_interaction',
-                                confidence=0.4
-                            )
-                        except Exception as e:
-                            logger.error(f"Error almacenando en SuperBase: {e}")
-                    
-                    # Almacenar en embeddings como conocimiento estructurado
-                    if self.embeddings_system:
-                        try:
-                            descripcion_extendida = f"Concepto '{concept}' extraído de la conversación: '{user_message}'. Contexto: Mencionado durante interacción del usuario en sesión {self.session_id[:8]}"
-                            
-                            self.embeddings_system.agregar_conocimiento(
-                                concepto=concept,
-                                descripcion=descripcion_extendida,
-                                categoria='conversational_learning',
-                                tags=['user_mentioned', 'auto_extracted', self.current_emotion],
-                                confianza=0.4,
-                                ejemplos=[user_message[:100]],
-                                relaciones={
-                                    'session_id': self.session_id,
-                                    'conversation_context': user_message[:50],
-                                    'related_concepts': key_concepts[:3]
-                                }
-                            )
-                            
-                            logger.info(f"🧠 Concepto '{concept}' agregado a embeddings")
-                            
-                        except Exception as e:
-                            logger.error(f"Error agregando concepto a embeddings: {e}")
-            
-            logger.info(f"📚 Aprendizaje completado: {len(key_concepts)} conceptos procesados")
+            if concept in self.knowledge_cache:
+                continue
             
-        except Exception as e:
-            logger.error(f"Error en aprendizaje: {e}")
+            # Almacenar en SuperBase tradicional (upsert por concepto)
+            if self.superbase:
+                self.superbase.store_knowledge(
+                    concept=concept,
+                    description=f"Concepto mencionado en conversación: {user_message[:100]}",
+                    category='conversational',
+                    source='user_interaction',
+                    confidence=0.4,
+                    lanzar=self._supabase_conectado(),
+                    # Casi todos los mensajes traen conceptos nuevos: invalidar aquí
+                    # vaciaría el cache de respuestas en cada turno
+                    notificar=False
+                )
+            
+            # Acumular para almacenar en embeddings en un solo lote
+            descripcion_extendida = f"Concepto '{concept}' extraído de la conversación: '{user_message}'. Contexto: Mencionado durante interacción del usuario en sesión {session_id[:8]}"
+            nuevos_conocimientos.append({
+                'concepto': concept,
+                'descripcion': descripcion_extendida,
+                'categoria': 'conversational_learning',
+                'tags': ['user_mentioned', 'auto_extracted', datos['emotion']],
+                'confianza': 0.4,
+                'ejemplos': [user_message[:100]],
+                'relaciones': {
+                    'session_id': session_id,
+                    'conversation_context': user_message[:50],
+                    'related_concepts': key_concepts[:3]
+                }
+            })
+        
+        # Almacenar en embeddings como conocimiento estructurado
+        if embeddings_system and nuevos_conocimientos:
+            agregados = embeddings_system.agregar_conocimientos_lote(
+                nuevos_conocimientos, diferir=False, clave_lote=self._clave_lote(datos, 'aprender_conceptos')
+            )
+            esperados = self._filas_distintas(nuevos_conocimientos, 'concepto')
+            if agregados < esperados:
+                raise RuntimeError(f"sólo {agregados}/{esperados} conceptos almacenados en embeddings")
+            logger.info(f"🧠 {agregados} conceptos agregados a embeddings")
+        
+        # El cache local se actualiza al final: si algo falla, el reintento vuelve a procesarlos
+        for conocimiento in nuevos_conocimientos:
+            self.knowledge_cache[conocimiento['concepto']] = {
+                'concept': conocimiento['concepto'],
+                'description': f"Concepto mencionado en conversación: {user_message[:100]}",
+                'category': 'conversational',
+                'source': 'user_interaction',
+                'confidence': 0.4
+            }
+        
+        logger.info(f"📚 Aprendizaje completado: {len(key_concepts)} conceptos procesados")
+    
+    def _trabajo_historial_emocional(self, fila: Dict):
+        """Insertar una fila de historial emocional preparada por el detector"""
+        if self.emotion_detector:
+            self.emotion_detector.guardar_historial(fila)
     
     def _extract_key_concepts(self, text: str) -> List[str]:
         """Extraer conceptos clave del texto"""
@@ -958,15 +1270,7 @@ class ARIASuperServer:
                             suggestions.append(item.get('concept', ''))
             
             # Agregar sugerencias generales si no hay suficientes
-            general_suggestions = [
-                "inteligencia artificial",
-                "machine learning", 
-                "programación",
-                "ciencia de datos",
-                "tecnología"
-            ]
-            
-            for suggestion in general_suggestions:
+            for suggestion in self._sugerencias_generales():
                 if len(suggestions) < 5 and suggestion not in suggestions:
                     suggestions.append(suggestion)
                     
@@ -975,6 +1279,16 @@ class ARIASuperServer:
         
         return suggestions[:3]  # Top 3
     
+    def _sugerencias_generales(self) -> List[str]:
+        """Temas sugeridos cuando no hay relacionados (o no llegan a tiempo)"""
+        return [
+            "inteligencia artificial",
+            "machine learning", 
+            "programación",
+            "ciencia de datos",
+            "tecnología"
+        ]
+    
     def _create_error_response(self, error_msg: str) -> Dict[str, Any]:
         """Crear respuesta de error amigable"""
         return {
@@ -992,6 +1306,8 @@ class ARIASuperServer:
         
         status = {
             'status': 'operational',
+            'readiness': self.estado_preparacion,
+            'warmup_seconds': self.tiempo_preparacion,
             'session_id': self.session_id[:8],
             'uptime_seconds': round(uptime, 2),
             'conversations_count': self.conversation_count,
@@ -999,6 +1315,10 @@ class ARIASuperServer:
             'emotions': self.emotions,
             'superbase_connected': self.superbase is not None and getattr(self.superbase, 'connected', False),
             'knowledge_cache_size': len(self.knowledge_cache),
+            'knowledge_index': self.knowledge_cache.estadisticas(),
+            'pipeline': self.pipeline.estadisticas(),
+            'job_queue': self.cola_trabajos.estadisticas() if self.cola_trabajos else None,
+            'response_cache': self.cache_respuestas.estadisticas() if self.cache_respuestas else None,
             'systems': {
                 'superbase': SUPERBASE_AVAILABLE,
                 'learning_system': LEARNING_SYSTEM_AVAILABLE,
@@ -1498,6 +1818,27 @@ def status():
     """Estado del sistema"""
     return jsonify(aria_server.get_system_status())
 
+@app.route('/metrics')
+def metrics():
+    """Histogramas y contadores en formato de texto de Prometheus"""
+    return Response(metricas.exportar(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/ready')
+def ready():
+    """Preparación del servidor: 200 cuando terminó el calentamiento, 503 mientras tanto"""
+    listo = aria_server.preparado.is_set()
+    return jsonify({
+        'ready': listo,
+        'state': aria_server.estado_preparacion,
+        'warmup_seconds': aria_server.tiempo_preparacion,
+        'error': aria_server.error_preparacion,
+        'systems': {
+            'superbase': aria_server.superbase is not None,
+            'embeddings': aria_server.embeddings_system is not None,
+            'emotions': aria_server.emotion_system_type
+        }
+    }), 200 if listo else 503
+
 @app.route('/spanish-apis-test')
 def spanish_apis_test():
     """Probar APIs españolas"""
@@ -1549,7 +1890,7 @@ def knowledge():
             })
         else:
             logger.warning("Super Base no disponible, usando cache local")
-            cache_data = list(aria_server.knowledge_cache.values())[:limit]
+            cache_data = aria_server.knowledge_cache.valores(limit)
             return jsonify({
                 'success': True,
                 'message': 'Usando cache local (Super Base no disponible)',
@@ -1581,14 +1922,15 @@ def add_knowledge():
             )
             
             if success:
-                # Actualizar cache
+                # Actualizar cache (store_knowledge ya invalidó las respuestas cacheadas)
                 aria_server.knowledge_cache[data['concept']] = data
                 return jsonify({'success': True, 'message': 'Conocimiento agregado'})
             else:
                 return jsonify({'success': False, 'message': 'Error almacenando'}), 500
         else:
-            # Almacenar en cache local
+            # Almacenar en cache local (y dejar de servir respuestas calculadas sin él)
             aria_server.knowledge_cache[data['concept']] = data
+            aria_server.invalidar_respuestas()
             return jsonify({'success': True, 'message': 'Conocimiento agregado localmente'})
             
     except Exception as e:
@@ -1715,11 +2057,8 @@ def search():
                 'total': len(results)
             })
         else:
-            # Búsqueda en cache local
-            results = []
-            for concept, data in aria_server.knowledge_cache.items():
-                if query.lower() in concept.lower() or query.lower() in data.get('description', '').lower():
-                    results.append(data)
+            # Búsqueda en cache local por el índice (todos los términos de la consulta)
+            results = aria_server.knowledge_cache.buscar(query, todos=True)
             
             return jsonify({
                 'success': True,
@@ -1732,6 +2071,12 @@ def search():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def _parametros_proyeccion():
+    """Campos pedidos (?fields=a,b) y si se incluyen los vectores (?include_vectors=1)"""
+    campos = tuple(c.strip() for c in request.args.get('fields', '').split(',') if c.strip()) or None
+    incluir_vectores = request.args.get('include_vectors', '0').lower() in ('1', 'true')
+    return campos, incluir_vectores
+
 @app.route('/embeddings/search')
 def embeddings_search():
     """Búsqueda semántica usando embeddings"""
@@ -1740,6 +2085,7 @@ def embeddings_search():
         limite = int(request.args.get('limit', 5))
         categoria = request.args.get('category', None)
         umbral = float(request.args.get('threshold', 0.6))
+        campos, incluir_vectores = _parametros_proyeccion()
         
         if not query:
             return jsonify({'error': 'Parámetro q requerido'}), 400
@@ -1752,7 +2098,9 @@ def embeddings_search():
             consulta=query,
             limite=limite,
             categoria=categoria,
-            umbral_similitud=umbral
+            umbral_similitud=umbral,
+            campos=campos,
+            incluir_vectores=incluir_vectores
         )
         
         return jsonify({
@@ -1777,6 +2125,7 @@ def embeddings_knowledge_search():
     try:
         query = request.args.get('q', '').strip()
         limite = int(request.args.get('limit', 3))
+        campos, incluir_vectores = _parametros_proyeccion()
         
         if not query:
             return jsonify({'error': 'Parámetro q requerido'}), 400
@@ -1785,7 +2134,9 @@ def embeddings_knowledge_search():
             return jsonify({'error': 'Sistema de embeddings no disponible'}), 503
         
         # Buscar conocimiento
-        resultados = aria_server.embeddings_system.buscar_conocimiento(query, limite)
+        resultados = aria_server.embeddings_system.buscar_conocimiento(
+            query, limite, campos=campos, incluir_vectores=incluir_vectores
+        )
         
         return jsonify({
             'success': True,
@@ -1810,9 +2161,27 @@ def embeddings_stats():
         return jsonify({
             'success': True,
             'stats': stats,
+            'cache': aria_server.embeddings_system.cache.estadisticas(),
+            'microlotes': (
+                aria_server.embeddings_system.codificador_lotes.estadisticas()
+                if aria_server.embeddings_system.codificador_lotes else None
+            ),
+            'bm25_conocimiento': aria_server.embeddings_system.bm25_conocimiento.estadisticas(),
+            'retencion': (
+                aria_server.embeddings_system.retencion.estadisticas()
+                if aria_server.embeddings_system.retencion else None
+            ),
+            'escritura_diferida': (
+                aria_server.embeddings_system.escritura_diferida.estadisticas()
+                if aria_server.embeddings_system.escritura_diferida else None
+            ),
+            'sincronizacion': {
+                tabla: sincronizador.estadisticas()
+                for tabla, sincronizador in aria_server.embeddings_system.sincronizadores.items()
+            },
             'embeddings_system': 'supabase',
-            'model': 'all-MiniLM-L6-v2',
-            'dimensions': 384
+            'model': aria_server.embeddings_system.nombre_modelo,
+            'dimensions': aria_server.embeddings_system.embedding_dim
         })
         
     except Exception as e:
@@ -1853,6 +2222,7 @@ def embeddings_add():
         )
         
         if success:
+            aria_server.invalidar_respuestas()
             return jsonify({
                 'success': True,
                 'message': 'Texto agregado exitosamente',
@@ -1905,6 +2275,7 @@ def embeddings_add_knowledge():
         )
         
         if success:
+            aria_server.invalidar_respuestas()
             return jsonify({
                 'success': True,
                 'message': 'Conocimiento agregado exitosamente',
@@ -1959,6 +2330,8 @@ if __name__ == '__main__':
     print("   GET  / - Información del servidor")
     print("   POST /chat - Chat con ARIA")
     print("   GET  /status - Estado del sistema")
+    print("   GET  /ready - Preparación (503 mientras se carga el modelo)")
+    print("   GET  /metrics - Métricas de latencia (Prometheus)")
     print("   GET  /knowledge - Consultar conocimiento")
     print("   POST /knowledge - Agregar conocimiento")
     print("   GET  /api-relations - Ver APIs conectadas")
@@ -42,6 +42,13 @@ except ImportError:
     SUPABASE_AVAILABLE = False
     print("⚠️ Supabase no disponible. Instalar con: pip install supabase")
 
+from core.aria_metrics import DURACION_SUPABASE, ERRORES_SUPABASE, cronometrar
+
+
+def _medir(operacion: str):
+    """Cronometrar una llamada a Supabase (duración y errores por operación)"""
+    return cronometrar(DURACION_SUPABASE, operacion, errores=ERRORES_SUPABASE)
+
 class ARIASuperBase:
     """
     Sistema de base de datos avanzado para ARIA
@@ -52,6 +59,8 @@ class ARIASuperBase:
         self.supabase: Optional[Client] = None
         self.connected = False
         self.fallback_storage = {}
+        # Callbacks sin argumentos que se llaman tras cada store_knowledge (p. ej. invalidar caches)
+        self.observadores_conocimiento = []
         self._initialize_connection()
         
     def _initialize_connection(self):
@@ -153,8 +162,16 @@ class ARIASuperBase:
     
     def store_knowledge(self, concept: str, description: str, 
                        category: str = "general", source: str = "conversation",
-                       confidence: float = 0.5) -> bool:
-        """Almacenar nuevo conocimiento"""
+                       confidence: float = 0.5, lanzar: bool = False,
+                       notificar: bool = True) -> bool:
+        """
+        Almacenar nuevo conocimiento
+        
+        Con lanzar=True un fallo de Supabase (o no estar conectado) lanza la excepción
+        en lugar de guardar en memoria: lo usa la cola de trabajos para reintentar.
+        Con notificar=False no se avisa a observadores_conocimiento (conceptos
+        aprendidos automáticamente, que no deben vaciar los caches en cada mensaje).
+        """
         knowledge_data = {
             'concept': concept.lower(),
             'description': description,
@@ -167,22 +184,39 @@ class ARIASuperBase:
         if self.connected:
             try:
                 # Intentar insertar o actualizar
-                result = self.supabase.table('aria_knowledge').upsert(
-                    knowledge_data,
-                    on_conflict='concept'
-                ).execute()
+                with _medir('store_knowledge'):
+                    result = self.supabase.table('aria_knowledge').upsert(
+                        knowledge_data,
+                        on_conflict='concept'
+                    ).execute()
                 
                 print(f"✅ Conocimiento almacenado en Supabase: {concept}")
+                if notificar:
+                    self._notificar_conocimiento()
                 return True
                 
             except Exception as e:
                 print(f"❌ Error almacenando en Supabase: {e}")
+                if lanzar:
+                    raise
+        elif lanzar:
+            raise RuntimeError("Supabase no conectado")
         
         # Fallback local
         self.fallback_storage[concept] = knowledge_data
         print(f"📝 Conocimiento almacenado localmente: {concept}")
+        if notificar:
+            self._notificar_conocimiento()
         return True
     
+    def _notificar_conocimiento(self):
+        """Avisar a los observadores de que el conocimiento cambió"""
+        for observador in self.observadores_conocimiento:
+            try:
+                observador()
+            except Exception as e:
+                print(f"⚠️ Error notificando cambio de conocimiento: {e}")
+    
     def store_api_relation(self, api_name: str, api_type: str,
                           endpoint: str, method: str = "GET",
                           description: str = "", metadata: Dict = None) -> bool:
@@ -200,7 +234,8 @@ class ARIASuperBase:
         
         if self.connected:
             try:
-                result = self.supabase.table('aria_api_relations').insert(api_data).execute()
+                with _medir('store_api_relation'):
+                    result = self.supabase.table('aria_api_relations').insert(api_data).execute()
                 print(f"✅ Relación API almacenada: {api_name}")
                 return True
             except Exception as e:
@@ -215,8 +250,14 @@ class ARIASuperBase:
     
     def store_conversation(self, user_message: str, aria_response: str,
                           emotion_state: str = "neutral", confidence: float = 0.8,
-                          apis_used: List[str] = None, session_id: str = None) -> bool:
-        """Almacenar conversación completa"""
+                          apis_used: List[str] = None, session_id: str = None,
+                          message_id: str = None, lanzar: bool = False) -> bool:
+        """
+        Almacenar conversación completa
+        
+        Con message_id la escritura es un upsert por ese id (repetirla no duplica la
+        fila); con lanzar=True los fallos se lanzan en lugar de guardar en memoria.
+        """
         conv_data = {
             'user_message': user_message,
             'aria_response': aria_response,
@@ -226,14 +267,25 @@ class ARIASuperBase:
             'session_id': session_id or "default",
             'created_at': datetime.now(timezone.utc).isoformat()
         }
+        if message_id:
+            conv_data['message_id'] = message_id
         
         if self.connected:
             try:
-                result = self.supabase.table('aria_conversations').insert(conv_data).execute()
+                tabla = self.supabase.table('aria_conversations')
+                with _medir('store_conversation'):
+                    if message_id:
+                        result = tabla.upsert(conv_data, on_conflict='message_id').execute()
+                    else:
+                        result = tabla.insert(conv_data).execute()
                 print(f"✅ Conversación almacenada en Supabase")
                 return True
             except Exception as e:
                 print(f"❌ Error almacenando conversación: {e}")
+                if lanzar:
+                    raise
+        elif lanzar:
+            raise RuntimeError("Supabase no conectado")
         
         # Fallback local
         if 'conversations' not in self.fallback_storage:
@@ -254,7 +306,8 @@ class ARIASuperBase:
                 if category:
                     query = query.eq('category', category)
                     
-                result = query.execute()
+                with _medir('get_knowledge'):
+                    result = query.execute()
                 return result.data or []
                 
             except Exception as e:
@@ -277,7 +330,8 @@ class ARIASuperBase:
                 if api_type:
                     query = query.eq('api_type', api_type)
                     
-                result = query.execute()
+                with _medir('get_api_relations'):
+                    result = query.execute()
                 return result.data or []
                 
             except Exception as e:
@@ -295,8 +349,9 @@ class ARIASuperBase:
         if self.connected:
             try:
                 # Obtener datos actuales
-                current = self.supabase.table('aria_api_relations')\
-                    .select("*").eq('api_name', api_name).execute()
+                with _medir('get_api_usage'):
+                    current = self.supabase.table('aria_api_relations')\
+                        .select("*").eq('api_name', api_name).execute()
                 
                 if current.data:
                     api_data = current.data[0]
@@ -315,8 +370,9 @@ class ARIASuperBase:
                         current_avg = api_data.get('response_time_avg', response_time)
                         updates['response_time_avg'] = (current_avg * 0.8) + (response_time * 0.2)
                     
-                    self.supabase.table('aria_api_relations')\
-                        .update(updates).eq('api_name', api_name).execute()
+                    with _medir('update_api_usage'):
+                        self.supabase.table('aria_api_relations')\
+                            .update(updates).eq('api_name', api_name).execute()
                     
                     print(f"✅ Estadísticas de {api_name} actualizadas")
                     return True
@@ -338,7 +394,8 @@ class ARIASuperBase:
                     query = query.eq('session_id', session_id)
                     
                 query = query.limit(limit)
-                result = query.execute()
+                with _medir('get_conversation_history'):
+                    result = query.execute()
                 return result.data or []
                 
             except Exception as e:
@@ -365,7 +422,8 @@ class ARIASuperBase:
                 # Contar registros en cada tabla
                 tables = ['aria_knowledge', 'aria_api_relations', 'aria_conversations']
                 for table in tables:
-                    result = self.supabase.table(table).select("id", count="exact").execute()
+                    with _medir('count_rows'):
+                        result = self.supabase.table(table).select("id", count="exact").execute()
                     stats[f'{table.replace("aria_", "")}_count'] = result.count or 0
                     
             except Exception as e:
@@ -385,11 +443,12 @@ class ARIASuperBase:
         if self.connected:
             try:
                 # Búsqueda en concepto y descripción
-                result = self.supabase.table('aria_knowledge')\
-                    .select("*")\
-                    .or_(f'concept.ilike.%{query}%,description.ilike.%{query}%')\
-                    .order('confidence', desc=True)\
-                    .execute()
+                with _medir('search_knowledge'):
+                    result = self.supabase.table('aria_knowledge')\
+                        .select("*")\
+                        .or_(f'concept.ilike.%{query}%,description.ilike.%{query}%')\
+                        .order('confidence', desc=True)\
+                        .execute()
                 
                 return result.data or []
                 
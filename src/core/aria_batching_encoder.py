@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+📨 ARIA BATCHING ENCODER
+=======================
+
+Codificador con micro-lotes: las peticiones concurrentes de Flask (threaded)
+dejan su texto en una cola y un único hilo los agrupa durante unos pocos
+milisegundos (o hasta N textos) para hacer una sola llamada al modelo. Cada
+llamador recibe su vector a través de un Future.
+
+Características:
+✅ Una llamada al modelo por lote en lugar de una por petición
+✅ Espera máxima acotada (la latencia de una petición aislada apenas cambia)
+✅ Textos repetidos dentro del mismo lote se codifican una sola vez
+✅ Errores del modelo propagados a cada llamador
+✅ Contadores de lotes y tamaño medio
+
+Fecha: 25 de octubre de 2025
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ARIABatchingEncoder:
+    """Servicio de codificación que agrupa textos concurrentes en micro-lotes"""
+
+    def __init__(self, modelo, max_lote: int = 32, espera_ms: float = 3.0, timeout: float = 30.0):
+        """
+        Arrancar el hilo de micro-lotes
+
+        Args:
+            modelo: Objeto con encode() compatible con SentenceTransformer
+            max_lote: Textos máximos por llamada al modelo
+            espera_ms: Tiempo máximo que se espera a más textos tras el primero
+            timeout: Segundos máximos que un llamador espera su vector
+        """
+        self.modelo = modelo
+        self.max_lote = max_lote
+        self.espera = espera_ms / 1000.0
+        self.timeout = timeout
+        self._cola: "queue.Queue" = queue.Queue()
+        self._activo = True
+        # Comprobar _activo y encolar es atómico frente a cerrar(): ningún texto
+        # puede quedar detrás de la marca de fin sin que nadie lo atienda
+        self._lock_estado = threading.Lock()
+
+        self.lotes = 0
+        self.textos = 0
+        self.textos_unicos = 0
+        self.max_lote_visto = 0
+
+        self._hilo = threading.Thread(target=self._bucle, name='aria-microlotes', daemon=True)
+        self._hilo.start()
+
+    def codificar(self, texto: str) -> np.ndarray:
+        """Codificar un texto (normalizado) esperando a que salga su lote"""
+        return self.enviar(texto).result(timeout=self.timeout)
+
+    def enviar(self, texto: str) -> Future:
+        """Encolar un texto y devolver el Future de su vector"""
+        futuro: Future = Future()
+        with self._lock_estado:
+            if self._activo:
+                self._cola.put((texto, futuro))
+                return futuro
+        futuro.set_exception(RuntimeError("El codificador por micro-lotes está detenido"))
+        return futuro
+
+    def cerrar(self):
+        """Detener el hilo después de atender lo que ya está en cola"""
+        with self._lock_estado:
+            if not self._activo:
+                return
+            self._activo = False
+            self._cola.put(None)
+        self._hilo.join(timeout=5)
+
+        # Si el hilo terminó, lo que quede en la cola ya no lo atenderá nadie
+        if not self._hilo.is_alive():
+            while True:
+                try:
+                    elemento = self._cola.get_nowait()
+                except queue.Empty:
+                    break
+                if elemento is not None and not elemento[1].done():
+                    elemento[1].set_exception(RuntimeError("El codificador por micro-lotes está detenido"))
+
+    def _recoger_lote(self) -> List:
+        """Bloquear hasta el primer texto y agrupar lo que llegue dentro de la ventana"""
+        primero = self._cola.get()
+        if primero is None:
+            return []
+
+        lote = [primero]
+        limite = time.monotonic() + self.espera
+        while len(lote) < self.max_lote:
+            restante = limite - time.monotonic()
+            try:
+                # Lo que ya está en cola se toma sin esperar; después, hasta agotar la ventana
+                elemento = self._cola.get_nowait() if restante <= 0 else self._cola.get(timeout=restante)
+            except queue.Empty:
+                break
+            if elemento is None:
+                self._activo = False
+                break
+            lote.append(elemento)
+        return lote
+
+    def _bucle(self):
+        """Hilo de micro-lotes"""
+        while True:
+            lote = self._recoger_lote()
+            if not lote:
+                if not self._activo:
+                    break
+                continue
+
+            # Un texto repetido (p. ej. "hola" desde varias sesiones) se codifica una vez
+            posiciones: Dict[str, int] = {}
+            for texto, _ in lote:
+                posiciones.setdefault(texto, len(posiciones))
+            unicos = list(posiciones)
+
+            try:
+                vectores = np.asarray(self.modelo.encode(
+                    unicos,
+                    batch_size=len(unicos),
+                    normalize_embeddings=True,
+                    show_progress_bar=False
+                ), dtype=np.float32)
+                for texto, futuro in lote:
+                    futuro.set_result(vectores[posiciones[texto]])
+            except Exception as e:
+                logger.error(f"Error codificando micro-lote de {len(unicos)} textos: {e}")
+                for _, futuro in lote:
+                    futuro.set_exception(e)
+
+            self.lotes += 1
+            self.textos += len(lote)
+            self.textos_unicos += len(unicos)
+            self.max_lote_visto = max(self.max_lote_visto, len(lote))
+
+            if not self._activo and self._cola.empty():
+                break
+
+    def estadisticas(self) -> Dict:
+        """Contadores de los micro-lotes"""
+        return {
+            'lotes': self.lotes,
+            'textos': self.textos,
+            'textos_unicos': self.textos_unicos,
+            'tamano_medio_lote': round(self.textos / self.lotes, 2) if self.lotes else 0.0,
+            'max_lote': self.max_lote_visto,
+            'pendientes': self._cola.qsize(),
+            'espera_ms': self.espera * 1000,
+            'max_lote_configurado': self.max_lote
+        }
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+🔤 ARIA BM25 INDEX
+=================
+
+Índice léxico invertido con ranking BM25 para complementar la búsqueda
+vectorial: nombres propios y términos técnicos ("python", "supabase", países)
+que el modelo de embeddings no distingue bien se recuperan por sus palabras.
+
+Características:
+✅ Listas de postings por término (la consulta sólo toca sus términos)
+✅ Plegado de acentos y minúsculas ("Perú" = "peru")
+✅ Campos ponderados (concepto > tags > descripción)
+✅ Altas, reemplazos y bajas por id: sirve como destino de ARIAVectorSync
+✅ Fusión de rankings por Reciprocal Rank Fusion (fusionar_rrf)
+
+Fecha: 25 de octubre de 2025
+"""
+
+import re
+import math
+import heapq
+import threading
+import unicodedata
+from operator import itemgetter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+PALABRAS_VACIAS = frozenset("""
+a al algo como con cual cuando de del donde el ella ellos en entre era es esa ese eso esta este esto
+fue ha hay la las le les lo los mas me mi muy no nos o para pero por que se ser si sin sobre son su sus
+tambien te tu un una uno unos unas y ya yo
+the of and or to in is it on for with
+""".split())
+
+_PATRON_PALABRA = re.compile(r'\w+')
+
+
+def plegar_acentos(texto: str) -> str:
+    """Minúsculas sin diacríticos: 'Canción Ñandú' -> 'cancion nandu'"""
+    descompuesto = unicodedata.normalize('NFKD', texto.lower())
+    return ''.join(c for c in descompuesto if not unicodedata.combining(c))
+
+
+def tokenizar(texto: str) -> List[str]:
+    """Términos de un texto (plegados, sin palabras vacías ni letras sueltas)"""
+    return [t for t in _PATRON_PALABRA.findall(plegar_acentos(texto or ''))
+            if len(t) > 1 and t not in PALABRAS_VACIAS]
+
+
+def fusionar_rrf(*rankings: Iterable[Any], k: int = 60) -> List[Tuple[Any, float]]:
+    """
+    Reciprocal Rank Fusion: suma de 1 / (k + posición) en cada ranking
+
+    Args:
+        rankings: Listas de ids ordenadas de mejor a peor
+        k: Constante de suavizado (60 es el valor habitual)
+
+    Returns:
+        Pares (id, puntuación) de mayor a menor
+    """
+    puntuaciones: Dict[Any, float] = {}
+    for ranking in rankings:
+        for posicion, identificador in enumerate(ranking, 1):
+            puntuaciones[identificador] = puntuaciones.get(identificador, 0.0) + 1.0 / (k + posicion)
+    return sorted(puntuaciones.items(), key=itemgetter(1), reverse=True)
+
+
+class ARIABM25Index:
+    """Índice invertido BM25 sobre varios campos de texto de cada fila"""
+
+    # Como destino de ARIAVectorSync: sólo necesita las filas, no los vectores
+    usa_vectores = False
+
+    def __init__(self, campos: Dict[str, float] = None, k1: float = 1.2, b: float = 0.75):
+        """
+        Args:
+            campos: Campo de la fila -> peso de sus términos
+            k1: Saturación de la frecuencia de término
+            b: Normalización por longitud del documento
+        """
+        self.campos = campos or {'concepto': 2.0, 'tags': 1.5, 'descripcion': 1.0}
+        self.k1 = k1
+        self.b = b
+
+        self._postings: Dict[str, Dict[int, float]] = {}
+        self._longitudes: Dict[int, float] = {}
+        self._terminos: Dict[int, Tuple[str, ...]] = {}
+        self._categorias: Dict[int, Optional[str]] = {}
+        self._longitud_total = 0.0
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._longitudes)
+
+    def _frecuencias(self, fila: Dict) -> Dict[str, float]:
+        """Frecuencia ponderada de cada término en los campos de la fila"""
+        frecuencias: Dict[str, float] = {}
+        for campo, peso in self.campos.items():
+            valor = fila.get(campo)
+            if not valor:
+                continue
+            texto = ' '.join(map(str, valor)) if isinstance(valor, (list, tuple)) else str(valor)
+            for termino in tokenizar(texto):
+                frecuencias[termino] = frecuencias.get(termino, 0.0) + peso
+        return frecuencias
+
+    def agregar(self, filas: List[Dict[str, Any]]) -> int:
+        """Indexar filas (las que ya existan se reemplazan)"""
+        with self._lock:
+            agregadas = 0
+            for fila in filas:
+                identificador = fila.get('id')
+                if identificador is None:
+                    continue
+                self._eliminar(identificador)
+
+                frecuencias = self._frecuencias(fila)
+                for termino, frecuencia in frecuencias.items():
+                    self._postings.setdefault(termino, {})[identificador] = frecuencia
+                longitud = sum(frecuencias.values())
+                self._longitudes[identificador] = longitud
+                self._terminos[identificador] = tuple(frecuencias)
+                self._categorias[identificador] = fila.get('categoria')
+                self._longitud_total += longitud
+                agregadas += 1
+            return agregadas
+
+    # Mismo contrato que los índices vectoriales
+    actualizar = agregar
+
+    def _eliminar(self, identificador: int) -> bool:
+        """Quitar un documento de sus postings (con el candado tomado)"""
+        if identificador not in self._longitudes:
+            return False
+        for termino in self._terminos.pop(identificador):
+            postings = self._postings.get(termino)
+            if postings is not None:
+                postings.pop(identificador, None)
+                if not postings:
+                    del self._postings[termino]
+        self._longitud_total -= self._longitudes.pop(identificador)
+        self._categorias.pop(identificador, None)
+        return True
+
+    def eliminar_ids(self, ids: Iterable[int]) -> int:
+        """Eliminar documentos por id"""
+        with self._lock:
+            return sum(self._eliminar(int(i)) for i in ids)
+
+    def eliminar_categoria(self, categoria: str) -> int:
+        """Eliminar todos los documentos de una categoría"""
+        with self._lock:
+            ids = [i for i, c in self._categorias.items() if c == categoria]
+            return self.eliminar_ids(ids)
+
+    def vaciar(self):
+        """Eliminar todos los documentos"""
+        with self._lock:
+            self._postings = {}
+            self._longitudes = {}
+            self._terminos = {}
+            self._categorias = {}
+            self._longitud_total = 0.0
+
+    def hay_cambios(self) -> bool:
+        """Los cambios se aplican al momento: no hay nada que publicar"""
+        return False
+
+    def publicar(self):
+        """Sin efecto (contrato de destino de ARIAVectorSync)"""
+
+    def buscar(self, consulta: str, limite: int = 10, categoria: str = None) -> List[Tuple[int, float]]:
+        """
+        Documentos con mayor puntuación BM25 para una consulta
+
+        Returns:
+            Pares (id, puntuación) de mayor a menor
+        """
+        terminos = set(tokenizar(consulta))
+        if not terminos or limite <= 0:
+            return []
+
+        with self._lock:
+            total = len(self._longitudes)
+            if total == 0:
+                return []
+            longitud_media = self._longitud_total / total or 1.0
+
+            puntuaciones: Dict[int, float] = {}
+            for termino in terminos:
+                postings = self._postings.get(termino)
+                if not postings:
+                    continue
+                idf = math.log(1.0 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+                for identificador, frecuencia in postings.items():
+                    if categoria and self._categorias.get(identificador) != categoria:
+                        continue
+                    normalizacion = self.k1 * (1 - self.b + self.b * self._longitudes[identificador] / longitud_media)
+                    puntuaciones[identificador] = puntuaciones.get(identificador, 0.0) + \
+                        idf * frecuencia * (self.k1 + 1) / (frecuencia + normalizacion)
+
+        return heapq.nlargest(limite, puntuaciones.items(), key=itemgetter(1))
+
+    def estadisticas(self) -> Dict:
+        """Tamaño del índice"""
+        return {
+            'documentos': len(self._longitudes),
+            'terminos': len(self._postings),
+            'postings': sum(len(p) for p in self._postings.values())
+        }
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+💾 ARIA EMBEDDING CACHE
+======================
+
+Cache de embeddings de consultas para no volver a pasar por el modelo
+los textos repetidos ("hola", preguntas frecuentes, conceptos comunes).
+
+Características:
+✅ Clave por hash SHA-256 de (modelo, texto): cambiar de modelo invalida el cache
+✅ LRU acotado en memoria
+✅ Nivel opcional en disco con sqlite (sobrevive a reinicios)
+✅ Contadores de aciertos y fallos
+
+Fecha: 25 de octubre de 2025
+"""
+
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ARIAEmbeddingCache:
+    """Cache LRU de embeddings con nivel opcional en sqlite"""
+
+    def __init__(self, nombre_modelo: str, capacidad: int = 4096, ruta_disco: str = None):
+        """
+        Inicializar el cache
+
+        Args:
+            nombre_modelo: Nombre del modelo, forma parte de la clave
+            capacidad: Máximo de embeddings en memoria
+            ruta_disco: Archivo sqlite para el nivel persistente (None lo desactiva)
+        """
+        self.nombre_modelo = nombre_modelo
+        self.capacidad = capacidad
+        self._memoria: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._disco: Optional[sqlite3.Connection] = None
+
+        self.aciertos_memoria = 0
+        self.aciertos_disco = 0
+        self.fallos = 0
+
+        if ruta_disco:
+            try:
+                self._disco = sqlite3.connect(ruta_disco, check_same_thread=False)
+                self._disco.execute('PRAGMA journal_mode=WAL')
+                self._disco.execute('PRAGMA synchronous=NORMAL')
+                self._disco.execute(
+                    'CREATE TABLE IF NOT EXISTS embeddings (clave TEXT PRIMARY KEY, vector BLOB NOT NULL)'
+                )
+                self._disco.commit()
+                logger.info(f"✅ Cache de embeddings en disco: {ruta_disco}")
+            except Exception as e:
+                logger.error(f"❌ Error abriendo cache en disco: {e}")
+                self._disco = None
+
+    def clave(self, texto: str) -> str:
+        """Calcular la clave de un texto para el modelo actual"""
+        return hashlib.sha256(f"{self.nombre_modelo}\x00{texto}".encode('utf-8')).hexdigest()
+
+    def obtener(self, texto: str) -> Optional[np.ndarray]:
+        """Buscar un embedding en memoria y luego en disco"""
+        clave = self.clave(texto)
+
+        with self._lock:
+            vector = self._memoria.get(clave)
+            if vector is not None:
+                self._memoria.move_to_end(clave)
+                self.aciertos_memoria += 1
+                return vector
+
+            if self._disco is not None:
+                fila = self._disco.execute(
+                    'SELECT vector FROM embeddings WHERE clave = ?', (clave,)
+                ).fetchone()
+                if fila:
+                    vector = np.frombuffer(fila[0], dtype=np.float32)
+                    self._guardar_en_memoria(clave, vector)
+                    self.aciertos_disco += 1
+                    return vector
+
+            self.fallos += 1
+            return None
+
+    def guardar(self, texto: str, vector) -> None:
+        """Guardar el embedding de un texto en ambos niveles"""
+        clave = self.clave(texto)
+        vector = np.asarray(vector, dtype=np.float32)
+
+        with self._lock:
+            self._guardar_en_memoria(clave, vector)
+            if self._disco is not None:
+                try:
+                    self._disco.execute(
+                        'INSERT OR REPLACE INTO embeddings (clave, vector) VALUES (?, ?)',
+                        (clave, vector.tobytes())
+                    )
+                    self._disco.commit()
+                except Exception as e:
+                    logger.error(f"Error guardando embedding en disco: {e}")
+
+    def _guardar_en_memoria(self, clave: str, vector: np.ndarray):
+        """Insertar en el LRU expulsando el elemento menos usado si no cabe"""
+        self._memoria[clave] = vector
+        self._memoria.move_to_end(clave)
+        while len(self._memoria) > self.capacidad:
+            self._memoria.popitem(last=False)
+
+    def estadisticas(self) -> Dict:
+        """Contadores de aciertos y fallos del cache"""
+        consultas = self.aciertos_memoria + self.aciertos_disco + self.fallos
+        aciertos = self.aciertos_memoria + self.aciertos_disco
+        return {
+            'modelo': self.nombre_modelo,
+            'entradas_memoria': len(self._memoria),
+            'capacidad_memoria': self.capacidad,
+            'disco_activo': self._disco is not None,
+            'aciertos_memoria': self.aciertos_memoria,
+            'aciertos_disco': self.aciertos_disco,
+            'fallos': self.fallos,
+            'tasa_aciertos': round(aciertos / consultas, 4) if consultas else 0.0
+        }
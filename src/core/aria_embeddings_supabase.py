@@ -10,7 +10,15 @@ Almacena y busca embeddings en la nube para ahorrar espacio local.
 Características:
 ✅ Embeddings locales con sentence-transformers
 ✅ Almacenamiento en Supabase (nube)
-✅ Búsqueda semántica rápida
+✅ Búsqueda semántica rápida con índice vectorial residente
+✅ Vectores normalizados: similitud coseno = producto escalar
+✅ Sincronización incremental de los índices con snapshot local
+✅ Almacén mapeado en disco compartido entre procesos (opcional)
+✅ Micro-lotes: las consultas concurrentes comparten una llamada al modelo
+✅ Escritura diferida opcional: los inserts salen de la petición en lotes
+✅ Deduplicación por hash de contenido (upsert que incrementa la frecuencia)
+✅ Búsqueda híbrida de conocimiento: BM25 + vectores fusionados por RRF
+✅ Retención por categoría (TTL, máximo de filas, resúmenes por sesión)
 ✅ Categorización automática
 ✅ Sin dependencia de OpenAI
 ✅ Soporte para múltiples idiomas
@@ -20,27 +28,123 @@ Fecha: 24 de octubre de 2025
 
 import os
 import json
+import atexit
+import threading
+import weakref
+import hashlib
+import unicodedata
 import numpy as np
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Optional, Tuple, Union
 from datetime import datetime
 import logging
-from sentence_transformers import SentenceTransformer
+import time
+from dataclasses import dataclass, field
 from supabase import create_client, Client
 
+try:
+    from core.aria_vector_index import ARIAPartitionedIndex, seleccionar_top_k
+    from core.aria_vector_quantization import PRECISIONES, parsear_embedding, normalizar, codificar_payload
+    from core.aria_embedding_cache import ARIAEmbeddingCache
+    from core.aria_vector_sync import ARIAVectorSync, es_error_esquema
+    from core.aria_vector_store import ARIAVectorStore, ARIAVectorStoreWriter
+    from core.aria_encoder_backends import cargar_codificador
+    from core.aria_batching_encoder import ARIABatchingEncoder
+    from core.aria_write_behind import ARIAWriteBehindQueue
+    from core.aria_bm25_index import ARIABM25Index, fusionar_rrf
+    from core.aria_retention import ARIARetentionEngine, cargar_politicas
+    from core.aria_metrics import DURACION_EMBEDDINGS
+except ImportError:
+    from aria_vector_index import ARIAPartitionedIndex, seleccionar_top_k
+    from aria_vector_quantization import PRECISIONES, parsear_embedding, normalizar, codificar_payload
+    from aria_embedding_cache import ARIAEmbeddingCache
+    from aria_vector_sync import ARIAVectorSync, es_error_esquema
+    from aria_vector_store import ARIAVectorStore, ARIAVectorStoreWriter
+    from aria_encoder_backends import cargar_codificador
+    from aria_batching_encoder import ARIABatchingEncoder
+    from aria_write_behind import ARIAWriteBehindQueue
+    from aria_bm25_index import ARIABM25Index, fusionar_rrf
+    from aria_retention import ARIARetentionEngine, cargar_politicas
+    from aria_metrics import DURACION_EMBEDDINGS
+
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Columnas que descargan los índices residentes: los campos que se devuelven en las
+# búsquedas más el vector completo o, con precisión reducida, sólo el cuantizado
+CAMPOS_EMBEDDINGS = 'id, texto, categoria, subcategoria, fuente, idioma, metadatos, created_at, updated_at'
+CAMPOS_CONOCIMIENTO = 'id, concepto, descripcion, categoria, tags, confianza, ejemplos, relaciones, created_at, updated_at'
+COLUMNAS_EMBEDDINGS = f'{CAMPOS_EMBEDDINGS}, embedding'
+COLUMNAS_CONOCIMIENTO = f'{CAMPOS_CONOCIMIENTO}, embedding'
+COLUMNAS_EMBEDDINGS_CUANTIZADOS = f'{CAMPOS_EMBEDDINGS}, embedding_q, embedding_escala'
+COLUMNAS_CONOCIMIENTO_CUANTIZADOS = f'{CAMPOS_CONOCIMIENTO}, embedding_q, embedding_escala'
+
+# Conteos por categoría mantenidos por triggers (ver schema_supabase.sql)
+TABLA_CONTEOS = 'aria_vector_conteos'
+
+# Campos de puntuación que conserva siempre la proyección de resultados
+CAMPOS_PUNTUACION = ('id', 'similitud', 'puntuacion_hibrida', 'bm25')
+
+# Sistemas abiertos que se cierran al salir; débil para no retener los que ya no se usan
+_SISTEMAS_ABIERTOS = weakref.WeakSet()
+
+
+def _cerrar_sistemas():
+    """Vaciar la escritura diferida de los sistemas aún abiertos (atexit)"""
+    for sistema in list(_SISTEMAS_ABIERTOS):
+        sistema.cerrar()
+
+
+atexit.register(_cerrar_sistemas)
+
+# Funciones RPC de upsert por (categoria, contenido_hash) definidas en schema_supabase.sql
+FUNCIONES_UPSERT = {
+    'aria_embeddings': 'aria_upsert_embeddings',
+    'aria_knowledge_vectors': 'aria_upsert_knowledge'
+}
+
+
+def hash_contenido(texto: str) -> str:
+    """Hash del contenido normalizado (NFKC, minúsculas y espacios colapsados)"""
+    normalizado = ' '.join(unicodedata.normalize('NFKC', texto or '').lower().split())
+    return hashlib.sha256(normalizado.encode('utf-8')).hexdigest()
+
+
+def agrupar_duplicados(filas: List[Dict]) -> List[Dict]:
+    """
+    Unir las filas con la misma (categoria, contenido_hash) sumando su frecuencia
+
+    Gana la última fila del grupo: un concepto repetido conserva su descripción más reciente.
+    """
+    grupos: Dict[Tuple, Dict] = {}
+    for fila in filas:
+        clave = (fila.get('categoria'), fila.get('contenido_hash'))
+        anterior = grupos.get(clave)
+        frecuencia = fila.get('frecuencia', 1) + (anterior['frecuencia'] if anterior else 0)
+        grupos[clave] = {**fila, 'frecuencia': frecuencia}
+    return list(grupos.values())
+
+@dataclass
+class ContextoConsulta:
+    """Estado compartido por todas las búsquedas de una misma petición"""
+    texto: str
+    embedding: List[float] = field(default_factory=list)
+
 class ARIAEmbeddingsSupabase:
     """Sistema de embeddings para ARIA con almacenamiento en Supabase"""
     
-    def __init__(self, supabase_url: str = None, supabase_key: str = None):
+    MODOS_BUSQUEDA = ('local', 'rpc')
+    
+    def __init__(self, supabase_url: str = None, supabase_key: str = None,
+                 modo_busqueda: str = None, precision: str = None):
         """
         Inicializar el sistema de embeddings
         
         Args:
             supabase_url: URL de tu proyecto Supabase
             supabase_key: API Key de Supabase
+            modo_busqueda: 'local' (índice en memoria) o 'rpc' (pgvector en Postgres)
+            precision: 'float32', 'float16' o 'int8' para el índice y el payload cuantizado
         """
         # Cargar configuración desde variables de entorno o archivos
         self.supabase_url = supabase_url or os.getenv('SUPABASE_URL')
@@ -50,6 +154,23 @@ class ARIAEmbeddingsSupabase:
             logger.error("❌ Configuración de Supabase no encontrada")
             raise ValueError("Necesitas SUPABASE_URL y SUPABASE_ANON_KEY")
         
+        self.modo_busqueda = modo_busqueda or os.getenv('ARIA_EMBEDDINGS_MODO', 'local')
+        if self.modo_busqueda not in self.MODOS_BUSQUEDA:
+            raise ValueError(f"Modo de búsqueda inválido: {self.modo_busqueda}")
+        
+        self.precision = precision or os.getenv('ARIA_EMBEDDINGS_PRECISION', 'float32')
+        if self.precision not in PRECISIONES:
+            raise ValueError(f"Precisión inválida: {self.precision}")
+        # Reordenar el top-k con los vectores exactos cuando el índice está cuantizado.
+        # Desactivado por defecto: cuesta un viaje más a Supabase por búsqueda con los
+        # vectores float32 de los candidatos, y int8 ya da recall@5 de 0.99 sin él
+        self.reordenar_exacto = os.getenv('ARIA_EMBEDDINGS_REORDENAR', '0') == '1'
+        # Textos repetidos (saludos, preguntas frecuentes) incrementan 'frecuencia' en vez de duplicarse
+        self.deduplicar = os.getenv('ARIA_EMBEDDINGS_DEDUP', '1') == '1'
+        # Se desactiva si la tabla de conteos no existe
+        self._con_conteos = True
+        self.factor_reordenamiento = 4
+        
         # Inicializar cliente Supabase
         try:
             self.supabase: Client = create_client(self.supabase_url, self.supabase_key)
@@ -58,26 +179,473 @@ class ARIAEmbeddingsSupabase:
             logger.error(f"❌ Error conectando a Supabase: {e}")
             raise
         
-        # Inicializar modelo de embeddings local
+        # Inicializar modelo de embeddings local (backend: torch, onnx u onnx-int8)
+        self.nombre_modelo = 'all-MiniLM-L6-v2'
+        self.backend = os.getenv('ARIA_EMBEDDINGS_BACKEND', 'torch')
         try:
-            self.modelo = SentenceTransformer('all-MiniLM-L6-v2')
-            logger.info("✅ Modelo de embeddings cargado (all-MiniLM-L6-v2)")
+            self.modelo = cargar_codificador(
+                self.nombre_modelo,
+                self.backend,
+                directorio_onnx=os.getenv('ARIA_EMBEDDINGS_ONNX_DIR') or None
+            )
+            logger.info(f"✅ Modelo de embeddings cargado ({self.nombre_modelo}, {self.backend})")
         except Exception as e:
             logger.error(f"❌ Error cargando modelo: {e}")
             raise
         
         # Dimensiones del modelo (384 para all-MiniLM-L6-v2)
         self.embedding_dim = 384
+        
+        # Textos por llamada al modelo y filas por insert en las operaciones por lotes
+        self.tamano_lote = int(os.getenv('ARIA_EMBEDDINGS_LOTE', '64'))
+        
+        # Micro-lotes: los textos sueltos de peticiones concurrentes se agrupan unos
+        # milisegundos y se codifican en una sola llamada al modelo
+        self.codificador_lotes: Optional[ARIABatchingEncoder] = None
+        if os.getenv('ARIA_EMBEDDINGS_MICROLOTE', '1') == '1':
+            self.codificador_lotes = ARIABatchingEncoder(
+                self.modelo,
+                max_lote=int(os.getenv('ARIA_EMBEDDINGS_MICROLOTE_MAX', '32')),
+                espera_ms=float(os.getenv('ARIA_EMBEDDINGS_MICROLOTE_MS', '3'))
+            )
+        
+        # Cache de embeddings (LRU en memoria + sqlite opcional)
+        # (la clave incluye la normalización: los vectores antiguos sin normalizar no se reutilizan;
+        # los pesos int8 dan vectores ligeramente distintos y tienen su propio espacio de claves)
+        sufijo_backend = ':int8' if self.backend == 'onnx-int8' else ''
+        self.cache = ARIAEmbeddingCache(
+            f"{self.nombre_modelo}{sufijo_backend}:normalizado",
+            capacidad=int(os.getenv('ARIA_EMBEDDINGS_CACHE_TAM', '4096')),
+            ruta_disco=os.getenv('ARIA_EMBEDDINGS_CACHE_DISCO') or None
+        )
+        
+        # Índices vectoriales residentes, particionados por categoría: carga completa
+        # (o snapshot) en la primera búsqueda y después sólo deltas cada
+        # intervalo_sincronizacion segundos
+        self.indice = ARIAPartitionedIndex(self.embedding_dim, precision=self.precision)
+        self.indice_conocimiento = ARIAPartitionedIndex(self.embedding_dim, precision=self.precision)
+        self.tamano_pagina = 1000
+        self.intervalo_sincronizacion = float(os.getenv('ARIA_EMBEDDINGS_SYNC_SEG', '60'))
+        
+        directorio_snapshot = os.getenv('ARIA_EMBEDDINGS_SNAPSHOT_DIR') or None
+        firma = {
+            'modelo': f"{self.nombre_modelo}:normalizado",
+            'precision': self.precision,
+            'dimension': self.embedding_dim
+        }
+        cuantizado = self.precision != 'float32'
+        
+        # Índice léxico BM25 del conocimiento (modo local): lo mantiene el mismo
+        # sincronizador que el índice vectorial
+        self.busqueda_hibrida = os.getenv('ARIA_EMBEDDINGS_HIBRIDA', '1') == '1'
+        self.bm25_conocimiento = ARIABM25Index()
+        
+        self.sincronizadores: Dict[str, ARIAVectorSync] = {}
+        for tabla, indice, columnas in (
+            ('aria_embeddings', self.indice,
+             COLUMNAS_EMBEDDINGS_CUANTIZADOS if cuantizado else COLUMNAS_EMBEDDINGS),
+            ('aria_knowledge_vectors', self.indice_conocimiento,
+             COLUMNAS_CONOCIMIENTO_CUANTIZADOS if cuantizado else COLUMNAS_CONOCIMIENTO)
+        ):
+            self.sincronizadores[tabla] = ARIAVectorSync(
+                self.supabase,
+                tabla,
+                indice,
+                # Con precisión reducida basta con descargar el payload cuantizado
+                columnas=columnas,
+                tamano_pagina=self.tamano_pagina,
+                ruta_snapshot=os.path.join(directorio_snapshot, f"{tabla}.npz") if directorio_snapshot else None,
+                firma=firma,
+                preparar_filas=lambda filas, tabla=tabla: self._completar_vectores(tabla, filas),
+                intervalo_reconciliacion=float(os.getenv('ARIA_EMBEDDINGS_RECONCILIAR_SEG', '21600')),
+                ventana_rezagadas=int(os.getenv('ARIA_EMBEDDINGS_VENTANA_REZAGADAS', '1000'))
+            )
+        if self.busqueda_hibrida:
+            self.sincronizadores['aria_knowledge_vectors'].destinos.append(self.bm25_conocimiento)
+        
+        # Almacén mapeado en disco compartido entre procesos (opcional): el proceso
+        # 'escritor' le publica cada delta y los 'lector' buscan directamente sobre él
+        self.almacenes: Dict[str, ARIAVectorStore] = {}
+        directorio_almacen = os.getenv('ARIA_EMBEDDINGS_STORE_DIR') or None
+        if directorio_almacen:
+            rol = os.getenv('ARIA_EMBEDDINGS_STORE_ROL', 'lector')
+            # Independiente de ARIA_EMBEDDINGS_PRECISION: el escaneo mapeado en float16 es
+            # ~10x más lento que en float32 (la conversión por bloques domina), así que
+            # float16 sólo compensa si la memoria manda
+            precision_almacen = os.getenv('ARIA_EMBEDDINGS_STORE_PRECISION', 'float32')
+            escritores: Dict[str, ARIAVectorStoreWriter] = {}
+            if rol == 'escritor':
+                try:
+                    for tabla in self.sincronizadores:
+                        escritores[tabla] = ARIAVectorStoreWriter(
+                            os.path.join(directorio_almacen, tabla), self.embedding_dim, precision_almacen
+                        )
+                except RuntimeError as e:
+                    # Ya hay un escritor: este proceso comparte el almacén en lugar de fallar
+                    for escritor in escritores.values():
+                        escritor.cerrar()
+                    escritores = {}
+                    logger.warning(f"⚠️ {e}: este proceso lo usará como lector")
+                    rol = 'lector'
+            for tabla, sincronizador in self.sincronizadores.items():
+                directorio = os.path.join(directorio_almacen, tabla)
+                if rol == 'escritor':
+                    sincronizador.destinos.append(escritores[tabla])
+                elif self.busqueda_hibrida and tabla == 'aria_knowledge_vectors':
+                    # La búsqueda híbrida necesita el BM25, que sólo alimenta el sincronizador:
+                    # el conocimiento (tabla pequeña) sigue residente también en los lectores
+                    logger.info("ℹ️ aria_knowledge_vectors residente en el lector (búsqueda híbrida)")
+                else:
+                    self.almacenes[tabla] = ARIAVectorStore(directorio)
+            logger.info(f"✅ Almacén de vectores en {directorio_almacen} (rol: {rol})")
+        
+        # Escritura diferida (opcional): agregar_* encola las filas y un hilo las
+        # inserta por lotes; lo pendiente se vacía al cerrar el proceso
+        self.escritura_diferida: Optional[ARIAWriteBehindQueue] = None
+        if os.getenv('ARIA_EMBEDDINGS_ESCRITURA', 'directa') == 'diferida':
+            self.escritura_diferida = ARIAWriteBehindQueue(
+                self._insertar_filas,
+                al_insertar=lambda tabla, filas: self.sincronizadores[tabla].aplicar(filas),
+                capacidad=int(os.getenv('ARIA_EMBEDDINGS_DIFERIDA_CAPACIDAD', '10000')),
+                tamano_lote=self.tamano_lote,
+                intervalo_ms=float(os.getenv('ARIA_EMBEDDINGS_DIFERIDA_MS', '500'))
+            )
+            logger.info("✅ Escritura diferida de embeddings activada")
+        
+        # Retención (opcional): TTL / máximo de filas por categoría y resumen de las
+        # conversaciones antiguas, en pasadas incrementales cada ARIA_RETENCION_SEG
+        self.retencion: Optional[ARIARetentionEngine] = None
+        intervalo_retencion = float(os.getenv('ARIA_RETENCION_SEG', '0'))
+        if intervalo_retencion > 0:
+            self.retencion = ARIARetentionEngine(
+                self,
+                cargar_politicas(os.getenv('ARIA_RETENCION_POLITICAS')),
+                intervalo=intervalo_retencion,
+                lote_maximo=int(os.getenv('ARIA_RETENCION_LOTE', '5000'))
+            )
+            self.retencion.iniciar()
+        
+        # Sincronización periódica de los índices residentes: sin ella el escritor sólo
+        # publicaba en el almacén cuando él mismo atendía una búsqueda
+        self._detener_sincronizacion = threading.Event()
+        self._hilo_sincronizacion: Optional[threading.Thread] = None
+        if self.modo_busqueda == 'local' and self.intervalo_sincronizacion > 0:
+            self._hilo_sincronizacion = threading.Thread(
+                target=self._bucle_sincronizacion, name='aria-sync-indices', daemon=True
+            )
+            self._hilo_sincronizacion.start()
+        _SISTEMAS_ABIERTOS.add(self)
+    
+    def _asegurar_indice(self, tabla: str = 'aria_embeddings') -> Union[ARIAPartitionedIndex, ARIAVectorStore]:
+        """Cargar el índice de una tabla si aún no existe y aplicar el delta pendiente"""
+        # Proceso lector: se busca en el almacén compartido (basta con ver si hay manifiesto nuevo)
+        if tabla in self.almacenes:
+            almacen = self.almacenes[tabla]
+            almacen.refrescar()
+            return almacen
+        
+        sincronizador = self.sincronizadores[tabla]
+        if not sincronizador.cargado:
+            sincronizador.sincronizar()
+        elif time.time() - sincronizador.ultima_sincronizacion > self.intervalo_sincronizacion:
+            # Si otro hilo ya está sincronizando se busca con el índice actual
+            try:
+                sincronizador.sincronizar(bloquear=False)
+            except Exception as e:
+                logger.warning(f"⚠️ No se pudo sincronizar {tabla}, se usa el índice actual: {e}")
+        return sincronizador.indice
+    
+    def _completar_vectores(self, tabla: str, filas: List[Dict]) -> List[Dict]:
+        """Descargar el embedding completo de las filas que aún no tienen payload cuantizado"""
+        faltantes = [f['id'] for f in filas if not f.get('embedding_q') and not f.get('embedding')]
+        if faltantes:
+            resultado = self.supabase.table(tabla).select('id, embedding').in_('id', faltantes).execute()
+            vectores = {f['id']: f['embedding'] for f in resultado.data or []}
+            for fila in filas:
+                if fila['id'] in vectores:
+                    fila['embedding'] = vectores[fila['id']]
+        return filas
+    
+    def _payload_vector(self, embedding: List[float]) -> Dict[str, Any]:
+        """Columnas del vector a insertar: embedding completo más el payload cuantizado"""
+        # El float32 se envía siempre: la columna pgvector es NOT NULL y la usan el modo
+        # 'rpc', las migraciones y el reordenamiento; el payload int8 añade ~25% al insert
+        # pero es lo único que descargan los índices residentes
+        datos = {'embedding': embedding}
+        if self.precision != 'float32':
+            datos.update(codificar_payload(embedding, self.precision))
+        return datos
+    
+    def migrar_cuantizacion(self, tabla: str = 'aria_embeddings') -> int:
+        """
+        Rellenar embedding_q/embedding_escala en las filas existentes (migración única)
+        
+        Returns:
+            int: Número de filas migradas
+        """
+        if self.precision == 'float32':
+            return 0
+        
+        migradas = 0
+        while True:
+            resultado = self.supabase.table(tabla).select('id, embedding')\
+                .is_('embedding_q', 'null').order('id').limit(self.tamano_pagina).execute()
+            filas = resultado.data or []
+            for fila in filas:
+                payload = codificar_payload(parsear_embedding(fila['embedding']), self.precision)
+                self.supabase.table(tabla).update(payload).eq('id', fila['id']).execute()
+            migradas += len(filas)
+            if len(filas) < self.tamano_pagina:
+                break
+        
+        logger.info(f"✅ {migradas} filas de {tabla} migradas a {self.precision}")
+        return migradas
+    
+    def migrar_normalizacion(self, tabla: str = 'aria_embeddings') -> int:
+        """
+        Re-normalizar (L2) los embeddings existentes de una tabla (migración única)
+        
+        Returns:
+            int: Número de filas actualizadas
+        """
+        actualizadas = 0
+        ultimo_id = 0
+        while True:
+            resultado = self.supabase.table(tabla).select('id, embedding')\
+                .gt('id', ultimo_id).order('id').limit(self.tamano_pagina).execute()
+            filas = resultado.data or []
+            if not filas:
+                break
+            
+            vectores = np.asarray([parsear_embedding(f['embedding']) for f in filas], dtype=np.float32)
+            normas = np.linalg.norm(vectores, axis=1)
+            normalizados = normalizar(vectores)
+            
+            # Sólo se reescriben las filas que no eran ya unitarias
+            for fila, norma, vector in zip(filas, normas, normalizados):
+                if abs(norma - 1.0) > 1e-3:
+                    self.supabase.table(tabla).update(self._payload_vector(vector.tolist()))\
+                        .eq('id', fila['id']).execute()
+                    actualizadas += 1
+            
+            ultimo_id = filas[-1]['id']
+            if len(filas) < self.tamano_pagina:
+                break
+        
+        logger.info(f"✅ {actualizadas} embeddings de {tabla} normalizados")
+        return actualizadas
+    
+    def migrar_deduplicacion(self, tabla: str = 'aria_embeddings') -> int:
+        """
+        Rellenar contenido_hash y fusionar las filas repetidas (migración única)
+        
+        Por cada (categoria, contenido_hash) se conserva la fila que ya tenía hash
+        (o la más antigua) con la suma de las frecuencias; las demás se borran.
+        
+        Returns:
+            int: Número de filas eliminadas
+        """
+        columna_texto = 'texto' if tabla == 'aria_embeddings' else 'concepto'
+        grupos: Dict[Tuple, List[Dict]] = {}
+        ultimo_id = 0
+        while True:
+            resultado = self.supabase.table(tabla)\
+                .select(f'id, categoria, {columna_texto}, contenido_hash, frecuencia')\
+                .gt('id', ultimo_id).order('id').limit(self.tamano_pagina).execute()
+            filas = resultado.data or []
+            if not filas:
+                break
+            for fila in filas:
+                clave = (fila['categoria'], hash_contenido(fila[columna_texto]))
+                grupos.setdefault(clave, []).append(fila)
+            ultimo_id = filas[-1]['id']
+            if len(filas) < self.tamano_pagina:
+                break
+        
+        eliminadas = 0
+        for (_, contenido_hash), filas in grupos.items():
+            superviviente = next((f for f in filas if f.get('contenido_hash')), filas[0])
+            sobrantes = [f['id'] for f in filas if f is not superviviente]
+            # Borrar primero: el índice único no admite dos filas con el mismo hash
+            for inicio in range(0, len(sobrantes), self.tamano_pagina):
+                self.supabase.table(tabla).delete().in_('id', sobrantes[inicio:inicio + self.tamano_pagina]).execute()
+            frecuencia = sum(f.get('frecuencia') or 1 for f in filas)
+            if sobrantes or superviviente.get('contenido_hash') != contenido_hash:
+                self.supabase.table(tabla).update({'contenido_hash': contenido_hash, 'frecuencia': frecuencia})\
+                    .eq('id', superviviente['id']).execute()
+            eliminadas += len(sobrantes)
+        
+        logger.info(f"✅ {tabla} deduplicada: {eliminadas} filas repetidas eliminadas de {sum(map(len, grupos.values()))}")
+        return eliminadas
+    
+    def calentar(self, cargar_indices: bool = True):
+        """
+        Preparar el sistema antes de la primera petición real: encodes de prueba
+        (inicialización perezosa y reserva de memoria del backend) y carga de los índices
+        """
+        inicio = time.time()
+        self.modelo.encode(['calentamiento del modelo'], normalize_embeddings=True, show_progress_bar=False)
+        self.modelo.encode(['calentamiento'] * 8, batch_size=8, normalize_embeddings=True, show_progress_bar=False)
+        
+        if cargar_indices and self.modo_busqueda == 'local':
+            for tabla in self.sincronizadores:
+                try:
+                    self._asegurar_indice(tabla)
+                except Exception as e:
+                    logger.warning(f"⚠️ No se pudo precargar el índice de {tabla}: {e}")
+        
+        logger.info(f"🔥 Embeddings calientes en {time.time() - inicio:.2f}s")
+    
+    def sincronizar_indices(self) -> Dict[str, Optional[Dict[str, int]]]:
+        """
+        Aplicar el delta pendiente a los índices residentes (y publicarlo en el almacén
+        si este proceso es el escritor); las tablas que un lector busca en el almacén
+        compartido no se descargan
+        """
+        return {tabla: s.sincronizar() for tabla, s in self.sincronizadores.items()
+                if tabla not in self.almacenes}
+    
+    def _bucle_sincronizacion(self):
+        """Hilo que llama a sincronizar_indices cada intervalo_sincronizacion segundos"""
+        while not self._detener_sincronizacion.wait(self.intervalo_sincronizacion):
+            try:
+                self.sincronizar_indices()
+            except Exception as e:
+                logger.warning(f"⚠️ Error en la sincronización periódica de índices: {e}")
+    
+    def recargar_indice(self, tabla: str = None):
+        """Forzar la recarga completa de los índices vectoriales (o sólo el de una tabla)"""
+        for nombre, sincronizador in self.sincronizadores.items():
+            if tabla is None or nombre == tabla:
+                sincronizador.sincronizar_completo()
     
     def generar_embedding(self, texto: str) -> List[float]:
-        """Generar embedding para un texto"""
+        """Generar embedding para un texto (usando el cache si ya se codificó)"""
+        inicio = time.perf_counter()
         try:
-            embedding = self.modelo.encode([texto])[0]
+            embedding = self.cache.obtener(texto)
+            origen = 'cache'
+            if embedding is None:
+                if self.codificador_lotes:
+                    embedding = self.codificador_lotes.codificar(texto)
+                    origen = 'microlote'
+                else:
+                    embedding = self.modelo.encode([texto], normalize_embeddings=True)[0]
+                    origen = 'modelo'
+                self.cache.guardar(texto, embedding)
+            DURACION_EMBEDDINGS.observar(time.perf_counter() - inicio, origen)
             return embedding.tolist()
         except Exception as e:
             logger.error(f"Error generando embedding: {e}")
             return []
     
+    def generar_embeddings_lote(self, textos: List[str], tamano_lote: int = None) -> List[List[float]]:
+        """
+        Generar embeddings para una lista de textos en llamadas por lotes al modelo
+        
+        Args:
+            textos: Textos a codificar
+            tamano_lote: Textos por llamada al modelo (por defecto self.tamano_lote)
+        
+        Returns:
+            Lista de embeddings en el mismo orden (vacía si hubo error)
+        """
+        if not textos:
+            return []
+        try:
+            embeddings = [self.cache.obtener(texto) for texto in textos]
+            
+            # Codificar sólo los textos que no estaban en el cache
+            pendientes = [i for i, embedding in enumerate(embeddings) if embedding is None]
+            if pendientes:
+                nuevos = self.modelo.encode(
+                    [textos[i] for i in pendientes],
+                    batch_size=tamano_lote or self.tamano_lote,
+                    normalize_embeddings=True,
+                    show_progress_bar=False
+                )
+                for i, embedding in zip(pendientes, nuevos):
+                    self.cache.guardar(textos[i], embedding)
+                    embeddings[i] = embedding
+            
+            return [embedding.tolist() for embedding in embeddings]
+        except Exception as e:
+            logger.error(f"Error generando embeddings por lote: {e}")
+            return []
+    
+    def crear_contexto(self, consulta: str) -> ContextoConsulta:
+        """Crear el contexto de una petición codificando la consulta una sola vez"""
+        return ContextoConsulta(texto=consulta, embedding=self.generar_embedding(consulta))
+    
+    def _embedding_consulta(self, consulta: str, contexto: Optional[ContextoConsulta]) -> List[float]:
+        """Reutilizar el embedding del contexto si corresponde a la misma consulta"""
+        if contexto is not None and contexto.texto == consulta and contexto.embedding:
+            return contexto.embedding
+        return self.generar_embedding(consulta)
+    
+    def _insertar_filas(self, tabla: str, filas: List[Dict], lote: str = None) -> List[Dict]:
+        """
+        Un insert masivo; lanza la excepción del cliente si falla
+        
+        Con deduplicación se usa el upsert RPC: las filas cuyo contenido ya existe
+        en la categoría sólo incrementan su frecuencia y se devuelven igualmente.
+        
+        Args:
+            lote: Clave estable del lote para quien reintenta: repetir el mismo upsert
+                  ya confirmado no vuelve a sumar frecuencia (None = cada llamada suma)
+        """
+        if self.deduplicar:
+            filas_rpc = agrupar_duplicados(filas)
+            if lote:
+                filas_rpc = [{**fila, 'lote_id': lote} for fila in filas_rpc]
+            try:
+                return self.supabase.rpc(FUNCIONES_UPSERT[tabla], {'filas': filas_rpc}).execute().data or []
+            except Exception as e:
+                # PGRST202: la función no existe (esquema sin migrar)
+                if 'PGRST202' not in str(e):
+                    raise
+                logger.warning("⚠️ Funciones de upsert no encontradas (ver schema_supabase.sql): deduplicación desactivada")
+                self.deduplicar = False
+        
+        filas = [{k: v for k, v in fila.items() if k != 'contenido_hash'} for fila in filas]
+        return self.supabase.table(tabla).insert(filas).execute().data or []
+    
+    def _encolar(self, tabla: str, filas: List[Dict]) -> bool:
+        """Dejar las filas en la escritura diferida (False si está desactivada o llena)"""
+        return self.escritura_diferida is not None and self.escritura_diferida.encolar(tabla, filas)
+    
+    @property
+    def filas_descartadas(self) -> int:
+        """Filas encoladas que la escritura diferida descartó tras agotar los reintentos"""
+        return self.escritura_diferida.filas_descartadas if self.escritura_diferida else 0
+    
+    def vaciar_escrituras(self, timeout: float = None) -> bool:
+        """Esperar a que se inserten las filas pendientes de la escritura diferida"""
+        return self.escritura_diferida.vaciar(timeout) if self.escritura_diferida else True
+    
+    def cerrar(self):
+        """Vaciar la escritura diferida y detener los hilos de fondo"""
+        _SISTEMAS_ABIERTOS.discard(self)
+        self._detener_sincronizacion.set()
+        if self.retencion:
+            self.retencion.detener()
+        if self.escritura_diferida:
+            self.escritura_diferida.cerrar()
+        if self.codificador_lotes:
+            self.codificador_lotes.cerrar()
+    
+    def _insertar_lotes(self, tabla: str, filas: List[Dict], tamano_lote: int,
+                        clave_lote: str = None) -> List[Dict]:
+        """Insertar filas con un insert masivo por lote y devolver las filas creadas"""
+        insertadas = []
+        for inicio in range(0, len(filas), tamano_lote):
+            lote = filas[inicio:inicio + tamano_lote]
+            try:
+                insertadas.extend(self._insertar_filas(tabla, lote, f"{clave_lote}:{inicio}" if clave_lote else None))
+            except Exception as e:
+                logger.error(f"Error insertando lote en {tabla}: {e}")
+        return insertadas
+    
     def agregar_texto(self, 
                       texto: str, 
                       categoria: str = 'general',
@@ -108,18 +676,25 @@ class ARIAEmbeddingsSupabase:
             # Preparar datos
             datos = {
                 'texto': texto,
-                'embedding': embedding,
+                **self._payload_vector(embedding),
                 'categoria': categoria,
                 'subcategoria': subcategoria,
                 'fuente': fuente,
                 'idioma': idioma,
-                'metadatos': metadatos or {}
+                'metadatos': metadatos or {},
+                'contenido_hash': hash_contenido(texto)
             }
             
+            # Con escritura diferida la petición no espera al insert
+            if self._encolar('aria_embeddings', [datos]):
+                return True
+            
             # Insertar en Supabase
-            resultado = self.supabase.table('aria_embeddings').insert(datos).execute()
+            insertadas = self._insertar_filas('aria_embeddings', [datos])
             
-            if resultado.data:
+            if insertadas:
+                # Mantener el índice sincronizado con la tabla
+                self.sincronizadores['aria_embeddings'].aplicar(insertadas)
                 logger.info(f"✅ Texto agregado: {texto[:50]}...")
                 return True
             else:
@@ -130,11 +705,85 @@ class ARIAEmbeddingsSupabase:
             logger.error(f"Error agregando texto: {e}")
             return False
     
+    def agregar_textos_lote(self, textos: List[Dict[str, Any]], tamano_lote: int = None,
+                            diferir: bool = True, clave_lote: str = None) -> int:
+        """
+        Agregar varios textos con sus embeddings usando un insert masivo por lote
+        
+        Args:
+            textos: Diccionarios con 'texto' y, opcionalmente, los mismos campos
+                    que acepta agregar_texto (categoria, subcategoria, fuente, idioma, metadatos)
+            tamano_lote: Textos por llamada al modelo y filas por insert
+            diferir: False para insertar ya aunque haya escritura diferida (quien ya
+                     reintenta por su cuenta, como la cola de trabajos, necesita saber si falló)
+            clave_lote: Clave estable entre reintentos (p. ej. la del trabajo): repetir un
+                        insert ya confirmado no vuelve a sumar frecuencia
+        
+        Returns:
+            int: Número de textos insertados (0 si quedaron en la escritura diferida:
+                 su resultado final se refleja en filas_descartadas)
+        """
+        tamano_lote = tamano_lote or self.tamano_lote
+        textos = [t for t in textos if t.get('texto')]
+        
+        embeddings = self.generar_embeddings_lote([t['texto'] for t in textos], tamano_lote)
+        if len(embeddings) != len(textos):
+            return 0
+        
+        filas = [{
+            'texto': t['texto'],
+            **self._payload_vector(embedding),
+            'categoria': t.get('categoria', 'general'),
+            'subcategoria': t.get('subcategoria'),
+            'fuente': t.get('fuente', 'conversation'),
+            'idioma': t.get('idioma', 'es'),
+            'metadatos': t.get('metadatos') or {},
+            'contenido_hash': hash_contenido(t['texto'])
+        } for t, embedding in zip(textos, embeddings)]
+        
+        if diferir and self._encolar('aria_embeddings', filas):
+            logger.debug(f"📥 {len(filas)} textos en la escritura diferida")
+            return 0
+        
+        insertadas = self._insertar_lotes('aria_embeddings', filas, tamano_lote, clave_lote)
+        
+        # Mantener el índice sincronizado con la tabla
+        self.sincronizadores['aria_embeddings'].aplicar(insertadas)
+        
+        logger.info(f"✅ {len(insertadas)}/{len(filas)} textos agregados por lote")
+        return len(insertadas)
+    
+    def _proyectar(self,
+                   tabla: str,
+                   filas: List[Dict],
+                   campos: Optional[Tuple[str, ...]] = None,
+                   incluir_vectores: bool = False) -> List[Dict]:
+        """
+        Reducir los resultados a los campos pedidos (más id y puntuaciones)
+        
+        Los vectores nunca viven en las filas de los índices: sólo se descargan
+        (float32 exactos) cuando se piden expresamente.
+        """
+        if campos:
+            conservar = set(campos).union(CAMPOS_PUNTUACION)
+            filas = [{k: v for k, v in fila.items() if k in conservar} for fila in filas]
+        
+        if incluir_vectores and filas:
+            resultado = self.supabase.table(tabla).select('id, embedding')\
+                .in_('id', [f['id'] for f in filas]).execute()
+            vectores = {f['id']: parsear_embedding(f['embedding']) for f in resultado.data or []}
+            for fila in filas:
+                fila['embedding'] = vectores.get(fila['id'])
+        return filas
+    
     def buscar_similares(self, 
                          consulta: str, 
                          limite: int = 5,
                          categoria: str = None,
-                         umbral_similitud: float = 0.7) -> List[Dict]:
+                         umbral_similitud: float = 0.7,
+                         contexto: ContextoConsulta = None,
+                         campos: Optional[Tuple[str, ...]] = None,
+                         incluir_vectores: bool = False) -> List[Dict]:
         """
         Buscar textos similares a una consulta
         
@@ -143,54 +792,105 @@ class ARIAEmbeddingsSupabase:
             limite: Número máximo de resultados
             categoria: Filtrar por categoría específica
             umbral_similitud: Similitud mínima (0-1)
+            contexto: Contexto de la petición con el embedding ya calculado
+            campos: Campos a devolver de cada fila (None = todos los del índice)
+            incluir_vectores: Añadir el 'embedding' de cada resultado
         
         Returns:
             Lista de textos similares con sus similitudes
         """
+        resultados = self._buscar_similares(consulta, limite, categoria, umbral_similitud, contexto)
+        return self._proyectar('aria_embeddings', resultados, campos, incluir_vectores)
+    
+    def _buscar_similares(self,
+                          consulta: str,
+                          limite: int,
+                          categoria: str,
+                          umbral_similitud: float,
+                          contexto: Optional[ContextoConsulta]) -> List[Dict]:
+        """Ranking de buscar_similares (índice residente o RPC)"""
         try:
-            # Generar embedding de la consulta
-            embedding_consulta = self.generar_embedding(consulta)
+            # Generar embedding de la consulta (o reutilizar el del contexto)
+            embedding_consulta = self._embedding_consulta(consulta, contexto)
             if not embedding_consulta:
                 return []
             
-            # Construir query base
-            query = self.supabase.table('aria_embeddings').select('*')
-            
-            # Filtrar por categoría si se especifica
-            if categoria:
-                query = query.eq('categoria', categoria)
-            
-            # Ejecutar búsqueda
-            resultado = query.execute()
-            
-            if not resultado.data:
-                return []
-            
-            # Calcular similitudes manualmente (ya que pgvector se maneja en SQL)
-            similitudes = []
-            embedding_np = np.array(embedding_consulta)
-            
-            for item in resultado.data:
-                embedding_item = np.array(item['embedding'])
-                
-                # Calcular similitud coseno
-                similitud = np.dot(embedding_np, embedding_item) / (
-                    np.linalg.norm(embedding_np) * np.linalg.norm(embedding_item)
+            # Ranking dentro de Postgres con pgvector
+            if self.modo_busqueda == 'rpc':
+                return self._buscar_similares_rpc(
+                    embedding_consulta, limite, categoria, umbral_similitud
                 )
-                
-                if similitud >= umbral_similitud:
-                    item['similitud'] = float(similitud)
-                    similitudes.append(item)
             
-            # Ordenar por similitud descendente
-            similitudes.sort(key=lambda x: x['similitud'], reverse=True)
+            # Buscar en el índice residente (un solo producto matriz-vector)
+            indice = self._asegurar_indice('aria_embeddings')
+            if self.precision == 'float32' or not self.reordenar_exacto:
+                return indice.buscar(
+                    embedding_consulta,
+                    limite=limite,
+                    categoria=categoria,
+                    umbral_similitud=umbral_similitud
+                )
             
-            return similitudes[:limite]
+            # Índice cuantizado: preselección amplia y reordenamiento exacto del top-k
+            candidatos = indice.buscar(
+                embedding_consulta,
+                limite=limite * self.factor_reordenamiento,
+                categoria=categoria,
+                umbral_similitud=umbral_similitud - 0.05 if umbral_similitud is not None else None
+            )
+            return self._reordenar_exacto('aria_embeddings', embedding_consulta, candidatos,
+                                          limite, umbral_similitud)
             
         except Exception as e:
             logger.error(f"Error buscando similares: {e}")
             return []
     
+    def _reordenar_exacto(self,
+                          tabla: str,
+                          embedding_consulta: List[float],
+                          candidatos: List[Dict],
+                          limite: int,
+                          umbral_similitud: float = None) -> List[Dict]:
+        """
+        Recalcular la similitud de los candidatos con sus embeddings float32 completos
+
+        Sólo con ARIA_EMBEDDINGS_REORDENAR=1: descarga los vectores exactos de los
+        candidatos en una consulta adicional a Supabase.
+        """
+        if not candidatos:
+            return []
+        
+        ids = [c['id'] for c in candidatos]
+        resultado = self.supabase.table(tabla).select('id, embedding').in_('id', ids).execute()
+        vectores = {f['id']: parsear_embedding(f['embedding']) for f in resultado.data or []}
+        
+        # Un único producto matriz-vector; los candidatos sin vector conservan su similitud aproximada
+        exactos = [i for i, c in enumerate(candidatos) if c['id'] in vectores]
+        similitudes = np.asarray([c['similitud'] for c in candidatos], dtype=np.float32)
+        if exactos:
+            matriz = np.asarray([vectores[candidatos[i]['id']] for i in exactos], dtype=np.float32)
+            similitudes[exactos] = matriz @ np.asarray(embedding_consulta, dtype=np.float32)
+        
+        resultados = []
+        for i in seleccionar_top_k(similitudes, limite, umbral_similitud):
+            candidatos[i]['similitud'] = float(similitudes[i])
+            resultados.append(candidatos[i])
+        return resultados
+    
+    def _buscar_similares_rpc(self,
+                              embedding_consulta: List[float],
+                              limite: int,
+                              categoria: str = None,
+                              umbral_similitud: float = 0.7) -> List[Dict]:
+        """Buscar textos similares con la función SQL match_aria_embeddings"""
+        resultado = self.supabase.rpc('match_aria_embeddings', {
+            'query_embedding': embedding_consulta,
+            'match_threshold': umbral_similitud,
+            'match_count': limite,
+            'filtro_categoria': categoria or None
+        }).execute()
+        return resultado.data or []
+    
     def agregar_conocimiento(self,
                            concepto: str,
                            descripcion: str,
@@ -224,18 +924,24 @@ class ARIAEmbeddingsSupabase:
             datos = {
                 'concepto': concepto,
                 'descripcion': descripcion,
-                'embedding': embedding,
+                **self._payload_vector(embedding),
                 'categoria': categoria,
                 'tags': tags or [],
                 'confianza': confianza,
                 'ejemplos': ejemplos or [],
-                'relaciones': relaciones or {}
+                'relaciones': relaciones or {},
+                # Clave del concepto: el upsert actualiza descripción y vector si ya existe
+                'contenido_hash': hash_contenido(concepto)
             }
             
+            if self._encolar('aria_knowledge_vectors', [datos]):
+                return True
+            
             # Insertar en Supabase
-            resultado = self.supabase.table('aria_knowledge_vectors').insert(datos).execute()
+            insertadas = self._insertar_filas('aria_knowledge_vectors', [datos])
             
-            if resultado.data:
+            if insertadas:
+                self.sincronizadores['aria_knowledge_vectors'].aplicar(insertadas)
                 logger.info(f"✅ Conocimiento agregado: {concepto}")
                 return True
             else:
@@ -246,75 +952,234 @@ class ARIAEmbeddingsSupabase:
             logger.error(f"Error agregando conocimiento: {e}")
             return False
     
-    def buscar_conocimiento(self, consulta: str, limite: int = 3) -> List[Dict]:
+    def agregar_conocimientos_lote(self, conocimientos: List[Dict[str, Any]], tamano_lote: int = None,
+                                   diferir: bool = True, clave_lote: str = None) -> int:
+        """
+        Agregar varios conocimientos con sus embeddings usando un insert masivo por lote
+        
+        Args:
+            conocimientos: Diccionarios con 'concepto', 'descripcion' y, opcionalmente,
+                           los mismos campos que acepta agregar_conocimiento
+            tamano_lote: Descripciones por llamada al modelo y filas por insert
+            diferir: False para insertar ya aunque haya escritura diferida
+            clave_lote: Clave estable entre reintentos (ver agregar_textos_lote)
+        
+        Returns:
+            int: Número de conocimientos insertados (0 si quedaron en la escritura
+                 diferida: su resultado final se refleja en filas_descartadas)
+        """
+        tamano_lote = tamano_lote or self.tamano_lote
+        conocimientos = [c for c in conocimientos if c.get('concepto') and c.get('descripcion')]
+        
+        embeddings = self.generar_embeddings_lote([c['descripcion'] for c in conocimientos], tamano_lote)
+        if len(embeddings) != len(conocimientos):
+            return 0
+        
+        filas = [{
+            'concepto': c['concepto'],
+            'descripcion': c['descripcion'],
+            **self._payload_vector(embedding),
+            'categoria': c.get('categoria', 'knowledge'),
+            'tags': c.get('tags') or [],
+            'confianza': c.get('confianza', 0.8),
+            'ejemplos': c.get('ejemplos') or [],
+            'relaciones': c.get('relaciones') or {},
+            'contenido_hash': hash_contenido(c['concepto'])
+        } for c, embedding in zip(conocimientos, embeddings)]
+        
+        if diferir and self._encolar('aria_knowledge_vectors', filas):
+            logger.debug(f"📥 {len(filas)} conocimientos en la escritura diferida")
+            return 0
+        
+        insertadas = self._insertar_lotes('aria_knowledge_vectors', filas, tamano_lote, clave_lote)
+        self.sincronizadores['aria_knowledge_vectors'].aplicar(insertadas)
+        
+        logger.info(f"✅ {len(insertadas)}/{len(filas)} conocimientos agregados por lote")
+        return len(insertadas)
+    
+    def buscar_conocimiento(self,
+                            consulta: str,
+                            limite: int = 3,
+                            categoria: str = None,
+                            contexto: ContextoConsulta = None,
+                            campos: Optional[Tuple[str, ...]] = None,
+                            incluir_vectores: bool = False) -> List[Dict]:
         """
         Buscar conocimiento relacionado con una consulta
         
         Args:
             consulta: Texto de búsqueda
             limite: Número máximo de resultados
+            categoria: Filtrar por categoría específica
+            contexto: Contexto de la petición con el embedding ya calculado
+            campos: Campos a devolver de cada fila (None = todos los del índice)
+            incluir_vectores: Añadir el 'embedding' de cada resultado
         
         Returns:
             Lista de conocimientos relacionados
         """
+        resultados = self._buscar_conocimiento(consulta, limite, categoria, contexto)
+        return self._proyectar('aria_knowledge_vectors', resultados, campos, incluir_vectores)
+    
+    def _buscar_conocimiento(self,
+                             consulta: str,
+                             limite: int,
+                             categoria: str,
+                             contexto: Optional[ContextoConsulta]) -> List[Dict]:
+        """Ranking de buscar_conocimiento (híbrido, índice residente o RPC)"""
         try:
-            # Generar embedding de la consulta
-            embedding_consulta = self.generar_embedding(consulta)
+            # Generar embedding de la consulta (o reutilizar el del contexto)
+            embedding_consulta = self._embedding_consulta(consulta, contexto)
             if not embedding_consulta:
                 return []
             
-            # Obtener todos los conocimientos
-            resultado = self.supabase.table('aria_knowledge_vectors').select('*').execute()
+            # Ranking dentro de Postgres con pgvector
+            if self.modo_busqueda == 'rpc':
+                return self._buscar_conocimiento_rpc(embedding_consulta, limite, categoria)
             
-            if not resultado.data:
-                return []
-            
-            # Calcular similitudes
-            similitudes = []
-            embedding_np = np.array(embedding_consulta)
-            
-            for item in resultado.data:
-                embedding_item = np.array(item['embedding'])
-                
-                # Calcular similitud coseno
-                similitud = np.dot(embedding_np, embedding_item) / (
-                    np.linalg.norm(embedding_np) * np.linalg.norm(embedding_item)
-                )
-                
-                item['similitud'] = float(similitud)
-                similitudes.append(item)
+            # Buscar en el índice residente de conocimiento
+            indice = self._asegurar_indice('aria_knowledge_vectors')
+            if self.busqueda_hibrida and len(self.bm25_conocimiento) and isinstance(indice, ARIAPartitionedIndex):
+                return self._buscar_conocimiento_hibrido(consulta, embedding_consulta, indice, limite, categoria)
             
-            # Ordenar por similitud descendente
-            similitudes.sort(key=lambda x: x['similitud'], reverse=True)
+            if self.precision == 'float32' or not self.reordenar_exacto:
+                return indice.buscar(embedding_consulta, limite=limite, categoria=categoria)
             
-            return similitudes[:limite]
+            candidatos = indice.buscar(
+                embedding_consulta,
+                limite=limite * self.factor_reordenamiento,
+                categoria=categoria
+            )
+            return self._reordenar_exacto('aria_knowledge_vectors', embedding_consulta, candidatos, limite)
             
         except Exception as e:
             logger.error(f"Error buscando conocimiento: {e}")
             return []
     
+    def _buscar_conocimiento_hibrido(self,
+                                     consulta: str,
+                                     embedding_consulta: List[float],
+                                     indice: ARIAPartitionedIndex,
+                                     limite: int,
+                                     categoria: str = None) -> List[Dict]:
+        """
+        Fusionar por RRF el ranking vectorial y el BM25 (concepto/descripcion/tags)
+        
+        Sólo la lista corta fusionada se puntúa con los vectores: las filas que
+        llegan únicamente por BM25 obtienen su similitud del índice residente.
+        """
+        amplitud = limite * self.factor_reordenamiento
+        vectoriales = indice.buscar(embedding_consulta, limite=amplitud, categoria=categoria)
+        lexicos = self.bm25_conocimiento.buscar(consulta, limite=amplitud, categoria=categoria)
+        if not lexicos:
+            candidatos = vectoriales[:amplitud]
+            if self.precision == 'float32' or not self.reordenar_exacto:
+                return candidatos[:limite]
+            return self._reordenar_exacto('aria_knowledge_vectors', embedding_consulta, candidatos, limite)
+        
+        fusion = fusionar_rrf([f['id'] for f in vectoriales], [i for i, _ in lexicos])[:limite]
+        puntuaciones_bm25 = dict(lexicos)
+        
+        filas = {f['id']: f for f in vectoriales}
+        faltantes = [i for i, _ in fusion if i not in filas]
+        for fila in indice.puntuar_ids(embedding_consulta, faltantes):
+            filas[fila['id']] = fila
+        
+        resultados = []
+        for identificador, puntuacion in fusion:
+            if identificador in filas:
+                fila = filas[identificador]
+                fila['puntuacion_hibrida'] = puntuacion
+                fila['bm25'] = puntuaciones_bm25.get(identificador, 0.0)
+                resultados.append(fila)
+        
+        # Similitudes exactas para el índice cuantizado, manteniendo el orden de la fusión
+        if self.precision != 'float32' and self.reordenar_exacto:
+            self._reordenar_exacto('aria_knowledge_vectors', embedding_consulta, list(resultados), len(resultados))
+        return resultados
+    
+    def _buscar_conocimiento_rpc(self,
+                                 embedding_consulta: List[float],
+                                 limite: int,
+                                 categoria: str = None) -> List[Dict]:
+        """Buscar conocimiento con la función SQL match_aria_knowledge"""
+        resultado = self.supabase.rpc('match_aria_knowledge', {
+            'query_embedding': embedding_consulta,
+            'match_count': limite,
+            'filtro_categoria': categoria or None
+        }).execute()
+        return resultado.data or []
+    
+    def _conteos_sql(self) -> Optional[Dict[str, Dict[Optional[str], int]]]:
+        """Conteos por categoría de la tabla aria_vector_conteos (mantenida por triggers)"""
+        if not self._con_conteos:
+            return None
+        try:
+            resultado = self.supabase.table(TABLA_CONTEOS).select('tabla, categoria, total')\
+                .gt('total', 0).execute()
+        except Exception as e:
+            # Tabla inexistente (esquema sin migrar): no volver a intentarlo
+            if es_error_esquema(e):
+                logger.warning(f"⚠️ Tabla {TABLA_CONTEOS} no disponible: estadísticas desde los índices")
+                self._con_conteos = False
+            else:
+                logger.warning(f"⚠️ Error leyendo {TABLA_CONTEOS}: {e}")
+            return None
+        
+        conteos = {tabla: {} for tabla in self.sincronizadores}
+        for fila in resultado.data or []:
+            conteos.setdefault(fila['tabla'], {})[fila['categoria']] = fila['total']
+        return conteos
+    
+    def _conteos_indices(self) -> Optional[Dict[str, Dict[Optional[str], int]]]:
+        """Conteos por categoría de los índices residentes (si ya están cargados)"""
+        if self.almacenes or not all(s.cargado for s in self.sincronizadores.values()):
+            return None
+        return {tabla: s.indice.categorias() for tabla, s in self.sincronizadores.items()}
+    
+    def _conteos_tablas(self) -> Dict[str, Dict[Optional[str], int]]:
+        """Último recurso: recorrer las tablas (sólo id y categoría, por páginas)"""
+        conteos = {}
+        for tabla in self.sincronizadores:
+            categorias: Dict[Optional[str], int] = {}
+            ultimo_id = 0
+            while True:
+                filas = self.supabase.table(tabla).select('id, categoria')\
+                    .gt('id', ultimo_id).order('id').limit(self.tamano_pagina).execute().data or []
+                for fila in filas:
+                    categorias[fila['categoria']] = categorias.get(fila['categoria'], 0) + 1
+                if len(filas) < self.tamano_pagina:
+                    break
+                ultimo_id = filas[-1]['id']
+            conteos[tabla] = categorias
+        return conteos
+    
     def obtener_estadisticas(self) -> Dict:
-        """Obtener estadísticas de la base de embeddings"""
+        """
+        Obtener estadísticas de la base de embeddings
+        
+        Fuentes por orden: aria_vector_conteos y los índices residentes (ambas
+        proporcionales al número de categorías) y, si no hay ninguna, las tablas.
+        """
         try:
-            # Contar embeddings por categoría
-            resultado_embeddings = self.supabase.table('aria_embeddings').select('categoria').execute()
-            resultado_knowledge = self.supabase.table('aria_knowledge_vectors').select('categoria').execute()
-            
-            categorias_embeddings = {}
-            for item in resultado_embeddings.data:
-                cat = item['categoria']
-                categorias_embeddings[cat] = categorias_embeddings.get(cat, 0) + 1
-            
-            categorias_knowledge = {}
-            for item in resultado_knowledge.data:
-                cat = item['categoria']
-                categorias_knowledge[cat] = categorias_knowledge.get(cat, 0) + 1
+            fuente = 'sql'
+            conteos = self._conteos_sql()
+            if conteos is None:
+                fuente = 'indices'
+                conteos = self._conteos_indices()
+            if conteos is None:
+                fuente = 'tablas'
+                conteos = self._conteos_tablas()
             
+            categorias_embeddings = conteos.get('aria_embeddings', {})
+            categorias_knowledge = conteos.get('aria_knowledge_vectors', {})
             return {
-                'total_embeddings': len(resultado_embeddings.data),
-                'total_knowledge': len(resultado_knowledge.data),
+                'total_embeddings': sum(categorias_embeddings.values()),
+                'total_knowledge': sum(categorias_knowledge.values()),
                 'categorias_embeddings': categorias_embeddings,
-                'categorias_knowledge': categorias_knowledge
+                'categorias_knowledge': categorias_knowledge,
+                'filas_descartadas': self.filas_descartadas,
+                'fuente': fuente
             }
             
         except Exception as e:
@@ -324,10 +1189,16 @@ class ARIAEmbeddingsSupabase:
     def limpiar_categoria(self, categoria: str) -> bool:
         """Eliminar todos los embeddings de una categoría"""
         try:
+            # Que no quede ninguna fila de la categoría por insertar después del delete
+            self.vaciar_escrituras(timeout=30)
             # Eliminar de embeddings
             self.supabase.table('aria_embeddings').delete().eq('categoria', categoria).execute()
             # Eliminar de knowledge
             self.supabase.table('aria_knowledge_vectors').delete().eq('categoria', categoria).execute()
+            # Eliminar de los índices residentes (las lápidas llegarán también en el próximo delta)
+            self.indice.eliminar_categoria(categoria)
+            self.indice_conocimiento.eliminar_categoria(categoria)
+            self.bm25_conocimiento.eliminar_categoria(categoria)
             
             logger.info(f"✅ Categoría '{categoria}' limpiada")
             return True
@@ -364,11 +1235,11 @@ def test_embedding_system():
     ]
     
     print("\n📝 Agregando textos de prueba...")
-    for texto, categoria, subcategoria in textos_prueba:
-        if system.agregar_texto(texto, categoria, subcategoria):
-            print(f"✅ {texto[:30]}...")
-        else:
-            print(f"❌ Error con: {texto[:30]}...")
+    agregados = system.agregar_textos_lote([
+        {'texto': texto, 'categoria': categoria, 'subcategoria': subcategoria}
+        for texto, categoria, subcategoria in textos_prueba
+    ], diferir=False)
+    print(f"✅ {agregados}/{len(textos_prueba)} textos agregados")
     
     # Probar búsquedas
     consultas = [
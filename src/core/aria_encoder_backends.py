@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+⚙️ ARIA ENCODER BACKENDS
+=======================
+
+Backends de inferencia intercambiables para el modelo de embeddings.
+Todos exponen el mismo encode() que SentenceTransformer y devuelven los
+mismos vectores de 384 dimensiones normalizados.
+
+Backends (ARIA_EMBEDDINGS_BACKEND):
+    torch      -> SentenceTransformer sobre PyTorch (por defecto)
+    onnx       -> grafo ONNX ejecutado con ONNX Runtime en CPU
+    onnx-int8  -> el mismo grafo con cuantización dinámica int8 de los pesos
+
+Características:
+✅ Exportación del grafo ONNX una sola vez (se reutiliza entre arranques)
+✅ Cuantización dinámica int8 con onnxruntime.quantization
+✅ Lotes ordenados por longitud para minimizar el padding
+✅ Verificación de paridad (similitud coseno) contra el backend PyTorch, con umbral por backend
+
+Fecha: 25 de octubre de 2025
+"""
+
+import os
+import numpy as np
+from typing import Dict, List, Union
+import logging
+
+try:
+    import onnxruntime as ort
+    ONNX_AVAILABLE = True
+except ImportError:
+    ort = None
+    ONNX_AVAILABLE = False
+
+try:
+    from core.aria_vector_quantization import normalizar
+except ImportError:
+    from aria_vector_quantization import normalizar
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ('torch', 'onnx', 'onnx-int8')
+
+# Longitud máxima de secuencia de all-MiniLM-L6-v2
+LONGITUD_MAXIMA = 256
+
+# Similitud coseno mínima por texto frente a PyTorch para dar un backend por bueno
+UMBRALES_PARIDAD = {'onnx': 0.99, 'onnx-int8': 0.97}
+
+
+class CodificadorONNX:
+    """Codificador de sentence-transformers ejecutado con ONNX Runtime"""
+
+    def __init__(self, nombre_modelo: str, cuantizado: bool = False, directorio: str = None, hilos: int = 0):
+        """
+        Preparar (exportar si hace falta) el grafo ONNX y abrir la sesión
+
+        Args:
+            nombre_modelo: Modelo de sentence-transformers (p. ej. 'all-MiniLM-L6-v2')
+            cuantizado: Aplicar cuantización dinámica int8 a los pesos
+            directorio: Carpeta donde se guardan los grafos exportados
+            hilos: Hilos intra-op de ONNX Runtime (0 = valor por defecto)
+        """
+        if not ONNX_AVAILABLE:
+            raise ImportError("onnxruntime no está instalado (pip install onnxruntime)")
+
+        from transformers import AutoTokenizer
+
+        self.nombre_modelo = nombre_modelo
+        self.repositorio = nombre_modelo if '/' in nombre_modelo else f"sentence-transformers/{nombre_modelo}"
+        self.directorio = os.path.join(directorio or os.path.join('data', 'onnx'), self.repositorio.replace('/', '__'))
+        os.makedirs(self.directorio, exist_ok=True)
+
+        self.tokenizador = AutoTokenizer.from_pretrained(self.repositorio)
+        ruta = self._preparar_grafo()
+        if cuantizado:
+            ruta = self._cuantizar(ruta)
+
+        opciones = ort.SessionOptions()
+        opciones.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if hilos:
+            opciones.intra_op_num_threads = hilos
+        self.sesion = ort.InferenceSession(ruta, opciones, providers=['CPUExecutionProvider'])
+        self.entradas = {e.name for e in self.sesion.get_inputs()}
+        self.dimension = self._dimension_salida()
+        logger.info(f"✅ Codificador ONNX listo ({os.path.basename(ruta)})")
+
+    def _dimension_salida(self) -> int:
+        """Tamaño oculto del modelo: la última dimensión (fija) de last_hidden_state"""
+        dimension = self.sesion.get_outputs()[0].shape[-1]
+        if isinstance(dimension, int):
+            return dimension
+        from transformers import AutoConfig
+        return AutoConfig.from_pretrained(self.repositorio).hidden_size
+
+    def get_sentence_embedding_dimension(self) -> int:
+        """Misma interfaz que SentenceTransformer"""
+        return self.dimension
+
+    def _preparar_grafo(self) -> str:
+        """Ruta al grafo ONNX en float32: se exporta desde PyTorch si no existe"""
+        ruta = os.path.join(self.directorio, 'model.onnx')
+        if os.path.exists(ruta):
+            return ruta
+
+        import torch
+        from transformers import AutoModel
+
+        logger.info(f"🔧 Exportando {self.repositorio} a ONNX...")
+        modelo = AutoModel.from_pretrained(self.repositorio).eval()
+        ejemplo = self.tokenizador(['hola mundo'], return_tensors='pt')
+        nombres = [n for n in ('input_ids', 'attention_mask', 'token_type_ids') if n in ejemplo]
+        ejes = {n: {0: 'lote', 1: 'secuencia'} for n in nombres}
+        ejes['last_hidden_state'] = {0: 'lote', 1: 'secuencia'}
+
+        temporal = f"{ruta}.tmp"
+        with torch.no_grad():
+            torch.onnx.export(
+                modelo,
+                tuple(ejemplo[n] for n in nombres),
+                temporal,
+                input_names=nombres,
+                output_names=['last_hidden_state'],
+                dynamic_axes=ejes,
+                opset_version=14
+            )
+        os.replace(temporal, ruta)
+        return ruta
+
+    def _cuantizar(self, ruta: str) -> str:
+        """Versión con pesos int8 (cuantización dinámica) del grafo"""
+        destino = os.path.join(self.directorio, 'model_int8.onnx')
+        if not os.path.exists(destino):
+            from onnxruntime.quantization import quantize_dynamic, QuantType
+
+            logger.info("🔧 Cuantizando el grafo ONNX a int8...")
+            temporal = f"{destino}.tmp"
+            quantize_dynamic(ruta, temporal, weight_type=QuantType.QInt8)
+            os.replace(temporal, destino)
+        return destino
+
+    def _codificar_lote(self, textos: List[str]) -> np.ndarray:
+        """Tokenizar, ejecutar el grafo y aplicar mean pooling con la máscara de atención"""
+        tokens = self.tokenizador(
+            textos, padding=True, truncation=True, max_length=LONGITUD_MAXIMA, return_tensors='np'
+        )
+        entradas = {n: tokens[n].astype(np.int64) for n in self.entradas if n in tokens}
+        if 'token_type_ids' in self.entradas and 'token_type_ids' not in entradas:
+            entradas['token_type_ids'] = np.zeros_like(tokens['input_ids'], dtype=np.int64)
+
+        ocultos = self.sesion.run(None, entradas)[0]
+        mascara = tokens['attention_mask'][..., None].astype(np.float32)
+        return (ocultos * mascara).sum(axis=1) / np.clip(mascara.sum(axis=1), 1e-9, None)
+
+    def encode(self,
+               sentences: Union[str, List[str]],
+               batch_size: int = 32,
+               normalize_embeddings: bool = False,
+               show_progress_bar: bool = False,
+               **kwargs) -> np.ndarray:
+        """Misma interfaz que SentenceTransformer.encode (devuelve un array float32)"""
+        unico = isinstance(sentences, str)
+        textos = [sentences] if unico else list(sentences)
+        if not textos:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+
+        # Ordenar por longitud: los lotes quedan con poco padding
+        orden = np.argsort([-len(t) for t in textos], kind='stable')
+        resultado = None
+        for inicio in range(0, len(textos), batch_size):
+            posiciones = orden[inicio:inicio + batch_size]
+            vectores = self._codificar_lote([textos[i] for i in posiciones])
+            if resultado is None:
+                resultado = np.empty((len(textos), vectores.shape[1]), dtype=np.float32)
+            resultado[posiciones] = vectores
+
+        if normalize_embeddings:
+            resultado = normalizar(resultado)
+        return resultado[0] if unico else resultado
+
+
+def cargar_codificador(nombre_modelo: str, backend: str = 'torch', directorio_onnx: str = None):
+    """
+    Crear el codificador del backend indicado
+
+    Args:
+        nombre_modelo: Modelo de sentence-transformers
+        backend: 'torch', 'onnx' u 'onnx-int8'
+        directorio_onnx: Carpeta de los grafos ONNX exportados
+
+    Returns:
+        Objeto con encode() compatible con SentenceTransformer
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Backend de embeddings inválido: {backend}")
+
+    if backend == 'torch':
+        # Import diferido: cargar PyTorch tarda segundos y no debe retrasar el arranque
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(nombre_modelo)
+
+    return CodificadorONNX(
+        nombre_modelo,
+        cuantizado=backend == 'onnx-int8',
+        directorio=directorio_onnx,
+        hilos=int(os.getenv('ARIA_EMBEDDINGS_ONNX_HILOS', '0'))
+    )
+
+
+def verificar_paridad(referencia, candidato, textos: List[str], backend: str = 'onnx',
+                      umbral: float = None) -> Dict:
+    """
+    Comparar los embeddings de dos codificadores sobre los mismos textos
+
+    Args:
+        referencia: Codificador de referencia (normalmente PyTorch)
+        candidato: Codificador a validar
+        textos: Textos de prueba
+        backend: Backend del candidato ('onnx' u 'onnx-int8'), fija el umbral por defecto
+        umbral: Similitud coseno mínima aceptada por texto (None = UMBRALES_PARIDAD[backend])
+
+    Returns:
+        Dict con la similitud coseno mínima y media y si se supera el umbral
+    """
+    if umbral is None:
+        umbral = UMBRALES_PARIDAD[backend]
+    a = np.asarray(referencia.encode(textos, normalize_embeddings=True), dtype=np.float32)
+    b = np.asarray(candidato.encode(textos, normalize_embeddings=True), dtype=np.float32)
+    similitudes = (a * b).sum(axis=1)
+    return {
+        'textos': len(textos),
+        'coseno_minimo': round(float(similitudes.min()), 5),
+        'coseno_medio': round(float(similitudes.mean()), 5),
+        'umbral': umbral,
+        'aprobado': bool(similitudes.min() >= umbral)
+    }
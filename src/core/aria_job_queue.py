@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+📬 ARIA JOB QUEUE
+================
+
+Cola de trabajos persistente en sqlite para el trabajo posterior a la
+respuesta (guardar la conversación, aprender conceptos, historial emocional).
+/chat sólo inserta una fila local y responde; unos hilos ejecutan los trabajos
+después. Si el proceso se cae, los trabajos pendientes o a medias se retoman
+en el siguiente arranque.
+
+Características:
+✅ Persistente (sqlite WAL): nada se pierde al reiniciar
+✅ Claves de idempotencia: el mismo trabajo no se encola dos veces
+✅ Hilos trabajadores con reintentos y espera exponencial
+✅ Tabla de fallidos (dead-letter) con el último error, reencolable
+✅ Ejecución al menos una vez: los manejadores deben ser idempotentes
+
+Fecha: 25 de octubre de 2025
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import logging
+
+try:
+    from core.aria_metrics import DURACION_TRABAJOS, RESULTADOS_TRABAJOS
+except ImportError:
+    from aria_metrics import DURACION_TRABAJOS, RESULTADOS_TRABAJOS
+
+logger = logging.getLogger(__name__)
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS trabajos (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    clave TEXT NOT NULL UNIQUE,
+    tipo TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    estado TEXT NOT NULL DEFAULT 'pendiente',
+    intentos INTEGER NOT NULL DEFAULT 0,
+    disponible_en REAL NOT NULL,
+    creado_en REAL NOT NULL,
+    actualizado_en REAL NOT NULL,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_trabajos_pendientes ON trabajos (estado, disponible_en);
+CREATE TABLE IF NOT EXISTS trabajos_fallidos (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    clave TEXT NOT NULL,
+    tipo TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    intentos INTEGER NOT NULL,
+    error TEXT,
+    creado_en REAL NOT NULL,
+    fallido_en REAL NOT NULL
+);
+"""
+
+
+class ARIAJobQueue:
+    """Cola de trabajos en sqlite con hilos trabajadores, reintentos y dead-letter"""
+
+    def __init__(self,
+                 ruta: str,
+                 hilos: int = 2,
+                 reintentos: int = 5,
+                 espera_base: float = 2.0,
+                 retencion_hechos: float = 86400):
+        """
+        Abrir (o crear) la base de la cola y recuperar los trabajos interrumpidos
+
+        Args:
+            ruta: Archivo sqlite de la cola
+            hilos: Hilos trabajadores
+            reintentos: Reintentos de un trabajo antes de pasarlo a trabajos_fallidos
+            espera_base: Segundos antes del primer reintento (se duplica en cada uno)
+            retencion_hechos: Segundos que se conservan los trabajos hechos (idempotencia)
+        """
+        self.ruta = ruta
+        self.hilos = hilos
+        self.reintentos = reintentos
+        self.espera_base = espera_base
+        self.retencion_hechos = retencion_hechos
+
+        self._manejadores: Dict[str, Callable[[Dict[str, Any]], Any]] = {}
+        self._lock = threading.Lock()
+        self._condicion = threading.Condition()
+        self._activo = False
+        self._trabajadores: List[threading.Thread] = []
+
+        self.encolados = 0
+        self.duplicados = 0
+        self.completados = 0
+        self.reintentos_hechos = 0
+        self.fallidos = 0
+        self._ultima_limpieza = 0.0
+
+        directorio = os.path.dirname(ruta)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        self._conexion = sqlite3.connect(ruta, check_same_thread=False, isolation_level=None)
+        self._conexion.execute('PRAGMA journal_mode=WAL')
+        self._conexion.execute('PRAGMA synchronous=NORMAL')
+        self._conexion.executescript(ESQUEMA)
+
+        # Lo que quedó a medias en el arranque anterior vuelve a estar pendiente
+        recuperados = self._conexion.execute(
+            "UPDATE trabajos SET estado = 'pendiente' WHERE estado = 'en_curso'"
+        ).rowcount
+        if recuperados:
+            logger.warning(f"♻️ {recuperados} trabajos interrumpidos vuelven a la cola")
+        logger.info(f"✅ Cola de trabajos en {ruta}")
+
+    # ------------------------------------------------------------------
+    # Registro y encolado
+    # ------------------------------------------------------------------
+
+    def registrar(self, tipo: str, manejador: Callable[[Dict[str, Any]], Any]):
+        """Asociar un tipo de trabajo a su función (recibe el payload; lanza excepción si falla)"""
+        self._manejadores[tipo] = manejador
+
+    def encolar(self, tipo: str, payload: Dict[str, Any], clave: Optional[str] = None) -> bool:
+        """
+        Persistir un trabajo
+
+        Args:
+            tipo: Tipo registrado con registrar()
+            payload: Datos serializables a JSON
+            clave: Clave de idempotencia (None = una nueva)
+
+        Returns:
+            bool: False si ya existía un trabajo con esa clave
+        """
+        ahora = time.time()
+        with self._lock:
+            insertado = self._conexion.execute(
+                'INSERT OR IGNORE INTO trabajos (clave, tipo, payload, disponible_en, creado_en, actualizado_en) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (clave or uuid.uuid4().hex, tipo, json.dumps(payload, ensure_ascii=False, default=str),
+                 ahora, ahora, ahora)
+            ).rowcount
+        if not insertado:
+            self.duplicados += 1
+            logger.info(f"🔁 Trabajo duplicado ignorado: {clave}")
+            return False
+
+        self.encolados += 1
+        with self._condicion:
+            self._condicion.notify()
+        return True
+
+    # ------------------------------------------------------------------
+    # Trabajadores
+    # ------------------------------------------------------------------
+
+    def iniciar(self):
+        """Arrancar los hilos trabajadores"""
+        if self._activo:
+            return
+        self._activo = True
+        for numero in range(self.hilos):
+            hilo = threading.Thread(target=self._bucle, name=f'aria-trabajos-{numero}', daemon=True)
+            hilo.start()
+            self._trabajadores.append(hilo)
+
+    def cerrar(self, timeout: float = 10.0):
+        """Detener los trabajadores tras el trabajo en curso (lo pendiente sigue en disco)"""
+        if not self._activo:
+            return
+        with self._condicion:
+            self._activo = False
+            self._condicion.notify_all()
+        limite = time.monotonic() + timeout
+        for hilo in self._trabajadores:
+            hilo.join(timeout=max(limite - time.monotonic(), 0))
+        self._trabajadores = []
+
+    def _tomar(self) -> Tuple[Optional[tuple], Optional[float]]:
+        """Marcar como en curso el siguiente trabajo disponible; o (None, segundos hasta el próximo)"""
+        ahora = time.time()
+        with self._lock:
+            fila = self._conexion.execute(
+                "SELECT id, clave, tipo, payload, intentos FROM trabajos "
+                "WHERE estado = 'pendiente' AND disponible_en <= ? ORDER BY id LIMIT 1",
+                (ahora,)
+            ).fetchone()
+            if fila is None:
+                siguiente = self._conexion.execute(
+                    "SELECT MIN(disponible_en) FROM trabajos WHERE estado = 'pendiente'"
+                ).fetchone()[0]
+                return None, (siguiente - ahora) if siguiente is not None else None
+            self._conexion.execute(
+                "UPDATE trabajos SET estado = 'en_curso', actualizado_en = ? WHERE id = ?", (ahora, fila[0])
+            )
+            return fila, 0
+
+    def _bucle(self):
+        """Hilo trabajador"""
+        while self._activo:
+            try:
+                trabajo, espera = self._tomar()
+            except sqlite3.Error as e:
+                logger.error(f"❌ Error leyendo la cola de trabajos: {e}")
+                trabajo, espera = None, 1.0
+
+            if trabajo is None:
+                self._limpiar()
+                with self._condicion:
+                    if self._activo:
+                        # Sin nada listo: esperar a un encolado o al próximo reintento
+                        self._condicion.wait(min(espera, 5.0) if espera is not None else 5.0)
+                continue
+            try:
+                self._ejecutar(*trabajo)
+            except Exception as e:
+                # Error de sqlite al registrar el resultado: el hilo sigue vivo y el
+                # trabajo vuelve a pendiente (los manejadores son idempotentes)
+                logger.error(f"❌ Error registrando el trabajo {trabajo[2]} ({trabajo[1]}): {e}")
+                self._devolver(trabajo[0])
+
+    def _devolver(self, identificador: int):
+        """Dejar pendiente un trabajo en curso (si tampoco se puede, lo recupera el próximo arranque)"""
+        try:
+            with self._lock:
+                self._conexion.execute(
+                    "UPDATE trabajos SET estado = 'pendiente', disponible_en = ? WHERE id = ? AND estado = 'en_curso'",
+                    (time.time() + self.espera_base, identificador)
+                )
+        except sqlite3.Error as e:
+            logger.error(f"❌ No se pudo devolver el trabajo {identificador} a la cola: {e}")
+
+    def _ejecutar(self, identificador: int, clave: str, tipo: str, payload: str, intentos: int):
+        """Ejecutar un trabajo y registrar el resultado (hecho, reintento o fallido)"""
+        manejador = self._manejadores.get(tipo)
+        inicio = time.perf_counter()
+        try:
+            if manejador is None:
+                raise LookupError(f"tipo de trabajo sin manejador: {tipo}")
+            manejador(json.loads(payload))
+        except Exception as e:
+            DURACION_TRABAJOS.observar(time.perf_counter() - inicio, tipo)
+            intentos += 1
+            error = f"{type(e).__name__}: {e}"
+            ahora = time.time()
+            with self._lock:
+                if intentos > self.reintentos:
+                    # El contexto de la conexión hace COMMIT, o ROLLBACK si algo falla
+                    with self._conexion:
+                        self._conexion.execute('BEGIN')
+                        self._conexion.execute(
+                            'INSERT INTO trabajos_fallidos (clave, tipo, payload, intentos, error, creado_en, fallido_en) '
+                            'SELECT clave, tipo, payload, ?, ?, creado_en, ? FROM trabajos WHERE id = ?',
+                            (intentos, error, ahora, identificador)
+                        )
+                        self._conexion.execute('DELETE FROM trabajos WHERE id = ?', (identificador,))
+                    self.fallidos += 1
+                    RESULTADOS_TRABAJOS.incrementar(tipo, 'dead_letter')
+                    logger.error(f"❌ Trabajo {tipo} ({clave}) a fallidos tras {intentos} intentos: {error}")
+                    return
+
+                espera = self.espera_base * (2 ** (intentos - 1))
+                self._conexion.execute(
+                    "UPDATE trabajos SET estado = 'pendiente', intentos = ?, disponible_en = ?, "
+                    "actualizado_en = ?, error = ? WHERE id = ?",
+                    (intentos, ahora + espera, ahora, error, identificador)
+                )
+            self.reintentos_hechos += 1
+            RESULTADOS_TRABAJOS.incrementar(tipo, 'retry')
+            logger.warning(f"⚠️ Trabajo {tipo} falló ({error}); reintento en {espera:.1f}s")
+            return
+
+        with self._lock:
+            self._conexion.execute(
+                "UPDATE trabajos SET estado = 'hecho', intentos = ?, actualizado_en = ?, error = NULL WHERE id = ?",
+                (intentos + 1, time.time(), identificador)
+            )
+        self.completados += 1
+        DURACION_TRABAJOS.observar(time.perf_counter() - inicio, tipo)
+        RESULTADOS_TRABAJOS.incrementar(tipo, 'ok')
+
+    def _limpiar(self):
+        """Borrar los trabajos hechos más antiguos que la retención (como mucho una vez por minuto)"""
+        ahora = time.time()
+        if ahora - self._ultima_limpieza < 60:
+            return
+        self._ultima_limpieza = ahora
+        with self._lock:
+            self._conexion.execute(
+                "DELETE FROM trabajos WHERE estado = 'hecho' AND actualizado_en < ?",
+                (ahora - self.retencion_hechos,)
+            )
+
+    # ------------------------------------------------------------------
+    # Dead-letter y métricas
+    # ------------------------------------------------------------------
+
+    def reintentar_fallidos(self, tipo: str = None) -> int:
+        """Devolver a la cola los trabajos fallidos (todos o los de un tipo)"""
+        ahora = time.time()
+        filtro, parametros = ('WHERE tipo = ?', (tipo,)) if tipo else ('', ())
+        with self._lock, self._conexion:
+            self._conexion.execute('BEGIN')
+            filas = self._conexion.execute(
+                f'SELECT id, clave, tipo, payload, creado_en FROM trabajos_fallidos {filtro}', parametros
+            ).fetchall()
+            for identificador, clave, tipo_fallido, payload, creado_en in filas:
+                self._conexion.execute(
+                    'INSERT OR REPLACE INTO trabajos (clave, tipo, payload, disponible_en, creado_en, actualizado_en) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    (clave, tipo_fallido, payload, ahora, creado_en, ahora)
+                )
+                self._conexion.execute('DELETE FROM trabajos_fallidos WHERE id = ?', (identificador,))
+        if filas:
+            with self._condicion:
+                self._condicion.notify_all()
+        return len(filas)
+
+    def estadisticas(self) -> Dict:
+        """Profundidad por estado y contadores desde el arranque"""
+        with self._lock:
+            estados = dict(self._conexion.execute(
+                'SELECT estado, COUNT(*) FROM trabajos GROUP BY estado'
+            ).fetchall())
+            fallidos_por_tipo = dict(self._conexion.execute(
+                'SELECT tipo, COUNT(*) FROM trabajos_fallidos GROUP BY tipo'
+            ).fetchall())
+        return {
+            'ruta': self.ruta,
+            'hilos': self.hilos,
+            'activa': self._activo,
+            'pendientes': estados.get('pendiente', 0),
+            'en_curso': estados.get('en_curso', 0),
+            'hechos_retenidos': estados.get('hecho', 0),
+            'dead_letter': fallidos_por_tipo,
+            'encolados': self.encolados,
+            'duplicados': self.duplicados,
+            'completados': self.completados,
+            'reintentos': self.reintentos_hechos,
+            'fallidos': self.fallidos
+        }
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+🗂️ ARIA KNOWLEDGE INDEX
+======================
+
+Cache local de conocimiento (concepto -> datos), acotado por LRU, con un índice
+invertido de términos y prefijos que se mantiene en cada alta o baja. Las búsquedas de
+la etapa "cache" de /chat y del fallback de /search ya no recorren todo el cache
+comparando cada palabra con cada concepto y descripción: sólo tocan las
+listas de sus términos, O(términos de la consulta + coincidencias).
+
+Características:
+✅ Interfaz de diccionario (cache[concepto] = datos, len, items, values...)
+✅ Capacidad máxima: se expulsa el concepto usado hace más tiempo
+✅ Índice mantenido al insertar, reemplazar, expulsar y borrar
+✅ Prefijos sólo del concepto ("pyth" encuentra "python"); la descripción, términos completos
+✅ Plegado de acentos y palabras vacías como el índice BM25
+✅ Resultados ordenados por términos coincidentes y antigüedad
+✅ Seguro entre hilos (peticiones y trabajos de aprendizaje en paralelo)
+
+Fecha: 25 de octubre de 2025
+"""
+
+import threading
+from itertools import islice
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from typing import Any, Dict, Iterator, List, Optional, Set
+import logging
+
+try:
+    from core.aria_bm25_index import tokenizar
+except ImportError:
+    from aria_bm25_index import tokenizar
+
+logger = logging.getLogger(__name__)
+
+# Prefijos más cortos no se indexan: "py" sólo encuentra el término exacto "py"
+LONGITUD_MINIMA_PREFIJO = 3
+
+
+def _claves_termino(termino: str) -> List[str]:
+    """El término y sus prefijos indexables: 'python' -> ['pyt', 'pyth', 'pytho', 'python']"""
+    if len(termino) <= LONGITUD_MINIMA_PREFIJO:
+        return [termino]
+    return [termino[:n] for n in range(LONGITUD_MINIMA_PREFIJO, len(termino) + 1)]
+
+
+class ARIAKnowledgeCache(MutableMapping):
+    """Diccionario concepto -> datos con índice invertido de términos y prefijos"""
+
+    def __init__(self, datos: Dict[str, Dict] = None, capacidad: int = 10000):
+        """
+        Args:
+            datos: Conceptos iniciales
+            capacidad: Conceptos máximos (0 = sin límite)
+        """
+        self.capacidad = capacidad
+        self.expulsados = 0
+        # Orden de uso: el primero es el que se expulsa
+        self._datos: "OrderedDict[str, Dict]" = OrderedDict()
+        # Orden de alta de cada concepto (desempate de resultados)
+        self._orden: Dict[str, int] = {}
+        self._secuencia = 0
+        # Prefijo o término -> conceptos que lo contienen
+        self._indice: Dict[str, Set[str]] = {}
+        # Concepto -> claves del índice en las que aparece (para las bajas)
+        self._claves: Dict[str, Set[str]] = {}
+        self._lock = threading.RLock()
+        if datos:
+            self.update(datos)
+
+    def _claves_entrada(self, concepto: str, datos: Dict) -> Set[str]:
+        """Claves del índice: el concepto con sus prefijos, la descripción sólo por términos completos"""
+        descripcion = datos.get('description', '') if isinstance(datos, dict) else ''
+        claves = set(tokenizar(descripcion or ''))
+        for termino in set(tokenizar(concepto)):
+            claves.update(_claves_termino(termino))
+        return claves
+
+    def __setitem__(self, concepto: str, datos: Dict):
+        with self._lock:
+            if concepto in self._datos:
+                self._desindexar(concepto)
+            else:
+                self._secuencia += 1
+                self._orden[concepto] = self._secuencia
+            self._datos[concepto] = datos
+            self._datos.move_to_end(concepto)
+            claves = self._claves_entrada(concepto, datos)
+            for clave in claves:
+                self._indice.setdefault(clave, set()).add(concepto)
+            self._claves[concepto] = claves
+            while self.capacidad and len(self._datos) > self.capacidad:
+                expulsado, _ = self._datos.popitem(last=False)
+                self._desindexar(expulsado)
+                del self._orden[expulsado]
+                self.expulsados += 1
+
+    def __delitem__(self, concepto: str):
+        with self._lock:
+            del self._datos[concepto]
+            self._desindexar(concepto)
+            del self._orden[concepto]
+
+    def _desindexar(self, concepto: str):
+        """Quitar el concepto de las listas del índice (vacías se eliminan)"""
+        for clave in self._claves.pop(concepto, ()):
+            conceptos = self._indice.get(clave)
+            if conceptos is not None:
+                conceptos.discard(concepto)
+                if not conceptos:
+                    del self._indice[clave]
+
+    def __getitem__(self, concepto: str) -> Dict:
+        with self._lock:
+            datos = self._datos[concepto]
+            self._datos.move_to_end(concepto)
+            return datos
+
+    def __contains__(self, concepto: object) -> bool:
+        return concepto in self._datos
+
+    def __len__(self) -> int:
+        return len(self._datos)
+
+    def __iter__(self) -> Iterator[str]:
+        # Copia: los trabajos de aprendizaje pueden insertar mientras se recorre
+        with self._lock:
+            return iter(list(self._datos))
+
+    def valores(self, limite: Optional[int] = None) -> List[Dict]:
+        """
+        Copia de los datos (del menos al más usado) sin alterar el orden LRU
+
+        values() de MutableMapping pasa por __getitem__: reordena cada concepto y
+        falla con KeyError si un trabajo de aprendizaje expulsa uno mientras se recorre.
+        """
+        with self._lock:
+            return list(islice(self._datos.values(), limite))
+
+    def buscar(self, consulta: str, todos: bool = False) -> List[Dict]:
+        """
+        Conceptos cuyo nombre o descripción contienen términos de la consulta
+
+        Args:
+            consulta: Texto libre
+            todos: True para exigir todos los términos (frases), False para cualquiera
+
+        Returns:
+            Datos de los conceptos, de más a menos términos coincidentes y por antigüedad
+        """
+        terminos = set(tokenizar(consulta))
+        if not terminos:
+            return []
+
+        with self._lock:
+            coincidencias: Dict[str, int] = {}
+            for termino in terminos:
+                for concepto in self._indice.get(termino, ()):
+                    coincidencias[concepto] = coincidencias.get(concepto, 0) + 1
+            if todos:
+                coincidencias = {c: n for c, n in coincidencias.items() if n == len(terminos)}
+            ordenados = sorted(coincidencias, key=lambda c: (-coincidencias[c], self._orden[c]))
+            for concepto in ordenados:
+                self._datos.move_to_end(concepto)
+            return [self._datos[c] for c in ordenados]
+
+    def estadisticas(self) -> Dict[str, Any]:
+        """Conceptos, expulsiones y claves del índice"""
+        with self._lock:
+            return {
+                'conceptos': len(self._datos),
+                'capacidad': self.capacidad,
+                'expulsados': self.expulsados,
+                'claves_indice': len(self._indice),
+                'postings': sum(len(c) for c in self._indice.values())
+            }
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+📈 ARIA METRICS
+==============
+
+Histogramas y contadores en memoria con exportación en formato de texto de
+Prometheus (/metrics). Cada observación es una búsqueda binaria sobre los
+límites de los buckets y un incremento bajo un candado: se puede instrumentar
+el camino caliente sin perfilador y leer p95/p99 con histogram_quantile().
+
+Características:
+✅ Histogramas con buckets fijos, suma y cuenta por combinación de etiquetas
+✅ Contadores con etiquetas
+✅ Indicadores calculados al exportar (profundidad de colas, hilos ocupados)
+✅ cronometrar(): context manager que mide un bloque y cuenta sus excepciones
+✅ Sin dependencias (no requiere prometheus_client)
+
+Fecha: 25 de octubre de 2025
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Segundos: de llamadas en memoria (ms) a esperas de red largas
+BUCKETS_LATENCIA = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escapar(valor: str) -> str:
+    """Escapar un valor de etiqueta según el formato de texto de Prometheus"""
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _etiquetas(nombres: Sequence[str], valores: Sequence[str], extra: str = '') -> str:
+    """'{a="1",b="2"}' (vacío si no hay etiquetas)"""
+    pares = [f'{n}="{_escapar(v)}"' for n, v in zip(nombres, valores)]
+    if extra:
+        pares.append(extra)
+    return '{' + ','.join(pares) + '}' if pares else ''
+
+
+def _numero(valor: float) -> str:
+    """Formato numérico de Prometheus"""
+    if valor == float('inf'):
+        return '+Inf'
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class ARIAHistograma:
+    """Histograma de Prometheus con etiquetas"""
+
+    tipo = 'histogram'
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Sequence[str] = (),
+                 buckets: Sequence[float] = BUCKETS_LATENCIA):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], List] = {}
+        self._lock = threading.Lock()
+
+    def observar(self, valor: float, *etiquetas: str):
+        """Registrar una observación (los valores de etiqueta van en el orden declarado)"""
+        posicion = bisect.bisect_left(self.buckets, valor)
+        with self._lock:
+            serie = self._series.get(etiquetas)
+            if serie is None:
+                # [conteos por bucket (+Inf al final), suma]
+                serie = self._series[etiquetas] = [[0] * (len(self.buckets) + 1), 0.0]
+            serie[0][posicion] += 1
+            serie[1] += valor
+
+    def exportar(self) -> List[str]:
+        """Líneas _bucket (acumuladas), _sum y _count de cada serie"""
+        with self._lock:
+            series = [(k, list(v[0]), v[1]) for k, v in self._series.items()]
+        lineas = []
+        for valores, conteos, suma in sorted(series):
+            acumulado = 0
+            for limite, conteo in zip(self.buckets + (float('inf'),), conteos):
+                acumulado += conteo
+                le = _etiquetas(self.etiquetas, valores, f'le="{_numero(limite)}"')
+                lineas.append(f'{self.nombre}_bucket{le} {acumulado}')
+            lineas.append(f'{self.nombre}_sum{_etiquetas(self.etiquetas, valores)} {_numero(suma)}')
+            lineas.append(f'{self.nombre}_count{_etiquetas(self.etiquetas, valores)} {acumulado}')
+        return lineas
+
+
+class ARIAContador:
+    """Contador de Prometheus con etiquetas"""
+
+    tipo = 'counter'
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Sequence[str] = ()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._valores: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def incrementar(self, *etiquetas: str, cantidad: float = 1):
+        """Sumar cantidad a la serie de esas etiquetas"""
+        with self._lock:
+            self._valores[etiquetas] = self._valores.get(etiquetas, 0) + cantidad
+
+    def exportar(self) -> List[str]:
+        with self._lock:
+            valores = sorted(self._valores.items())
+        return [f'{self.nombre}{_etiquetas(self.etiquetas, k)} {_numero(v)}' for k, v in valores]
+
+
+class ARIAIndicador:
+    """Gauge calculado en el momento de exportar"""
+
+    tipo = 'gauge'
+
+    def __init__(self, nombre: str, ayuda: str, funcion: Callable[[], Optional[float]]):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.funcion = funcion
+
+    def exportar(self) -> List[str]:
+        try:
+            valor = self.funcion()
+        except Exception as e:
+            logger.warning(f"⚠️ Indicador {self.nombre} no disponible: {e}")
+            return []
+        return [] if valor is None else [f'{self.nombre} {_numero(valor)}']
+
+
+class ARIAMetricas:
+    """Registro de métricas del proceso"""
+
+    def __init__(self):
+        self._metricas: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def _registrar(self, metrica):
+        with self._lock:
+            existente = self._metricas.get(metrica.nombre)
+            if existente is not None:
+                return existente
+            self._metricas[metrica.nombre] = metrica
+            return metrica
+
+    def histograma(self, nombre: str, ayuda: str, etiquetas: Sequence[str] = (),
+                   buckets: Sequence[float] = BUCKETS_LATENCIA) -> ARIAHistograma:
+        """Crear (o recuperar) un histograma"""
+        return self._registrar(ARIAHistograma(nombre, ayuda, etiquetas, buckets))
+
+    def contador(self, nombre: str, ayuda: str, etiquetas: Sequence[str] = ()) -> ARIAContador:
+        """Crear (o recuperar) un contador"""
+        return self._registrar(ARIAContador(nombre, ayuda, etiquetas))
+
+    def indicador(self, nombre: str, ayuda: str, funcion: Callable[[], Optional[float]]) -> ARIAIndicador:
+        """Registrar un gauge calculado por funcion() (reemplaza al anterior del mismo nombre)"""
+        indicador = ARIAIndicador(nombre, ayuda, funcion)
+        with self._lock:
+            self._metricas[nombre] = indicador
+        return indicador
+
+    def exportar(self) -> str:
+        """Todas las métricas en formato de texto de Prometheus (text/plain; version=0.0.4)"""
+        with self._lock:
+            metricas = list(self._metricas.values())
+        lineas = []
+        for metrica in metricas:
+            lineas.append(f'# HELP {metrica.nombre} {metrica.ayuda}')
+            lineas.append(f'# TYPE {metrica.nombre} {metrica.tipo}')
+            lineas.extend(metrica.exportar())
+        return '\n'.join(lineas) + '\n'
+
+
+@contextmanager
+def cronometrar(histograma: ARIAHistograma, *etiquetas: str, errores: ARIAContador = None):
+    """Observar la duración del bloque en el histograma y contar sus excepciones (que se relanzan)"""
+    inicio = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        if errores is not None:
+            errores.incrementar(*etiquetas)
+        raise
+    finally:
+        histograma.observar(time.perf_counter() - inicio, *etiquetas)
+
+
+# Registro global del proceso y métricas compartidas entre módulos
+metricas = ARIAMetricas()
+
+DURACION_CHAT = metricas.histograma(
+    'aria_chat_duration_seconds', 'Duración total de process_message')
+DURACION_ETAPAS = metricas.histograma(
+    'aria_stage_duration_seconds', 'Duración de cada etapa de process_message', ('stage',))
+RESULTADOS_ETAPAS = metricas.contador(
+    'aria_stage_results_total', 'Etapas terminadas por resultado (ok, timeout, error)', ('stage', 'result'))
+DURACION_SUPABASE = metricas.histograma(
+    'aria_supabase_duration_seconds', 'Duración de las llamadas a Supabase', ('operation',))
+ERRORES_SUPABASE = metricas.contador(
+    'aria_supabase_errors_total', 'Llamadas a Supabase fallidas', ('operation',))
+DURACION_EMBEDDINGS = metricas.histograma(
+    'aria_embedding_duration_seconds', 'Duración de generar_embedding por origen (cache o modelo)', ('source',))
+DURACION_APIS = metricas.histograma(
+    'aria_external_api_duration_seconds', 'Duración de las llamadas a APIs externas', ('api',))
+ERRORES_APIS = metricas.contador(
+    'aria_external_api_errors_total', 'Llamadas a APIs externas fallidas', ('api',))
+DURACION_TRABAJOS = metricas.histograma(
+    'aria_job_duration_seconds', 'Duración de los trabajos de la cola', ('type',))
+RESULTADOS_TRABAJOS = metricas.contador(
+    'aria_job_results_total', 'Trabajos ejecutados por resultado (ok, retry, dead_letter)', ('type', 'result'))
+CONSULTAS_CACHE_RESPUESTAS = metricas.contador(
+    'aria_response_cache_requests_total', 'Consultas al cache de respuestas de /chat (hit, miss)', ('result',))
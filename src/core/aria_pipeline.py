@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+🔀 ARIA PIPELINE
+===============
+
+Ejecución concurrente de las etapas de una petición como grafo de
+dependencias. Cada etapa se lanza en un pool acotado en cuanto terminan
+(o caducan) las etapas de las que depende, y tiene su propio timeout: si no
+llega a tiempo se usa su valor por defecto y la respuesta se arma con lo que
+sí terminó. La latencia total se acerca a la de la cadena más lenta en lugar
+de a la suma de todas las esperas de red.
+
+El timeout de una etapa cuenta desde que un hilo empieza a ejecutarla: la
+espera por un hilo libre del pool compartido se acota aparte (espera_cola) y
+una etapa que no llega a empezar se cancela sin ocupar ningún hilo.
+
+Características:
+✅ Grafo de etapas con dependencias (resultados pasados como argumentos)
+✅ Pool de hilos acotado compartido por todas las peticiones
+✅ Timeout por etapa desde que empieza a ejecutarse y espera en cola acotada
+✅ Valor por defecto (o función que lo construye sólo si hace falta) si caduca o falla
+✅ Etapas en segundo plano: se lanzan pero la respuesta no las espera
+✅ Contadores por etapa: ejecuciones, timeouts, errores y duración media
+
+Fecha: 25 de octubre de 2025
+"""
+
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+import logging
+
+try:
+    from core.aria_metrics import DURACION_ETAPAS, RESULTADOS_ETAPAS
+except ImportError:
+    from aria_metrics import DURACION_ETAPAS, RESULTADOS_ETAPAS
+
+logger = logging.getLogger(__name__)
+
+
+class _Etapa:
+    """Definición de una etapa del plan"""
+
+    __slots__ = ('nombre', 'funcion', 'depende', 'timeout', '_defecto', 'fabrica_defecto', 'esperar')
+
+    def __init__(self, nombre: str, funcion: Callable, depende: Tuple[str, ...],
+                 timeout: float, defecto: Any, esperar: bool,
+                 fabrica_defecto: Optional[Callable[[], Any]] = None):
+        self.nombre = nombre
+        self.funcion = funcion
+        self.depende = depende
+        self.timeout = timeout
+        self._defecto = defecto
+        self.fabrica_defecto = fabrica_defecto
+        self.esperar = esperar
+
+    @property
+    def defecto(self) -> Any:
+        """Valor por defecto (construido en el momento si la etapa tiene fábrica)"""
+        if self.fabrica_defecto is not None:
+            return self.fabrica_defecto()
+        return self._defecto
+
+
+class ARIAPlan:
+    """Etapas de una petición: se declaran con etapa() y se lanzan con ejecutar()"""
+
+    def __init__(self, pipeline: 'ARIAPipeline'):
+        self.pipeline = pipeline
+        self._etapas: Dict[str, _Etapa] = {}
+        self.resultados: Dict[str, Any] = {}
+        self.estados: Dict[str, str] = {}
+        self.duraciones: Dict[str, float] = {}
+        # Momento en que un hilo empezó cada etapa (lo escribe el propio hilo)
+        self._comienzos: Dict[str, float] = {}
+
+    def etapa(self,
+              nombre: str,
+              funcion: Callable,
+              depende: Sequence[str] = (),
+              timeout: Optional[float] = None,
+              defecto: Any = None,
+              esperar: bool = True,
+              fabrica_defecto: Optional[Callable[[], Any]] = None) -> 'ARIAPlan':
+        """
+        Declarar una etapa
+
+        Args:
+            nombre: Identificador de la etapa (clave de su resultado)
+            funcion: Recibe los resultados de sus dependencias, en el orden de depende
+            depende: Etapas que deben terminar (o caducar) antes de lanzarla
+            timeout: Segundos máximos desde que empieza a ejecutarse (None = timeout del pipeline)
+            defecto: Resultado si la etapa caduca, falla o no se puede lanzar
+            esperar: False para etapas en segundo plano (p. ej. escrituras)
+            fabrica_defecto: Alternativa a defecto para valores caros: sólo se llama si hace falta
+        """
+        depende = tuple(depende)
+        for dependencia in depende:
+            previa = self._etapas.get(dependencia)
+            if previa is None:
+                raise ValueError(f"La etapa '{nombre}' depende de '{dependencia}', que no está declarada")
+            if not previa.esperar:
+                raise ValueError(f"La etapa '{nombre}' no puede depender de la etapa en segundo plano '{dependencia}'")
+        self._etapas[nombre] = _Etapa(
+            nombre, funcion, depende,
+            self.pipeline.timeout if timeout is None else timeout,
+            defecto, esperar, fabrica_defecto
+        )
+        return self
+
+    def _limite(self, etapa: _Etapa, lanzada: float) -> float:
+        """Instante en que la etapa caduca: en cola, lanzada + espera_cola; en marcha, comienzo + timeout"""
+        comienzo = self._comienzos.get(etapa.nombre)
+        if comienzo is None:
+            return lanzada + self.pipeline.espera_cola
+        return comienzo + etapa.timeout
+
+    def ejecutar(self) -> Dict[str, Any]:
+        """
+        Lanzar las etapas según sus dependencias y esperar a las que no son de fondo
+
+        Returns:
+            Resultado (o valor por defecto) de cada etapa esperada
+        """
+        pendientes = [e for e in self._etapas.values() if e.esperar]
+        fondo = [e for e in self._etapas.values() if not e.esperar]
+        en_curso: Dict[str, Tuple[Any, float]] = {}
+
+        while pendientes or en_curso:
+            # Lanzar las etapas cuyas dependencias ya están resueltas (por orden de declaración)
+            for etapa in [e for e in pendientes if all(d in self.estados for d in e.depende)]:
+                pendientes.remove(etapa)
+                inicio = time.monotonic()
+                futuro = self.pipeline._lanzar(etapa, [self.resultados[d] for d in etapa.depende], self._comienzos)
+                en_curso[etapa.nombre] = (futuro, inicio)
+
+            if not en_curso:
+                break
+
+            # Esperar a la primera que termine o a la primera que caduque
+            # (una etapa que empieza mientras tanto alarga su límite: se recalcula en la vuelta)
+            restante = min(self._limite(self._etapas[n], inicio) for n, (_, inicio) in en_curso.items()) \
+                - time.monotonic()
+            wait([f for f, _ in en_curso.values()], timeout=max(restante, 0), return_when=FIRST_COMPLETED)
+
+            ahora = time.monotonic()
+            for nombre, (futuro, inicio) in list(en_curso.items()):
+                etapa = self._etapas[nombre]
+                if futuro.done():
+                    try:
+                        self.resultados[nombre] = futuro.result()
+                        self.estados[nombre] = 'ok'
+                    except Exception as e:
+                        logger.warning(f"⚠️ Etapa '{nombre}' fallida: {e}")
+                        self.resultados[nombre] = etapa.defecto
+                        self.estados[nombre] = 'error'
+                elif ahora < self._limite(etapa, inicio):
+                    continue
+                elif nombre not in self._comienzos:
+                    if not futuro.cancel():
+                        # Empezó justo ahora: su límite pasa a contar desde el comienzo
+                        continue
+                    logger.warning(f"⏱️ Etapa '{nombre}' sin hilo libre tras {self.pipeline.espera_cola:.2f}s en cola")
+                    self.resultados[nombre] = etapa.defecto
+                    self.estados[nombre] = 'timeout'
+                else:
+                    # El hilo sigue ocupado hasta que la llamada vuelva, pero ya no se espera
+                    logger.warning(f"⏱️ Etapa '{nombre}' sin respuesta tras {etapa.timeout:.2f}s")
+                    self.resultados[nombre] = etapa.defecto
+                    self.estados[nombre] = 'timeout'
+                self.duraciones[nombre] = round((ahora - inicio) * 1000, 1)
+                self.pipeline._registrar(nombre, self.estados[nombre], ahora - inicio)
+                del en_curso[nombre]
+
+        for etapa in pendientes:
+            self.resultados[etapa.nombre] = etapa.defecto
+            self.estados[etapa.nombre] = 'omitida'
+
+        for etapa in fondo:
+            self.pipeline._lanzar(etapa, [self.resultados[d] for d in etapa.depende])
+            self.estados[etapa.nombre] = 'fondo'
+
+        return self.resultados
+
+    def informe(self) -> Dict[str, Any]:
+        """Estado y duración (ms) de cada etapa de esta ejecución"""
+        return {
+            'stages_ms': dict(self.duraciones),
+            'timed_out': [n for n, e in self.estados.items() if e == 'timeout'],
+            'failed': [n for n, e in self.estados.items() if e in ('error', 'omitida')]
+        }
+
+
+class ARIAPipeline:
+    """Pool acotado que ejecuta los planes de todas las peticiones"""
+
+    def __init__(self, hilos: int = 16, timeout: float = 3.0, espera_cola: float = None):
+        """
+        Args:
+            hilos: Hilos máximos del pool compartido
+            timeout: Timeout por defecto de cada etapa (segundos desde que empieza)
+            espera_cola: Segundos máximos esperando un hilo libre (None = timeout)
+        """
+        self.hilos = hilos
+        self.timeout = timeout
+        self.espera_cola = timeout if espera_cola is None else espera_cola
+        self._executor = ThreadPoolExecutor(max_workers=hilos, thread_name_prefix='aria-etapa')
+        self._lock = threading.Lock()
+        self._ocupados = 0
+        self._contadores: Dict[str, Dict[str, float]] = {}
+
+    def plan(self) -> ARIAPlan:
+        """Plan vacío para una petición"""
+        return ARIAPlan(self)
+
+    def en_segundo_plano(self, nombre: str, funcion: Callable, *argumentos):
+        """Lanzar una función suelta en el pool sin esperarla (errores sólo al log)"""
+        self._lanzar(_Etapa(nombre, funcion, (), self.timeout, None, False), list(argumentos))
+
+    def _lanzar(self, etapa: _Etapa, argumentos: List[Any], comienzos: Dict[str, float] = None):
+        """Enviar una etapa al pool (comienzos recibe el instante en que un hilo la empieza)"""
+        return self._executor.submit(self._ejecutar_etapa, etapa, argumentos, comienzos)
+
+    def _ejecutar_etapa(self, etapa: _Etapa, argumentos: List[Any], comienzos: Dict[str, float] = None) -> Any:
+        inicio = time.monotonic()
+        if comienzos is not None:
+            comienzos[etapa.nombre] = inicio
+        with self._lock:
+            self._ocupados += 1
+        try:
+            resultado = etapa.funcion(*argumentos)
+            if not etapa.esperar:
+                self._registrar(etapa.nombre, 'ok', time.monotonic() - inicio)
+            return resultado
+        except Exception as e:
+            if not etapa.esperar:
+                logger.error(f"❌ Etapa en segundo plano '{etapa.nombre}' fallida: {e}")
+                self._registrar(etapa.nombre, 'error', time.monotonic() - inicio)
+                return None
+            raise
+        finally:
+            with self._lock:
+                self._ocupados -= 1
+
+    def _registrar(self, nombre: str, estado: str, segundos: float):
+        """Acumular el resultado de una etapa (contadores propios y métricas de Prometheus)"""
+        DURACION_ETAPAS.observar(segundos, nombre)
+        RESULTADOS_ETAPAS.incrementar(nombre, estado)
+        with self._lock:
+            contador = self._contadores.setdefault(
+                nombre, {'ejecuciones': 0, 'ok': 0, 'timeout': 0, 'error': 0, 'ms_total': 0.0, 'ms_max': 0.0}
+            )
+            contador['ejecuciones'] += 1
+            contador[estado] += 1
+            contador['ms_total'] += segundos * 1000
+            contador['ms_max'] = max(contador['ms_max'], segundos * 1000)
+
+    def cerrar(self):
+        """Detener el pool (las etapas en curso terminan)"""
+        self._executor.shutdown(wait=False)
+
+    def estadisticas(self) -> Dict:
+        """Contadores por etapa y ocupación del pool"""
+        with self._lock:
+            etapas = {
+                nombre: {
+                    'ejecuciones': int(c['ejecuciones']),
+                    'ok': int(c['ok']),
+                    'timeouts': int(c['timeout']),
+                    'errores': int(c['error']),
+                    'ms_medio': round(c['ms_total'] / c['ejecuciones'], 1) if c['ejecuciones'] else 0.0,
+                    'ms_max': round(c['ms_max'], 1)
+                }
+                for nombre, c in self._contadores.items()
+            }
+            return {
+                'hilos': self.hilos,
+                'ocupados': self._ocupados,
+                'timeout_s': self.timeout,
+                'espera_cola_s': self.espera_cola,
+                'etapas': etapas
+            }
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+🗃️ ARIA RESPONSE CACHE
+=====================
+
+Cache de respuestas de /chat para los mensajes que se repiten (saludos,
+preguntas frecuentes, respuestas sugeridas): un acierto se salta todo el
+pipeline de búsquedas, APIs y emociones.
+
+La clave es el mensaje normalizado (minúsculas, sin acentos ni signos,
+espacios colapsados) más el idioma. Cualquier escritura de conocimiento sube
+la versión del cache: las entradas de versiones anteriores dejan de servirse
+sin tener que recorrerlas.
+
+Características:
+✅ LRU acotado con TTL por entrada
+✅ Invalidación O(1) por número de versión
+✅ Las respuestas calculadas antes de una invalidación no se guardan
+✅ Contadores de aciertos, fallos, caducadas e invalidadas
+
+Fecha: 25 de octubre de 2025
+"""
+
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+import logging
+
+try:
+    from core.aria_bm25_index import plegar_acentos
+    from core.aria_metrics import CONSULTAS_CACHE_RESPUESTAS
+except ImportError:
+    from aria_bm25_index import plegar_acentos
+    from aria_metrics import CONSULTAS_CACHE_RESPUESTAS
+
+logger = logging.getLogger(__name__)
+
+_PATRON_SIGNOS = re.compile(r'[^\w\s]+')
+_PATRON_ESPACIOS = re.compile(r'\s+')
+
+
+def normalizar_mensaje(mensaje: str) -> str:
+    """'¡Hola,   ARIA!' -> 'hola aria'"""
+    texto = _PATRON_SIGNOS.sub(' ', plegar_acentos(mensaje or ''))
+    return _PATRON_ESPACIOS.sub(' ', texto).strip()
+
+
+class ARIAResponseCache:
+    """LRU de respuestas con TTL e invalidación por versión"""
+
+    def __init__(self, capacidad: int = 1024, ttl: float = 300):
+        """
+        Args:
+            capacidad: Respuestas máximas en memoria
+            ttl: Segundos que una respuesta se puede servir desde el cache
+        """
+        self.capacidad = capacidad
+        self.ttl = ttl
+        self.version = 0
+        self._entradas: "OrderedDict[Tuple[str, str], Tuple[float, int, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.aciertos = 0
+        self.fallos = 0
+        self.caducadas = 0
+        self.invalidadas = 0
+        self.invalidaciones = 0
+
+    def obtener(self, mensaje: str, idioma: str) -> Optional[Dict[str, Any]]:
+        """Respuesta guardada para el mensaje, o None si no hay, caducó o es de otra versión"""
+        clave = (normalizar_mensaje(mensaje), idioma)
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is not None:
+                expira, version, respuesta = entrada
+                if version != self.version:
+                    del self._entradas[clave]
+                    self.invalidadas += 1
+                elif expira < time.monotonic():
+                    del self._entradas[clave]
+                    self.caducadas += 1
+                else:
+                    self._entradas.move_to_end(clave)
+                    self.aciertos += 1
+                    CONSULTAS_CACHE_RESPUESTAS.incrementar('hit')
+                    return respuesta
+            self.fallos += 1
+        CONSULTAS_CACHE_RESPUESTAS.incrementar('miss')
+        return None
+
+    def guardar(self, mensaje: str, idioma: str, respuesta: Dict[str, Any], version: int) -> bool:
+        """
+        Guardar una respuesta calculada con la versión leída al empezar la petición
+
+        Returns:
+            bool: False si hubo una invalidación mientras se calculaba (no se guarda)
+        """
+        clave = (normalizar_mensaje(mensaje), idioma)
+        with self._lock:
+            if version != self.version:
+                return False
+            self._entradas[clave] = (time.monotonic() + self.ttl, version, respuesta)
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.capacidad:
+                self._entradas.popitem(last=False)
+        return True
+
+    def invalidar(self):
+        """Subir la versión: ninguna respuesta anterior se vuelve a servir"""
+        with self._lock:
+            self.version += 1
+            self.invalidaciones += 1
+
+    def estadisticas(self) -> Dict:
+        """Tamaño, versión y contadores"""
+        consultas = self.aciertos + self.fallos
+        return {
+            'entradas': len(self._entradas),
+            'capacidad': self.capacidad,
+            'ttl_s': self.ttl,
+            'version': self.version,
+            'aciertos': self.aciertos,
+            'fallos': self.fallos,
+            'caducadas': self.caducadas,
+            'invalidadas': self.invalidadas,
+            'invalidaciones': self.invalidaciones,
+            'tasa_aciertos': round(self.aciertos / consultas, 4) if consultas else 0.0
+        }
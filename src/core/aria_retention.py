@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+♻️ ARIA RETENTION ENGINE
+=======================
+
+Retención y compactación de aria_embeddings: cada turno de chat añade filas
+'conversation' que nunca se borraban y que todas las búsquedas recorren.
+El motor aplica por categoría un TTL y un máximo de filas, y puede resumir
+los turnos antiguos de cada sesión en un único vector (media normalizada)
+antes de borrarlos.
+
+Características:
+✅ Políticas por categoría: ttl_dias, max_filas, resumir
+✅ Pasadas incrementales acotadas (lote_maximo filas por categoría)
+✅ Resumen por sesión: se crea antes de borrar y se fusiona entre pasadas
+✅ Hilo en segundo plano con intervalo configurable
+✅ Informe de filas recuperadas por pasada y acumulado
+
+Fecha: 25 de octubre de 2025
+"""
+
+import json
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+import numpy as np
+import logging
+
+try:
+    from core.aria_vector_quantization import normalizar, vector_desde_fila
+except ImportError:
+    from aria_vector_quantization import normalizar, vector_desde_fila
+
+logger = logging.getLogger(__name__)
+
+TABLA = 'aria_embeddings'
+SUFIJO_RESUMEN = '_resumen'
+LONGITUD_RESUMEN = 1000
+
+POLITICAS_POR_DEFECTO = {
+    'conversation': {'ttl_dias': 30, 'max_filas': 50000, 'resumir': True},
+    'conversation_resumen': {'ttl_dias': 365, 'max_filas': 20000}
+}
+
+
+def cargar_politicas(texto: Optional[str]) -> Dict[str, Dict[str, Any]]:
+    """Políticas desde JSON ({"categoria": {"ttl_dias": 30, ...}}) o las de por defecto"""
+    if not texto:
+        return dict(POLITICAS_POR_DEFECTO)
+    try:
+        return json.loads(texto)
+    except json.JSONDecodeError as e:
+        logger.error(f"❌ Políticas de retención inválidas ({e}): se usan las de por defecto")
+        return dict(POLITICAS_POR_DEFECTO)
+
+
+class ARIARetentionEngine:
+    """Aplica las políticas de retención sobre aria_embeddings de forma incremental"""
+
+    def __init__(self,
+                 sistema,
+                 politicas: Dict[str, Dict[str, Any]] = None,
+                 intervalo: float = 3600,
+                 lote_maximo: int = 5000):
+        """
+        Args:
+            sistema: ARIAEmbeddingsSupabase (cliente, payload de vectores, índices)
+            politicas: Categoría -> {'ttl_dias', 'max_filas', 'resumir'}
+            intervalo: Segundos entre pasadas del hilo de fondo
+            lote_maximo: Filas máximas retiradas por categoría en cada pasada
+        """
+        self.sistema = sistema
+        self.politicas = politicas if politicas is not None else dict(POLITICAS_POR_DEFECTO)
+        self.intervalo = intervalo
+        self.lote_maximo = lote_maximo
+
+        self.pasadas = 0
+        self.filas_eliminadas = 0
+        self.resumenes_creados = 0
+        self.filas_recuperadas = 0
+        self.ultima_pasada: Dict[str, Any] = {}
+
+        self._lock = threading.Lock()
+        self._detener = threading.Event()
+        self._hilo: Optional[threading.Thread] = None
+
+    # ------------------------------------------------------------------
+    # Hilo de fondo
+    # ------------------------------------------------------------------
+
+    def iniciar(self):
+        """Arrancar el hilo que ejecuta una pasada cada intervalo segundos"""
+        if self._hilo is not None:
+            return
+        self._hilo = threading.Thread(target=self._bucle, name='aria-retencion', daemon=True)
+        self._hilo.start()
+        logger.info(f"♻️ Retención activa cada {self.intervalo:.0f}s para {list(self.politicas)}")
+
+    def detener(self):
+        """Detener el hilo de fondo (la pasada en curso termina)"""
+        self._detener.set()
+        if self._hilo is not None:
+            self._hilo.join(timeout=30)
+            self._hilo = None
+
+    def _bucle(self):
+        while not self._detener.wait(self.intervalo):
+            try:
+                self.ejecutar()
+            except Exception as e:
+                logger.error(f"❌ Error en la pasada de retención: {e}")
+
+    # ------------------------------------------------------------------
+    # Pasadas
+    # ------------------------------------------------------------------
+
+    def ejecutar(self) -> Dict[str, Dict[str, int]]:
+        """
+        Ejecutar una pasada sobre todas las categorías con política
+
+        Returns:
+            Por categoría: filas eliminadas, resúmenes creados y filas recuperadas
+        """
+        with self._lock:
+            inicio = time.time()
+            informe = {}
+            for categoria, politica in self.politicas.items():
+                try:
+                    informe[categoria] = self._aplicar_politica(categoria, politica)
+                except Exception as e:
+                    logger.error(f"❌ Retención de '{categoria}' fallida: {e}")
+
+            self.pasadas += 1
+            recuperadas = sum(r['recuperadas'] for r in informe.values())
+            self.ultima_pasada = {
+                'fecha': datetime.now(timezone.utc).isoformat(),
+                'duracion_s': round(time.time() - inicio, 3),
+                'categorias': informe
+            }
+            if recuperadas:
+                logger.info(f"♻️ Retención: {recuperadas} filas recuperadas {informe}")
+            return informe
+
+    def _aplicar_politica(self, categoria: str, politica: Dict[str, Any]) -> Dict[str, int]:
+        """Retirar (y resumir si procede) las filas caducadas o sobrantes de una categoría"""
+        resumir = bool(politica.get('resumir'))
+        columnas = 'id, texto, metadatos, created_at, embedding' if resumir else 'id'
+        supabase = self.sistema.supabase
+
+        candidatas: Dict[int, Dict] = {}
+        ttl_dias = politica.get('ttl_dias')
+        if ttl_dias:
+            corte = (datetime.now(timezone.utc) - timedelta(days=float(ttl_dias))).isoformat()
+            filas = supabase.table(TABLA).select(columnas).eq('categoria', categoria)\
+                .lt('created_at', corte).order('id').limit(self.lote_maximo).execute().data or []
+            candidatas.update((f['id'], f) for f in filas)
+
+        max_filas = politica.get('max_filas')
+        if max_filas is not None and len(candidatas) < self.lote_maximo:
+            total = self.sistema.obtener_estadisticas().get('categorias_embeddings', {}).get(categoria, 0)
+            exceso = total - len(candidatas) - int(max_filas)
+            if exceso > 0:
+                # Las más antiguas primero; las ya elegidas por TTL no cuentan dos veces
+                limite = min(exceso + len(candidatas), self.lote_maximo)
+                filas = supabase.table(TABLA).select(columnas).eq('categoria', categoria)\
+                    .order('id').limit(limite).execute().data or []
+                for fila in filas:
+                    if len(candidatas) >= self.lote_maximo or exceso <= 0:
+                        break
+                    if fila['id'] not in candidatas:
+                        candidatas[fila['id']] = fila
+                        exceso -= 1
+
+        if not candidatas:
+            return {'eliminadas': 0, 'resumenes': 0, 'recuperadas': 0}
+
+        # El resumen se guarda antes de borrar: un fallo intermedio no pierde información
+        resumenes = self._resumir(categoria, list(candidatas.values())) if resumir else 0
+        eliminadas = self._eliminar(list(candidatas))
+
+        self.filas_eliminadas += eliminadas
+        self.resumenes_creados += resumenes
+        self.filas_recuperadas += eliminadas - resumenes
+        return {'eliminadas': eliminadas, 'resumenes': resumenes, 'recuperadas': eliminadas - resumenes}
+
+    def _eliminar(self, ids: List[int]) -> int:
+        """Borrar por lotes de ids en Supabase y en el índice residente"""
+        tamano = self.sistema.tamano_pagina
+        for inicio in range(0, len(ids), tamano):
+            self.sistema.supabase.table(TABLA).delete().in_('id', ids[inicio:inicio + tamano]).execute()
+        # Las lápidas llegarán también en el próximo delta (y a los destinos)
+        self.sistema.indice.eliminar_ids(ids)
+        return len(ids)
+
+    # ------------------------------------------------------------------
+    # Resúmenes por sesión
+    # ------------------------------------------------------------------
+
+    def _resumir(self, categoria: str, filas: List[Dict]) -> int:
+        """Crear o ampliar un resumen por sesión con los turnos que se van a borrar"""
+        sesiones: Dict[str, List[Dict]] = {}
+        for fila in filas:
+            metadatos = fila.get('metadatos') or {}
+            sesiones.setdefault(metadatos.get('session_id') or 'sin_sesion', []).append(fila)
+
+        categoria_resumen = f"{categoria}{SUFIJO_RESUMEN}"
+        creados = 0
+        for sesion, turnos in sesiones.items():
+            vectores = [v for v in (vector_desde_fila(t) for t in turnos) if v is not None]
+            if not vectores:
+                continue
+            suma = normalizar(np.asarray(vectores, dtype=np.float32)).sum(axis=0)
+            fragmentos = [t['texto'][:80] for t in turnos if t.get('texto')]
+            fechas = sorted(t['created_at'] for t in turnos if t.get('created_at'))
+
+            existente = self.sistema.supabase.table(TABLA)\
+                .select('id, texto, metadatos, embedding')\
+                .eq('categoria', categoria_resumen).eq('metadatos->>session_id', sesion)\
+                .limit(1).execute().data
+            if existente:
+                self._ampliar_resumen(existente[0], suma, len(vectores), fragmentos, fechas)
+                continue
+
+            datos = {
+                'texto': f"Resumen de la sesión {sesion[:8]}: " + ' | '.join(fragmentos),
+                **self.sistema._payload_vector(normalizar(suma).tolist()),
+                'categoria': categoria_resumen,
+                'subcategoria': 'resumen_sesion',
+                'fuente': 'retencion',
+                'metadatos': {
+                    'session_id': sesion,
+                    'turnos': len(vectores),
+                    'desde': fechas[0] if fechas else None,
+                    'hasta': fechas[-1] if fechas else None
+                }
+            }
+            datos['texto'] = datos['texto'][:LONGITUD_RESUMEN]
+            insertadas = self.sistema._insertar_filas(TABLA, [datos])
+            self.sistema.sincronizadores[TABLA].aplicar(insertadas)
+            creados += 1
+        return creados
+
+    def _ampliar_resumen(self, resumen: Dict, suma: np.ndarray, turnos: int,
+                         fragmentos: List[str], fechas: List[str]):
+        """Media ponderada por turnos entre el resumen existente y los turnos nuevos"""
+        metadatos = dict(resumen.get('metadatos') or {})
+        previos = int(metadatos.get('turnos', 1))
+        anterior = vector_desde_fila(resumen)
+        if anterior is not None:
+            suma = suma + normalizar(anterior) * previos
+
+        metadatos['turnos'] = previos + turnos
+        if fechas:
+            metadatos['hasta'] = max(filter(None, [metadatos.get('hasta'), fechas[-1]]))
+            metadatos['desde'] = min(filter(None, [metadatos.get('desde'), fechas[0]]))
+        texto = resumen.get('texto') or ''
+        if len(texto) < LONGITUD_RESUMEN and fragmentos:
+            texto = f"{texto} | {' | '.join(fragmentos)}"[:LONGITUD_RESUMEN]
+
+        actualizado = self.sistema.supabase.table(TABLA).update({
+            'texto': texto,
+            **self.sistema._payload_vector(normalizar(suma).tolist()),
+            'metadatos': metadatos
+        }).eq('id', resumen['id']).execute().data
+        if actualizado:
+            self.sistema.sincronizadores[TABLA].aplicar(actualizado)
+
+    def estadisticas(self) -> Dict:
+        """Acumulados y resultado de la última pasada"""
+        return {
+            'politicas': self.politicas,
+            'intervalo_s': self.intervalo,
+            'pasadas': self.pasadas,
+            'filas_eliminadas': self.filas_eliminadas,
+            'resumenes_creados': self.resumenes_creados,
+            'filas_recuperadas': self.filas_recuperadas,
+            'ultima_pasada': self.ultima_pasada
+        }
@@ -0,0 +1,547 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+🧮 ARIA VECTOR INDEX
+===================
+
+Índice vectorial residente en memoria para las búsquedas de embeddings.
+Mantiene todos los vectores normalizados (L2) en una matriz contigua junto
+con sus ids, categorías y filas, de modo que la similitud coseno de una
+búsqueda es un único producto matriz-vector seguido de una selección top-k.
+
+Características:
+✅ Matriz contigua float32, float16 o int8 con crecimiento amortizado
+✅ Puntuación directa sobre los datos cuantizados, por bloques
+✅ Filtro por categoría sin recorrer filas en Python
+✅ Selección top-k con argpartition (umbral aplicado antes de crear dicts)
+✅ Altas, reemplazos y bajas por id (sincronización incremental)
+✅ Exportación/importación de su estado para snapshots locales
+✅ Variante particionada por categoría (ARIAPartitionedIndex)
+✅ Seguro para el servidor Flask multi-hilo
+
+Fecha: 25 de octubre de 2025
+"""
+
+import heapq
+import threading
+import numpy as np
+from operator import itemgetter
+from typing import List, Dict, Any, Optional, Tuple
+import logging
+
+try:
+    from core.aria_vector_quantization import (
+        PRECISIONES, DTYPES, normalizar, cuantizar_int8, vector_desde_fila
+    )
+except ImportError:
+    from aria_vector_quantization import (
+        PRECISIONES, DTYPES, normalizar, cuantizar_int8, vector_desde_fila
+    )
+
+logger = logging.getLogger(__name__)
+
+# Columnas que nunca se guardan en las filas del índice (el vector vive en la matriz)
+COLUMNAS_VECTOR = ('embedding', 'embedding_q', 'embedding_escala')
+
+
+def seleccionar_top_k(similitudes: np.ndarray, k: int, umbral: float = None) -> np.ndarray:
+    """
+    Posiciones de las k mayores similitudes (>= umbral), de mayor a menor
+
+    El umbral se aplica sobre el array antes de la selección y sólo se
+    ordenan los k elegidos, nunca el resto de filas.
+    """
+    posiciones = None
+    valores = similitudes
+    if umbral is not None:
+        posiciones = np.flatnonzero(similitudes >= umbral)
+        valores = similitudes[posiciones]
+
+    k = min(k, len(valores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < len(valores):
+        mejores = np.argpartition(-valores, k - 1)[:k]
+    else:
+        mejores = np.arange(len(valores))
+    mejores = mejores[np.argsort(-valores[mejores], kind='stable')]
+    return posiciones[mejores] if posiciones is not None else mejores
+
+
+class ARIAVectorIndex:
+    """Índice vectorial en memoria con búsqueda por producto matriz-vector"""
+
+    # Filas por bloque al puntuar matrices cuantizadas (acota la memoria temporal)
+    TAMANO_BLOQUE = 2048
+
+    def __init__(self, dimension: int = 384, capacidad_inicial: int = 1024, precision: str = 'float32'):
+        """
+        Inicializar el índice vacío
+
+        Args:
+            dimension: Dimensiones de los embeddings
+            capacidad_inicial: Filas reservadas antes del primer crecimiento
+            precision: 'float32', 'float16' o 'int8' (con escala por vector)
+        """
+        if precision not in PRECISIONES:
+            raise ValueError(f"Precisión inválida: {precision}")
+
+        self.dimension = dimension
+        self.precision = precision
+        self._lock = threading.RLock()
+        self._matriz = np.zeros((capacidad_inicial, dimension), dtype=DTYPES[precision])
+        self._escalas = np.ones(capacidad_inicial, dtype=np.float32)
+        self._ids = np.zeros(capacidad_inicial, dtype=np.int64)
+        self._categorias = np.zeros(capacidad_inicial, dtype=np.int32)
+        self._codigos_categoria: Dict[str, int] = {}
+        self._filas: List[Dict] = []
+        self._total = 0
+
+    def __len__(self) -> int:
+        return self._total
+
+    def memoria_bytes(self) -> int:
+        """Bytes ocupados por la matriz de vectores y sus escalas"""
+        return int(self._matriz[:self._total].nbytes + self._escalas[:self._total].nbytes)
+
+    def _codigo_categoria(self, categoria: Optional[str]) -> int:
+        """Obtener (o asignar) el código entero de una categoría"""
+        if categoria not in self._codigos_categoria:
+            self._codigos_categoria[categoria] = len(self._codigos_categoria)
+        return self._codigos_categoria[categoria]
+
+    def _asegurar_capacidad(self, necesarias: int):
+        """Duplicar la capacidad de los arrays si no caben más filas"""
+        capacidad = self._matriz.shape[0]
+        if self._total + necesarias <= capacidad:
+            return
+
+        nueva = max(capacidad * 2, self._total + necesarias)
+        matriz = np.zeros((nueva, self.dimension), dtype=self._matriz.dtype)
+        matriz[:self._total] = self._matriz[:self._total]
+        self._matriz = matriz
+
+        for nombre in ('_escalas', '_ids', '_categorias'):
+            viejo = getattr(self, nombre)
+            nuevo = np.ones(nueva, dtype=viejo.dtype)
+            nuevo[:self._total] = viejo[:self._total]
+            setattr(self, nombre, nuevo)
+
+    def agregar(self, filas: List[Dict[str, Any]]) -> int:
+        """
+        Agregar filas de Supabase al índice
+
+        Args:
+            filas: Filas con 'id', 'categoria' y el vector en 'embedding'
+                   o cuantizado en 'embedding_q'/'embedding_escala'
+
+        Returns:
+            int: Número de filas agregadas
+        """
+        pares = [(f, vector_desde_fila(f)) for f in filas]
+        pares = [(f, v) for f, v in pares if v is not None]
+        if not pares:
+            return 0
+
+        filas = [f for f, _ in pares]
+        vectores = np.asarray([v for _, v in pares], dtype=np.float32)
+        if vectores.ndim != 2 or vectores.shape[1] != self.dimension:
+            logger.error(f"❌ Dimensiones inválidas para el índice: {vectores.shape}")
+            return 0
+
+        # Normalizar una sola vez al escribir (las filas antiguas pueden no estarlo)
+        vectores = normalizar(vectores)
+
+        if self.precision == 'int8':
+            almacenados, escalas = cuantizar_int8(vectores)
+        else:
+            almacenados = vectores.astype(DTYPES[self.precision])
+            escalas = np.ones(len(filas), dtype=np.float32)
+
+        with self._lock:
+            self._asegurar_capacidad(len(filas))
+            inicio, fin = self._total, self._total + len(filas)
+
+            self._matriz[inicio:fin] = almacenados
+            self._escalas[inicio:fin] = escalas
+            self._ids[inicio:fin] = [f.get('id') or 0 for f in filas]
+            self._categorias[inicio:fin] = [self._codigo_categoria(f.get('categoria')) for f in filas]
+
+            # La fila se guarda sin el vector: éste ya vive en la matriz
+            for fila in filas:
+                self._filas.append({k: v for k, v in fila.items() if k not in COLUMNAS_VECTOR})
+            self._total = fin
+
+        return len(filas)
+
+    def actualizar(self, filas: List[Dict[str, Any]]) -> int:
+        """Agregar filas reemplazando las que ya existan con el mismo id"""
+        with self._lock:
+            self.eliminar_ids([f.get('id') for f in filas if f.get('id') is not None])
+            return self.agregar(filas)
+
+    def eliminar_ids(self, ids: List[int]) -> int:
+        """Eliminar del índice las filas con los ids indicados"""
+        if not len(ids):
+            return 0
+        with self._lock:
+            conservar = ~np.isin(self._ids[:self._total], np.asarray(ids, dtype=np.int64))
+            return self._compactar(conservar)
+
+    def eliminar_categoria(self, categoria: str) -> int:
+        """Eliminar del índice todas las filas de una categoría"""
+        with self._lock:
+            codigo = self._codigos_categoria.get(categoria)
+            if codigo is None:
+                return 0
+            return self._compactar(self._categorias[:self._total] != codigo)
+
+    def _compactar(self, conservar: np.ndarray) -> int:
+        """Mover al principio las filas marcadas en conservar y descartar el resto"""
+        eliminadas = int(self._total - conservar.sum())
+        if not eliminadas:
+            return 0
+
+        posiciones = np.flatnonzero(conservar)
+        total = len(posiciones)
+        for nombre in ('_matriz', '_escalas', '_ids', '_categorias'):
+            array = getattr(self, nombre)
+            array[:total] = array[posiciones]
+        self._filas = [self._filas[i] for i in posiciones]
+        self._total = total
+        return eliminadas
+
+    def ids(self) -> np.ndarray:
+        """Copia de los ids presentes en el índice"""
+        with self._lock:
+            return self._ids[:self._total].copy()
+
+    def vaciar(self):
+        """Eliminar todas las filas del índice"""
+        with self._lock:
+            self._filas = []
+            self._total = 0
+
+    def exportar(self) -> Dict[str, Any]:
+        """Estado completo del índice (arrays recortados, categorías y filas) para un snapshot"""
+        with self._lock:
+            categorias = [None] * len(self._codigos_categoria)
+            for categoria, codigo in self._codigos_categoria.items():
+                categorias[codigo] = categoria
+            return {
+                'precision': self.precision,
+                'dimension': self.dimension,
+                'matriz': self._matriz[:self._total].copy(),
+                'escalas': self._escalas[:self._total].copy(),
+                'ids': self._ids[:self._total].copy(),
+                'categorias': self._categorias[:self._total].copy(),
+                'nombres_categoria': categorias,
+                'filas': list(self._filas)
+            }
+
+    def importar(self, estado: Dict[str, Any]):
+        """Reemplazar el contenido del índice por un estado producido con exportar()"""
+        if estado['precision'] != self.precision or estado['dimension'] != self.dimension:
+            raise ValueError("El snapshot no coincide con la precisión o dimensión del índice")
+
+        total = len(estado['ids'])
+        with self._lock:
+            self._total = 0
+            self._asegurar_capacidad(total)
+            self._matriz[:total] = estado['matriz']
+            self._escalas[:total] = estado['escalas']
+            self._ids[:total] = estado['ids']
+            self._categorias[:total] = estado['categorias']
+            self._codigos_categoria = {c: i for i, c in enumerate(estado['nombres_categoria'])}
+            self._filas = list(estado['filas'])
+            self._total = total
+
+    def _productos(self, consulta: np.ndarray, posiciones: Optional[np.ndarray]) -> np.ndarray:
+        """Producto de la consulta con las filas indicadas (todas si posiciones es None)"""
+        matriz = self._matriz[:self._total] if posiciones is None else self._matriz[posiciones]
+        escalas = self._escalas[:self._total] if posiciones is None else self._escalas[posiciones]
+
+        if self.precision == 'float32':
+            return matriz @ consulta
+
+        # Datos cuantizados: convertir por bloques para no duplicar la matriz completa
+        productos = np.empty(len(matriz), dtype=np.float32)
+        for inicio in range(0, len(matriz), self.TAMANO_BLOQUE):
+            bloque = matriz[inicio:inicio + self.TAMANO_BLOQUE]
+            productos[inicio:inicio + len(bloque)] = bloque.astype(np.float32) @ consulta
+        if self.precision == 'int8':
+            productos *= escalas
+        return productos
+
+    def _mejores(self,
+                 consulta: np.ndarray,
+                 limite: int,
+                 categoria: str = None,
+                 umbral_similitud: float = None) -> List[Tuple[float, Dict]]:
+        """
+        Top-k como pares (similitud, fila) sin copiar las filas
+
+        Llamar con el candado tomado y la consulta ya normalizada.
+        """
+        total = self._total
+        if total == 0:
+            return []
+
+        if categoria:
+            codigo = self._codigos_categoria.get(categoria)
+            if codigo is None:
+                return []
+            posiciones = np.flatnonzero(self._categorias[:total] == codigo)
+            if len(posiciones) == 0:
+                return []
+        else:
+            posiciones = None
+
+        # Vectores unitarios: la similitud coseno es directamente el producto
+        similitudes = self._productos(consulta, posiciones)
+        mejores = seleccionar_top_k(similitudes, limite, umbral_similitud)
+        filas = mejores if posiciones is None else posiciones[mejores]
+        return [(float(similitudes[i]), self._filas[p]) for i, p in zip(mejores, filas)]
+
+    def mejores(self,
+                consulta: np.ndarray,
+                limite: int,
+                umbral_similitud: float = None) -> List[Tuple[float, Dict]]:
+        """
+        Top-k como pares (similitud, fila) sin copiar las filas
+
+        Para combinar resultados de varios índices: la consulta debe venir ya
+        normalizada y las filas devueltas no se deben modificar.
+        """
+        with self._lock:
+            return self._mejores(consulta, limite, None, umbral_similitud)
+
+    def buscar(self,
+               embedding_consulta: List[float],
+               limite: int = 5,
+               categoria: str = None,
+               umbral_similitud: float = None) -> List[Dict]:
+        """
+        Buscar las filas más similares a un embedding
+
+        Args:
+            embedding_consulta: Embedding de la consulta
+            limite: Número máximo de resultados
+            categoria: Filtrar por categoría específica
+            umbral_similitud: Similitud mínima (0-1), opcional
+
+        Returns:
+            Copias de las filas con su 'similitud', ordenadas de mayor a menor
+        """
+        consulta = np.asarray(embedding_consulta, dtype=np.float32)
+        if limite <= 0 or not consulta.any():
+            return []
+
+        resultados = []
+        with self._lock:
+            for similitud, fila in self._mejores(normalizar(consulta), limite, categoria, umbral_similitud):
+                resultado = dict(fila)
+                resultado['similitud'] = similitud
+                resultados.append(resultado)
+        return resultados
+
+    def puntuar_ids(self, embedding_consulta: List[float], ids: List[int]) -> List[Dict]:
+        """Copias de las filas con los ids indicados y su 'similitud' con la consulta"""
+        consulta = np.asarray(embedding_consulta, dtype=np.float32)
+        if not len(ids) or not consulta.any():
+            return []
+        consulta = normalizar(consulta)
+
+        with self._lock:
+            posiciones = np.flatnonzero(np.isin(self._ids[:self._total], np.asarray(ids, dtype=np.int64)))
+            if len(posiciones) == 0:
+                return []
+            similitudes = self._productos(consulta, posiciones)
+            resultados = []
+            for posicion, similitud in zip(posiciones, similitudes):
+                fila = dict(self._filas[posicion])
+                fila['similitud'] = float(similitud)
+                resultados.append(fila)
+        return resultados
+
+
+class ARIAPartitionedIndex:
+    """
+    Índice particionado: un ARIAVectorIndex contiguo por categoría
+
+    Una búsqueda con categoría sólo recorre la matriz de su partición, así que
+    su coste depende del tamaño de la categoría y no del de la tabla. La vista
+    global combina el top-k de cada partición, sin duplicar los vectores.
+    """
+
+    def __init__(self, dimension: int = 384, capacidad_inicial: int = 1024, precision: str = 'float32'):
+        """
+        Inicializar el índice sin particiones
+
+        Args:
+            dimension: Dimensiones de los embeddings
+            capacidad_inicial: Filas reservadas por partición antes del primer crecimiento
+            precision: 'float32', 'float16' o 'int8' (con escala por vector)
+        """
+        if precision not in PRECISIONES:
+            raise ValueError(f"Precisión inválida: {precision}")
+
+        self.dimension = dimension
+        self.precision = precision
+        self.capacidad_inicial = capacidad_inicial
+        self._lock = threading.RLock()
+        self._particiones: Dict[Optional[str], ARIAVectorIndex] = {}
+
+    def __len__(self) -> int:
+        return sum(len(p) for p in list(self._particiones.values()))
+
+    def memoria_bytes(self) -> int:
+        """Bytes ocupados por las matrices de todas las particiones"""
+        return sum(p.memoria_bytes() for p in list(self._particiones.values()))
+
+    def categorias(self) -> Dict[Optional[str], int]:
+        """Filas por partición"""
+        return {c: len(p) for c, p in list(self._particiones.items())}
+
+    def _particion(self, categoria: Optional[str]) -> ARIAVectorIndex:
+        """Obtener (o crear) la partición de una categoría"""
+        particion = self._particiones.get(categoria)
+        if particion is None:
+            particion = ARIAVectorIndex(self.dimension, self.capacidad_inicial, self.precision)
+            self._particiones[categoria] = particion
+        return particion
+
+    def agregar(self, filas: List[Dict[str, Any]]) -> int:
+        """Agregar filas de Supabase repartiéndolas por categoría"""
+        grupos: Dict[Optional[str], List[Dict]] = {}
+        for fila in filas:
+            grupos.setdefault(fila.get('categoria'), []).append(fila)
+
+        with self._lock:
+            return sum(self._particion(c).agregar(grupo) for c, grupo in grupos.items())
+
+    def actualizar(self, filas: List[Dict[str, Any]]) -> int:
+        """Agregar filas reemplazando las que ya existan (aunque cambien de categoría)"""
+        with self._lock:
+            self.eliminar_ids([f.get('id') for f in filas if f.get('id') is not None])
+            return self.agregar(filas)
+
+    def eliminar_ids(self, ids: List[int]) -> int:
+        """Eliminar de todas las particiones las filas con los ids indicados"""
+        if not len(ids):
+            return 0
+        with self._lock:
+            eliminadas = sum(p.eliminar_ids(ids) for p in self._particiones.values())
+            self._descartar_vacias()
+            return eliminadas
+
+    def eliminar_categoria(self, categoria: str) -> int:
+        """Descartar la partición completa de una categoría"""
+        with self._lock:
+            particion = self._particiones.pop(categoria, None)
+            return len(particion) if particion is not None else 0
+
+    def _descartar_vacias(self):
+        """Liberar las particiones que se quedaron sin filas"""
+        for categoria in [c for c, p in self._particiones.items() if not len(p)]:
+            del self._particiones[categoria]
+
+    def ids(self) -> np.ndarray:
+        """Copia de los ids presentes en todas las particiones"""
+        with self._lock:
+            partes = [p.ids() for p in self._particiones.values()]
+        return np.concatenate(partes) if partes else np.zeros(0, dtype=np.int64)
+
+    def vaciar(self):
+        """Eliminar todas las particiones"""
+        with self._lock:
+            self._particiones = {}
+
+    def exportar(self) -> Dict[str, Any]:
+        """Estado de todas las particiones en el formato de ARIAVectorIndex.exportar()"""
+        with self._lock:
+            estados = [(c, p.exportar()) for c, p in self._particiones.items()]
+
+        vacio = ARIAVectorIndex(self.dimension, 1, self.precision).exportar()
+        partes = [e for _, e in estados] or [vacio]
+        return {
+            'precision': self.precision,
+            'dimension': self.dimension,
+            'matriz': np.concatenate([e['matriz'] for e in partes]),
+            'escalas': np.concatenate([e['escalas'] for e in partes]),
+            'ids': np.concatenate([e['ids'] for e in partes]),
+            # Cada partición tiene una sola categoría: su código es su posición en la lista
+            'categorias': np.concatenate([
+                np.full(len(e['ids']), i, dtype=np.int32) for i, (_, e) in enumerate(estados)
+            ] or [np.zeros(0, dtype=np.int32)]),
+            'nombres_categoria': [c for c, _ in estados],
+            'filas': [f for e in partes for f in e['filas']]
+        }
+
+    def importar(self, estado: Dict[str, Any]):
+        """Reconstruir las particiones desde un estado exportado"""
+        if estado['precision'] != self.precision or estado['dimension'] != self.dimension:
+            raise ValueError("El snapshot no coincide con la precisión o dimensión del índice")
+
+        codigos = np.asarray(estado['categorias'])
+        particiones = {}
+        for codigo, categoria in enumerate(estado['nombres_categoria']):
+            posiciones = np.flatnonzero(codigos == codigo)
+            if not len(posiciones):
+                continue
+            particion = ARIAVectorIndex(self.dimension, len(posiciones), self.precision)
+            particion.importar({
+                'precision': self.precision,
+                'dimension': self.dimension,
+                'matriz': estado['matriz'][posiciones],
+                'escalas': estado['escalas'][posiciones],
+                'ids': estado['ids'][posiciones],
+                'categorias': np.zeros(len(posiciones), dtype=np.int32),
+                'nombres_categoria': [categoria],
+                'filas': [estado['filas'][i] for i in posiciones]
+            })
+            particiones[categoria] = particion
+
+        with self._lock:
+            self._particiones = particiones
+
+    def buscar(self,
+               embedding_consulta: List[float],
+               limite: int = 5,
+               categoria: str = None,
+               umbral_similitud: float = None) -> List[Dict]:
+        """
+        Buscar las filas más similares a un embedding
+
+        Con categoría sólo se consulta su partición; sin ella se combina el
+        top-k de todas las particiones.
+        """
+        if categoria:
+            particion = self._particiones.get(categoria)
+            if particion is None:
+                return []
+            return particion.buscar(embedding_consulta, limite, None, umbral_similitud)
+
+        consulta = np.asarray(embedding_consulta, dtype=np.float32)
+        if limite <= 0 or not consulta.any():
+            return []
+        consulta = normalizar(consulta)
+
+        # Sólo se copian las filas del top-k final, no las de cada partición
+        candidatos = []
+        for particion in list(self._particiones.values()):
+            candidatos.extend(particion.mejores(consulta, limite, umbral_similitud))
+
+        resultados = []
+        for similitud, fila in heapq.nlargest(limite, candidatos, key=itemgetter(0)):
+            resultado = dict(fila)
+            resultado['similitud'] = similitud
+            resultados.append(resultado)
+        return resultados
+
+    def puntuar_ids(self, embedding_consulta: List[float], ids: List[int]) -> List[Dict]:
+        """Copias de las filas con los ids indicados y su 'similitud' con la consulta"""
+        resultados = []
+        for particion in list(self._particiones.values()):
+            resultados.extend(particion.puntuar_ids(embedding_consulta, ids))
+        return resultados
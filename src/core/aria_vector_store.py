@@ -0,0 +1,599 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+🗂️ ARIA VECTOR STORE
+===================
+
+Almacén de vectores en disco pensado para memory-mapping de sólo lectura:
+varios procesos del servidor abren los mismos archivos y comparten una única
+copia en el page cache del sistema operativo, en lugar de tener cada uno su
+propia matriz de embeddings en RAM.
+
+Estructura del directorio:
+    MANIFEST.json             -> generación, segmentos activos e ids eliminados
+    segmento_<gen>.avs        -> segmentos inmutables
+    LOCK                      -> candado del único escritor
+
+Formato de un segmento (little-endian, secciones alineadas a 64 bytes):
+    cabecera   -> magia, versión, dtype, dimensión, filas, generación y offsets
+    ids        -> int64[filas]
+    matriz     -> float32|float16[filas, dimensión], vectores normalizados (L2)
+    offsets    -> uint64[filas + 1] dentro del bloque de filas
+    filas      -> metadatos de cada fila en JSON (se decodifican sólo los del top-k)
+    meta       -> JSON con el rango de filas de cada categoría (filas ordenadas por categoría)
+
+Características:
+✅ Lectura por mmap compartida entre procesos
+✅ Publicación atómica: segmento nuevo + reemplazo del manifiesto
+✅ Un solo escritor (candado en disco: flock en POSIX, msvcrt en Windows), lectores sin bloqueo
+✅ Bajas por generación sin reescribir segmentos y compactación periódica
+✅ Búsqueda por categoría limitada a su rango de filas
+
+Fecha: 25 de octubre de 2025
+"""
+
+import os
+import json
+import heapq
+import struct
+import threading
+import numpy as np
+from typing import Any, Dict, List, Optional, Tuple
+import logging
+
+try:
+    import fcntl
+    msvcrt = None
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+try:
+    from core.aria_vector_quantization import normalizar, vector_desde_fila
+    from core.aria_vector_index import COLUMNAS_VECTOR, seleccionar_top_k
+except ImportError:
+    from aria_vector_quantization import normalizar, vector_desde_fila
+    from aria_vector_index import COLUMNAS_VECTOR, seleccionar_top_k
+
+logger = logging.getLogger(__name__)
+
+MAGIA = b'ARIAVEC1'
+VERSION_FORMATO = 1
+# magia, versión, dtype, reservado, dimensión, filas, generación,
+# offset ids, offset matriz, offset offsets, offset filas, offset meta, longitud meta
+CABECERA = struct.Struct('<8sHBBIQQQQQQQQ')
+TAMANO_CABECERA = 128
+ALINEACION = 64
+
+PRECISIONES_ALMACEN = ('float32', 'float16')
+CODIGOS_DTYPE = {'float32': 0, 'float16': 1}
+DTYPES_ALMACEN = {0: np.float32, 1: np.float16}
+
+MANIFIESTO = 'MANIFEST.json'
+
+
+def _alinear(posicion: int) -> int:
+    """Siguiente múltiplo de ALINEACION"""
+    return (posicion + ALINEACION - 1) // ALINEACION * ALINEACION
+
+
+def _escribir_atomico(ruta: str, datos: bytes):
+    """Escribir un archivo completo y publicarlo con un rename atómico"""
+    temporal = f"{ruta}.tmp"
+    with open(temporal, 'wb') as archivo:
+        archivo.write(datos)
+        archivo.flush()
+        os.fsync(archivo.fileno())
+    os.replace(temporal, ruta)
+
+
+def escribir_segmento(ruta: str,
+                      generacion: int,
+                      ids: np.ndarray,
+                      matriz: np.ndarray,
+                      categorias: List[Optional[str]],
+                      filas: List[bytes]):
+    """
+    Escribir un segmento inmutable (las filas se reordenan por categoría)
+
+    Args:
+        ruta: Archivo de destino
+        generacion: Generación del manifiesto que publica el segmento
+        ids: Ids de las filas
+        matriz: Vectores normalizados en float32 o float16
+        categorias: Categoría de cada fila
+        filas: Metadatos de cada fila ya serializados en JSON
+    """
+    if matriz.dtype == np.float16:
+        codigo = CODIGOS_DTYPE['float16']
+    else:
+        codigo = CODIGOS_DTYPE['float32']
+        matriz = matriz.astype(np.float32, copy=False)
+
+    # Agrupar por categoría para que cada una sea un rango contiguo
+    orden = sorted(range(len(ids)), key=lambda i: (categorias[i] is not None, categorias[i] or ''))
+    rangos = []
+    for posicion, i in enumerate(orden):
+        if not rangos or rangos[-1][0] != categorias[i]:
+            rangos.append([categorias[i], posicion, posicion])
+        rangos[-1][2] = posicion + 1
+
+    ids = np.ascontiguousarray(np.asarray(ids, dtype=np.int64)[orden])
+    matriz = np.ascontiguousarray(matriz[orden]) if len(orden) else matriz
+    filas = [filas[i] for i in orden]
+    offsets = np.zeros(len(filas) + 1, dtype=np.uint64)
+    if filas:
+        offsets[1:] = np.cumsum([len(f) for f in filas])
+    meta = json.dumps({'categorias': rangos}, ensure_ascii=False).encode('utf-8')
+
+    off_ids = _alinear(TAMANO_CABECERA)
+    off_matriz = _alinear(off_ids + ids.nbytes)
+    off_offsets = _alinear(off_matriz + matriz.nbytes)
+    off_filas = _alinear(off_offsets + offsets.nbytes)
+    off_meta = _alinear(off_filas + int(offsets[-1]))
+
+    buffer = bytearray(off_meta + len(meta))
+    buffer[:CABECERA.size] = CABECERA.pack(
+        MAGIA, VERSION_FORMATO, codigo, 0, matriz.shape[1] if matriz.ndim == 2 else 0,
+        len(ids), generacion, off_ids, off_matriz, off_offsets, off_filas, off_meta, len(meta)
+    )
+    buffer[off_ids:off_ids + ids.nbytes] = ids.tobytes()
+    buffer[off_matriz:off_matriz + matriz.nbytes] = matriz.tobytes()
+    buffer[off_offsets:off_offsets + offsets.nbytes] = offsets.tobytes()
+    buffer[off_filas:off_filas + int(offsets[-1])] = b''.join(filas)
+    buffer[off_meta:] = meta
+    _escribir_atomico(ruta, bytes(buffer))
+
+
+class SegmentoMapeado:
+    """Segmento abierto con mmap de sólo lectura (los arrays son vistas sin copia)"""
+
+    def __init__(self, ruta: str):
+        self.ruta = ruta
+        self._mmap = np.memmap(ruta, dtype=np.uint8, mode='r')
+
+        (magia, version, codigo, _, dimension, filas, generacion, off_ids, off_matriz,
+         off_offsets, off_filas, off_meta, len_meta) = CABECERA.unpack_from(self._mmap, 0)
+        if magia != MAGIA or version != VERSION_FORMATO:
+            raise ValueError(f"Segmento inválido: {ruta}")
+
+        self.dimension = dimension
+        self.generacion = generacion
+        self.ids = np.frombuffer(self._mmap, dtype=np.int64, count=filas, offset=off_ids)
+        self.matriz = np.frombuffer(
+            self._mmap, dtype=DTYPES_ALMACEN[codigo], count=filas * dimension, offset=off_matriz
+        ).reshape(filas, dimension)
+        self.offsets = np.frombuffer(self._mmap, dtype=np.uint64, count=filas + 1, offset=off_offsets)
+        self._off_filas = off_filas
+
+        meta = json.loads(bytes(self._mmap[off_meta:off_meta + len_meta]).decode('utf-8'))
+        self.rangos: Dict[Optional[str], Tuple[int, int]] = {
+            categoria: (inicio, fin) for categoria, inicio, fin in meta['categorias']
+        }
+        # Filas eliminadas por generaciones posteriores (la calcula el lector)
+        self.eliminadas: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def fila_bytes(self, posicion: int) -> bytes:
+        """Metadatos serializados de una fila"""
+        inicio = self._off_filas + int(self.offsets[posicion])
+        fin = self._off_filas + int(self.offsets[posicion + 1])
+        return bytes(self._mmap[inicio:fin])
+
+    def fila(self, posicion: int) -> Dict[str, Any]:
+        """Metadatos decodificados de una fila"""
+        return json.loads(self.fila_bytes(posicion).decode('utf-8'))
+
+    def categoria_de(self, posicion: int) -> Optional[str]:
+        """Categoría de una fila según los rangos del segmento"""
+        for categoria, (inicio, fin) in self.rangos.items():
+            if inicio <= posicion < fin:
+                return categoria
+        return None
+
+
+class ARIAVectorStore:
+    """Lector de un almacén de vectores mapeado en memoria (seguro entre hilos y procesos)"""
+
+    # Filas por bloque al convertir matrices float16 (acota la memoria temporal)
+    TAMANO_BLOQUE = 2048
+
+    def __init__(self, directorio: str):
+        """
+        Abrir el almacén (puede no existir todavía: se verá vacío hasta la primera publicación)
+
+        Args:
+            directorio: Carpeta con MANIFEST.json y los segmentos
+        """
+        self.directorio = directorio
+        self.precision = 'float32'
+        self.dimension = 0
+        self.generacion = 0
+        self._firma_manifiesto = None
+        self._segmentos: Tuple[SegmentoMapeado, ...] = ()
+        self._lock = threading.Lock()
+        self.refrescar()
+
+    def __len__(self) -> int:
+        return sum(len(s) - (int(s.eliminadas.sum()) if s.eliminadas is not None else 0)
+                   for s in self._segmentos)
+
+    @property
+    def segmentos(self) -> Tuple[SegmentoMapeado, ...]:
+        return self._segmentos
+
+    def refrescar(self) -> bool:
+        """
+        Releer el manifiesto si cambió y abrir los segmentos nuevos
+
+        Returns:
+            bool: True si se cargó una generación nueva
+        """
+        ruta = os.path.join(self.directorio, MANIFIESTO)
+        try:
+            estado = os.stat(ruta)
+        except FileNotFoundError:
+            return False
+
+        firma = (estado.st_mtime_ns, estado.st_size)
+        if firma == self._firma_manifiesto:
+            return False
+
+        with self._lock:
+            if firma == self._firma_manifiesto:
+                return False
+            try:
+                with open(ruta, 'r', encoding='utf-8') as archivo:
+                    manifiesto = json.load(archivo)
+
+                abiertos = {s.ruta: s for s in self._segmentos}
+                segmentos = []
+                for info in manifiesto['segmentos']:
+                    ruta_segmento = os.path.join(self.directorio, info['archivo'])
+                    segmentos.append(abiertos.get(ruta_segmento) or SegmentoMapeado(ruta_segmento))
+            except (OSError, ValueError, KeyError) as e:
+                # Un compactado pudo borrar segmentos entre lecturas: se reintenta en la próxima
+                logger.warning(f"⚠️ No se pudo refrescar el almacén {self.directorio}: {e}")
+                return False
+
+            ids_eliminados = np.asarray([int(i) for i in manifiesto['eliminados']], dtype=np.int64)
+            generaciones = np.asarray(list(manifiesto['eliminados'].values()), dtype=np.int64)
+            for segmento in segmentos:
+                posteriores = ids_eliminados[generaciones > segmento.generacion]
+                mascara = np.isin(segmento.ids, posteriores) if len(posteriores) else None
+                segmento.eliminadas = mascara if mascara is not None and mascara.any() else None
+
+            self.precision = manifiesto['precision']
+            self.dimension = manifiesto['dimension']
+            self.generacion = manifiesto['generacion']
+            self._segmentos = tuple(segmentos)
+            self._firma_manifiesto = firma
+            return True
+
+    def ids(self) -> np.ndarray:
+        """Ids vivos de todos los segmentos"""
+        partes = [s.ids if s.eliminadas is None else s.ids[~s.eliminadas] for s in self._segmentos]
+        return np.concatenate(partes) if partes else np.zeros(0, dtype=np.int64)
+
+    def _productos(self, matriz: np.ndarray, consulta: np.ndarray) -> np.ndarray:
+        """Producto de la consulta con un rango de la matriz mapeada"""
+        if matriz.dtype == np.float32:
+            return matriz @ consulta
+        productos = np.empty(len(matriz), dtype=np.float32)
+        for inicio in range(0, len(matriz), self.TAMANO_BLOQUE):
+            bloque = matriz[inicio:inicio + self.TAMANO_BLOQUE]
+            productos[inicio:inicio + len(bloque)] = bloque.astype(np.float32) @ consulta
+        return productos
+
+    def buscar(self,
+               embedding_consulta: List[float],
+               limite: int = 5,
+               categoria: str = None,
+               umbral_similitud: float = None) -> List[Dict]:
+        """
+        Buscar las filas más similares a un embedding
+
+        Args:
+            embedding_consulta: Embedding de la consulta
+            limite: Número máximo de resultados
+            categoria: Filtrar por categoría específica
+            umbral_similitud: Similitud mínima (0-1), opcional
+
+        Returns:
+            Filas decodificadas con su 'similitud', ordenadas de mayor a menor
+        """
+        consulta = np.asarray(embedding_consulta, dtype=np.float32)
+        if limite <= 0 or not consulta.any():
+            return []
+        consulta = normalizar(consulta)
+
+        candidatos = []
+        for segmento in self._segmentos:
+            if categoria:
+                if categoria not in segmento.rangos:
+                    continue
+                inicio, fin = segmento.rangos[categoria]
+            else:
+                inicio, fin = 0, len(segmento)
+            if inicio == fin:
+                continue
+
+            similitudes = self._productos(segmento.matriz[inicio:fin], consulta)
+            if segmento.eliminadas is not None:
+                similitudes[segmento.eliminadas[inicio:fin]] = -np.inf
+
+            # Las filas eliminadas (-inf) quedan fuera del umbral
+            umbral = umbral_similitud if umbral_similitud is not None else np.finfo(np.float32).min
+            mejores = seleccionar_top_k(similitudes, limite, umbral)
+            candidatos.extend((float(similitudes[i]), segmento, inicio + int(i)) for i in mejores)
+
+        # Sólo las filas del top-k final se decodifican desde el JSON del segmento
+        resultados = []
+        for similitud, segmento, posicion in heapq.nlargest(limite, candidatos, key=lambda c: c[0]):
+            fila = segmento.fila(posicion)
+            fila['similitud'] = similitud
+            resultados.append(fila)
+        return resultados
+
+
+class ARIAVectorStoreWriter:
+    """
+    Escritor único del almacén
+
+    Acumula altas y bajas con la misma interfaz de mutación que los índices
+    residentes (agregar/actualizar/eliminar_ids/vaciar), de modo que un
+    ARIAVectorSync puede alimentarlo, y las publica con publicar().
+    """
+
+    def __init__(self,
+                 directorio: str,
+                 dimension: int = 384,
+                 precision: str = 'float32',
+                 max_segmentos: int = 16,
+                 max_fraccion_eliminada: float = 0.2):
+        """
+        Abrir el almacén para escritura (falla si otro proceso ya es el escritor)
+
+        Args:
+            directorio: Carpeta del almacén (se crea si no existe)
+            dimension: Dimensiones de los embeddings
+            precision: 'float32' o 'float16'
+            max_segmentos: Segmentos a partir de los cuales publicar() compacta
+            max_fraccion_eliminada: Fracción de filas eliminadas que dispara la compactación
+        """
+        if precision not in PRECISIONES_ALMACEN:
+            raise ValueError(f"Precisión inválida para el almacén: {precision}")
+
+        self.directorio = directorio
+        self.dimension = dimension
+        self.precision = precision
+        self.max_segmentos = max_segmentos
+        self.max_fraccion_eliminada = max_fraccion_eliminada
+        os.makedirs(directorio, exist_ok=True)
+
+        self._candado = self._adquirir_candado()
+        self._lock = threading.RLock()
+        self.lector = ARIAVectorStore(directorio)
+        if self.lector.generacion and (self.lector.dimension != dimension or self.lector.precision != precision):
+            logger.warning(f"♻️ Almacén {directorio} con otro formato: se reiniciará en la próxima publicación")
+            self._vaciar_pendiente = True
+        else:
+            self._vaciar_pendiente = False
+
+        self._pendientes: Dict[int, Dict[str, Any]] = {}
+        self._eliminados_pendientes: set = set()
+
+    def _adquirir_candado(self):
+        """Candado exclusivo del escritor mientras viva el proceso"""
+        ruta = os.path.join(self.directorio, 'LOCK')
+        archivo = open(ruta, 'a+')
+        try:
+            if fcntl is not None:
+                fcntl.flock(archivo.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                # Windows: candado sobre el primer byte (puede estar más allá del final)
+                archivo.seek(0)
+                msvcrt.locking(archivo.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            archivo.close()
+            raise RuntimeError(f"Otro proceso ya escribe en el almacén {self.directorio}")
+        return archivo
+
+    def cerrar(self):
+        """Liberar el candado del escritor"""
+        if self._candado is not None:
+            if msvcrt is not None:
+                try:
+                    self._candado.seek(0)
+                    msvcrt.locking(self._candado.fileno(), msvcrt.LK_UNLCK, 1)
+                except OSError:
+                    pass
+            self._candado.close()
+            self._candado = None
+
+    def __len__(self) -> int:
+        return len(self.lector)
+
+    def hay_cambios(self) -> bool:
+        """Hay altas, bajas o un vaciado pendientes de publicar"""
+        return bool(self._pendientes or self._eliminados_pendientes or self._vaciar_pendiente)
+
+    # Interfaz de mutación compatible con los índices residentes
+
+    def agregar(self, filas: List[Dict[str, Any]]) -> int:
+        """Preparar filas para el próximo segmento (una fila con id existente la reemplaza)"""
+        with self._lock:
+            for fila in filas:
+                if fila.get('id') is not None:
+                    self._pendientes[fila['id']] = fila
+                    self._eliminados_pendientes.discard(fila['id'])
+        return len(filas)
+
+    actualizar = agregar
+
+    def eliminar_ids(self, ids: List[int]) -> int:
+        """Preparar la baja de filas"""
+        with self._lock:
+            for id_fila in ids:
+                self._pendientes.pop(int(id_fila), None)
+                self._eliminados_pendientes.add(int(id_fila))
+        return len(ids)
+
+    def eliminar_categoria(self, categoria: str) -> int:
+        """Preparar la baja de todas las filas publicadas de una categoría"""
+        ids = []
+        for segmento in self.lector.segmentos:
+            if categoria in segmento.rangos:
+                inicio, fin = segmento.rangos[categoria]
+                ids.extend(int(i) for i in segmento.ids[inicio:fin])
+        with self._lock:
+            for id_fila, fila in list(self._pendientes.items()):
+                if fila.get('categoria') == categoria:
+                    ids.append(id_fila)
+        return self.eliminar_ids(ids)
+
+    def vaciar(self):
+        """Descartar todo el contenido en la próxima publicación"""
+        with self._lock:
+            self._pendientes = {}
+            self._eliminados_pendientes = set()
+            self._vaciar_pendiente = True
+
+    # Publicación
+
+    def _manifiesto_actual(self) -> Dict[str, Any]:
+        """Manifiesto publicado (o uno vacío)"""
+        ruta = os.path.join(self.directorio, MANIFIESTO)
+        if self._vaciar_pendiente or not os.path.exists(ruta):
+            return {'generacion': self.lector.generacion, 'segmentos': [], 'eliminados': {}}
+        with open(ruta, 'r', encoding='utf-8') as archivo:
+            return json.load(archivo)
+
+    def _publicar_manifiesto(self, generacion: int, segmentos: List[Dict], eliminados: Dict[str, int]):
+        """Reemplazar el manifiesto de forma atómica"""
+        manifiesto = {
+            'formato': VERSION_FORMATO,
+            'generacion': generacion,
+            'precision': self.precision,
+            'dimension': self.dimension,
+            'segmentos': segmentos,
+            'eliminados': eliminados
+        }
+        _escribir_atomico(
+            os.path.join(self.directorio, MANIFIESTO),
+            json.dumps(manifiesto).encode('utf-8')
+        )
+        self.lector.refrescar()
+
+    def publicar(self) -> Optional[int]:
+        """
+        Escribir un segmento con las altas pendientes y publicar el nuevo manifiesto
+
+        Returns:
+            Generación publicada, o None si no había cambios
+        """
+        with self._lock:
+            if not self.hay_cambios():
+                return None
+
+            manifiesto = self._manifiesto_actual()
+            generacion = manifiesto['generacion'] + 1
+            segmentos = manifiesto['segmentos']
+            eliminados = manifiesto['eliminados']
+
+            if self._pendientes:
+                filas = list(self._pendientes.values())
+                pares = [(f, vector_desde_fila(f)) for f in filas]
+                pares = [(f, v) for f, v in pares if v is not None]
+                if pares:
+                    archivo = f"segmento_{generacion:08d}.avs"
+                    vectores = normalizar(np.asarray([v for _, v in pares], dtype=np.float32))
+                    escribir_segmento(
+                        os.path.join(self.directorio, archivo),
+                        generacion,
+                        np.asarray([f['id'] for f, _ in pares], dtype=np.int64),
+                        vectores.astype(np.float16) if self.precision == 'float16' else vectores,
+                        [f.get('categoria') for f, _ in pares],
+                        [json.dumps({k: v for k, v in f.items() if k not in COLUMNAS_VECTOR},
+                                    default=str, ensure_ascii=False).encode('utf-8')
+                         for f, _ in pares]
+                    )
+                    segmentos.append({'archivo': archivo, 'generacion': generacion, 'filas': len(pares)})
+
+            # Las versiones anteriores de las filas reemplazadas o borradas quedan ocultas
+            for id_fila in list(self._pendientes) + list(self._eliminados_pendientes):
+                eliminados[str(id_fila)] = generacion
+
+            self._publicar_manifiesto(generacion, segmentos, eliminados)
+            altas, bajas = len(self._pendientes), len(self._eliminados_pendientes)
+            self._pendientes = {}
+            self._eliminados_pendientes = set()
+            self._vaciar_pendiente = False
+            logger.info(f"📦 Almacén {self.directorio}: generación {generacion} (+{altas} / -{bajas})")
+
+            total = sum(s['filas'] for s in segmentos)
+            if len(segmentos) > self.max_segmentos or \
+                    (total and len(eliminados) > self.max_fraccion_eliminada * total):
+                self.compactar()
+            else:
+                self._borrar_huerfanos(segmentos)
+            return self.lector.generacion
+
+    def compactar(self) -> int:
+        """
+        Reescribir las filas vivas en un único segmento y olvidar las bajas
+
+        Returns:
+            Generación publicada
+        """
+        with self._lock:
+            manifiesto = self._manifiesto_actual()
+            generacion = manifiesto['generacion'] + 1
+            self.lector.refrescar()
+
+            ids, matrices, categorias, filas = [], [], [], []
+            for segmento in self.lector.segmentos:
+                vivas = np.arange(len(segmento)) if segmento.eliminadas is None \
+                    else np.flatnonzero(~segmento.eliminadas)
+                if not len(vivas):
+                    continue
+                ids.append(segmento.ids[vivas])
+                matrices.append(np.asarray(segmento.matriz[vivas]))
+                for categoria, (inicio, fin) in segmento.rangos.items():
+                    categorias.extend([categoria] * int(((vivas >= inicio) & (vivas < fin)).sum()))
+                filas.extend(segmento.fila_bytes(int(i)) for i in vivas)
+
+            segmentos = []
+            if ids:
+                archivo = f"segmento_{generacion:08d}.avs"
+                escribir_segmento(
+                    os.path.join(self.directorio, archivo),
+                    generacion,
+                    np.concatenate(ids),
+                    np.concatenate(matrices),
+                    categorias,
+                    filas
+                )
+                segmentos.append({'archivo': archivo, 'generacion': generacion, 'filas': len(filas)})
+
+            self._publicar_manifiesto(generacion, segmentos, {})
+            self._borrar_huerfanos(segmentos)
+            logger.info(f"🗜️ Almacén {self.directorio} compactado: {len(filas)} filas en 1 segmento")
+            return generacion
+
+    def _borrar_huerfanos(self, segmentos: List[Dict]):
+        """
+        Borrar los segmentos que ya no están en el manifiesto
+
+        Los lectores que aún los tengan mapeados siguen funcionando en POSIX
+        (el archivo desaparece cuando se cierra el último mmap).
+        """
+        activos = {s['archivo'] for s in segmentos}
+        for nombre in os.listdir(self.directorio):
+            if nombre.endswith('.avs') and nombre not in activos:
+                try:
+                    os.remove(os.path.join(self.directorio, nombre))
+                except OSError:
+                    pass
@@ -0,0 +1,534 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+🔄 ARIA VECTOR SYNC
+==================
+
+Sincronización incremental entre una tabla de embeddings de Supabase y su
+índice vectorial residente. En lugar de reconstruir el índice con un
+select('*') completo, recuerda hasta dónde ha leído y sólo descarga el delta.
+
+Marcas de agua:
+    ultimo_id            -> filas nuevas (id BIGSERIAL creciente)
+    ultima_actualizacion -> filas modificadas (columna updated_at)
+    ultima_lapida        -> filas borradas (tabla aria_vector_lapidas)
+
+Características:
+✅ Paginación por clave (id > marca) sin OFFSET
+✅ Recuperación de filas confirmadas fuera de orden (id menor que la marca)
+✅ Bajas por lápidas y reconciliación periódica de ids como respaldo
+✅ Snapshot local atómico: un reinicio sólo descarga el delta
+✅ Degradación a recarga completa si faltan las columnas o tablas del esquema
+✅ Destinos adicionales (p. ej. el almacén mapeado en disco) que reciben el mismo delta
+
+Fecha: 25 de octubre de 2025
+"""
+
+import io
+import os
+import json
+import time
+import threading
+import numpy as np
+from typing import Callable, Dict, List, Optional, Union
+import logging
+
+try:
+    from core.aria_vector_index import ARIAVectorIndex, ARIAPartitionedIndex
+except ImportError:
+    from aria_vector_index import ARIAVectorIndex, ARIAPartitionedIndex
+
+logger = logging.getLogger(__name__)
+
+TABLA_LAPIDAS = 'aria_vector_lapidas'
+
+# Columna o tabla inexistente (Postgres y PostgREST): el esquema no está migrado
+CODIGOS_ERROR_ESQUEMA = ('42703', '42P01', 'PGRST204', 'PGRST205')
+
+
+def es_error_esquema(error: Exception) -> bool:
+    """True si el error se debe a una columna o tabla que no existe (no es transitorio)"""
+    texto = str(error)
+    return any(codigo in texto for codigo in CODIGOS_ERROR_ESQUEMA)
+
+
+class ARIAVectorSync:
+    """Sincronizador incremental de una tabla de Supabase con un índice residente"""
+
+    def __init__(self,
+                 supabase,
+                 tabla: str,
+                 indice: Union[ARIAVectorIndex, ARIAPartitionedIndex],
+                 columnas: str = '*',
+                 tamano_pagina: int = 1000,
+                 ruta_snapshot: str = None,
+                 firma: Dict = None,
+                 preparar_filas: Callable[[List[Dict]], List[Dict]] = None,
+                 intervalo_reconciliacion: float = 21600,
+                 intervalo_snapshot: float = 300,
+                 destinos: List = None,
+                 ventana_rezagadas: int = 1000):
+        """
+        Inicializar el sincronizador
+
+        Args:
+            supabase: Cliente de Supabase
+            tabla: Tabla a sincronizar
+            indice: Índice residente que recibe el delta
+            columnas: Columnas a descargar de cada fila
+            tamano_pagina: Filas por petición a PostgREST
+            ruta_snapshot: Archivo del snapshot local (None lo desactiva)
+            firma: Datos que invalidan el snapshot si cambian (modelo, precisión...)
+            preparar_filas: Función aplicada a cada página antes de indexarla
+            intervalo_reconciliacion: Segundos entre reconciliaciones de ids (0 = nunca)
+            intervalo_snapshot: Segundos mínimos entre escrituras del snapshot
+            destinos: Objetos con agregar/actualizar/eliminar_ids/vaciar/publicar
+                      (ARIAVectorStoreWriter) que reciben cada delta y lo publican al final.
+                      Los que declaran usa_vectores = False (ARIABM25Index) viven en
+                      memoria: reciben también las filas del snapshot y las de aplicar()
+            ventana_rezagadas: Ids por debajo de la marca que cada delta comprueba (0 = no se
+                               comprueban): con varios escritores una fila de id menor puede
+                               confirmarse después de haber visto otra mayor
+        """
+        self.supabase = supabase
+        self.tabla = tabla
+        self.indice = indice
+        self.columnas = columnas
+        self.tamano_pagina = tamano_pagina
+        self.ruta_snapshot = ruta_snapshot
+        self.firma = dict(firma or {}, tabla=tabla)
+        self.preparar_filas = preparar_filas or (lambda filas: filas)
+        self.intervalo_reconciliacion = intervalo_reconciliacion
+        self.intervalo_snapshot = intervalo_snapshot
+        self.destinos = list(destinos or [])
+        self.ventana_rezagadas = ventana_rezagadas
+
+        self._lock = threading.Lock()
+        self.cargado = False
+
+        # Marcas de agua
+        self.ultimo_id = 0
+        self.ultima_actualizacion: Optional[str] = None
+        self.ultima_lapida = 0
+
+        # Capacidades del esquema (se desactivan si la columna o tabla no existe)
+        self._con_updated_at = True
+        self._con_lapidas = True
+
+        self.ultima_sincronizacion = 0.0
+        self._ultima_reconciliacion = 0.0
+        self._ultimo_snapshot = 0.0
+        self._cambios_sin_snapshot = 0
+
+        self.sincronizaciones = 0
+        self.filas_descargadas = 0
+
+    # ------------------------------------------------------------------
+    # Sincronización
+    # ------------------------------------------------------------------
+
+    def sincronizar(self, bloquear: bool = True) -> Optional[Dict[str, int]]:
+        """
+        Aplicar al índice el delta desde la última sincronización
+
+        Args:
+            bloquear: Si es False y otro hilo ya está sincronizando, no esperar
+
+        Returns:
+            Conteo de filas nuevas, modificadas y eliminadas (None si no se ejecutó)
+        """
+        if not self._lock.acquire(blocking=bloquear):
+            return None
+        try:
+            if not self.cargado:
+                if not self._cargar_snapshot():
+                    return self._sincronizar_completo()
+
+            cambios = {
+                'nuevas': self._recuperar_rezagadas() + self._descargar_nuevas(),
+                'modificadas': self._descargar_modificadas(),
+                'eliminadas': self._aplicar_lapidas()
+            }
+
+            # Respaldo de las lápidas (o único mecanismo de bajas si la tabla no existe)
+            if self.intervalo_reconciliacion > 0 and \
+                    time.time() - self._ultima_reconciliacion > self.intervalo_reconciliacion:
+                cambios['eliminadas'] += self._reconciliar()
+
+            self.sincronizaciones += 1
+            self.ultima_sincronizacion = time.time()
+            self._publicar_destinos()
+            self._registrar_cambios(sum(cambios.values()))
+            if any(cambios.values()):
+                logger.info(f"🔄 {self.tabla}: delta aplicado {cambios}")
+            return cambios
+        finally:
+            self._lock.release()
+
+    def sincronizar_completo(self) -> Dict[str, int]:
+        """Descartar el estado local y volver a descargar la tabla entera"""
+        with self._lock:
+            return self._sincronizar_completo()
+
+    def _sincronizar_completo(self) -> Dict[str, int]:
+        """Recarga completa (primer arranque, snapshot inválido o recarga forzada)"""
+        # La marca de lápidas se toma antes de leer: los borrados concurrentes se aplicarán después
+        self.ultima_lapida = self._maxima_lapida()
+        self.ultimo_id = 0
+        self.ultima_actualizacion = None
+        self.indice.vaciar()
+        for destino in self.destinos:
+            destino.vaciar()
+
+        nuevas = self._descargar_nuevas(reemplazar=False)
+
+        self.cargado = True
+        self._ultima_reconciliacion = time.time()
+        self.sincronizaciones += 1
+        self.ultima_sincronizacion = time.time()
+        self._publicar_destinos()
+        self.guardar_snapshot()
+        logger.info(f"✅ {self.tabla}: índice cargado con {len(self.indice)} filas")
+        return {'nuevas': nuevas, 'modificadas': 0, 'eliminadas': 0}
+
+    def aplicar(self, filas: List[Dict]) -> int:
+        """
+        Aplicar filas recién escritas por este proceso sin esperar al próximo delta
+
+        Las marcas de agua no avanzan: el siguiente delta las volverá a leer y
+        simplemente las reemplazará por id. Espera a que termine la sincronización en
+        curso: la recarga completa añade sin reemplazar y duplicaría las filas aplicadas
+        a mitad de descarga.
+        """
+        if not filas:
+            return 0
+        with self._lock:
+            if not self.cargado:
+                return 0
+            filas = self.preparar_filas(filas)
+            for destino in self._destinos_en_memoria():
+                destino.actualizar(filas)
+            return self.indice.actualizar(filas)
+
+    def _destinos_en_memoria(self) -> List:
+        """Destinos que no persisten nada y sólo necesitan las filas"""
+        return [d for d in self.destinos if not getattr(d, 'usa_vectores', True)]
+
+    def _avanzar_marcas(self, filas: List[Dict]):
+        """Actualizar las marcas de agua con las filas descargadas"""
+        self.ultimo_id = max(self.ultimo_id, max(f['id'] for f in filas))
+        actualizaciones = [f['updated_at'] for f in filas if f.get('updated_at')]
+        if actualizaciones:
+            self.ultima_actualizacion = max([self.ultima_actualizacion or ''] + actualizaciones)
+
+    def _aplicar_filas(self, filas: List[Dict], reemplazar: bool = True):
+        """Aplicar una página descargada al índice y a los destinos"""
+        filas = self.preparar_filas(filas)
+        if reemplazar:
+            self.indice.actualizar(filas)
+        else:
+            self.indice.agregar(filas)
+        for destino in self.destinos:
+            destino.actualizar(filas)
+
+    def _eliminar_ids(self, ids) -> int:
+        """Eliminar filas del índice y de los destinos"""
+        for destino in self.destinos:
+            destino.eliminar_ids(ids)
+        return self.indice.eliminar_ids(ids)
+
+    def _publicar_destinos(self):
+        """Publicar en cada destino los cambios acumulados por este delta"""
+        for destino in self.destinos:
+            try:
+                if destino.hay_cambios():
+                    destino.publicar()
+            except Exception as e:
+                logger.error(f"❌ Error publicando {self.tabla} en {destino}: {e}")
+
+    def _descargar_nuevas(self, reemplazar: bool = True) -> int:
+        """
+        Filas con id mayor que la marca, paginando por clave
+
+        Args:
+            reemplazar: Sustituir por id las filas que ya estén en el índice
+                        (innecesario en la recarga completa, que parte de cero)
+        """
+        total = 0
+        while True:
+            resultado = self.supabase.table(self.tabla).select(self.columnas)\
+                .gt('id', self.ultimo_id).order('id').limit(self.tamano_pagina).execute()
+            filas = resultado.data or []
+            if not filas:
+                break
+
+            self._aplicar_filas(filas, reemplazar)
+            self._avanzar_marcas(filas)
+            total += len(filas)
+            if len(filas) < self.tamano_pagina:
+                break
+
+        self.filas_descargadas += total
+        return total
+
+    def _descargar_ids(self, ids) -> int:
+        """Descargar y aplicar filas concretas por id (las que ya no existan se ignoran)"""
+        ids = [int(i) for i in ids]
+        total = 0
+        for inicio in range(0, len(ids), self.tamano_pagina):
+            resultado = self.supabase.table(self.tabla).select(self.columnas)\
+                .in_('id', ids[inicio:inicio + self.tamano_pagina]).execute()
+            filas = resultado.data or []
+            if filas:
+                self._aplicar_filas(filas)
+                total += len(filas)
+        self.filas_descargadas += total
+        return total
+
+    def _recuperar_rezagadas(self) -> int:
+        """
+        Filas de la ventana de ids bajo la marca que faltan en el índice
+
+        Ni la marca de id (ya la superaron) ni la de updated_at (el de su alta puede ser
+        anterior a la marca) las ven: se comparan sólo los ids y se descargan las que faltan.
+        """
+        if not self.ventana_rezagadas or not self.ultimo_id:
+            return 0
+        try:
+            resultado = self.supabase.table(self.tabla).select('id')\
+                .gt('id', max(0, self.ultimo_id - self.ventana_rezagadas)).lte('id', self.ultimo_id)\
+                .order('id').limit(self.ventana_rezagadas).execute()
+            remotos = np.asarray([f['id'] for f in resultado.data or []], dtype=np.int64)
+            faltantes = np.setdiff1d(remotos, self.indice.ids())
+            if not len(faltantes):
+                return 0
+            recuperadas = self._descargar_ids(faltantes)
+            logger.info(f"🔄 {self.tabla}: {recuperadas} filas confirmadas fuera de orden recuperadas")
+            return recuperadas
+        except Exception as e:
+            logger.warning(f"⚠️ {self.tabla}: error comprobando filas rezagadas, se reintentará ({e})")
+            return 0
+
+    def _descargar_modificadas(self) -> int:
+        """Filas ya conocidas (id <= marca) cuyo updated_at es posterior a la marca"""
+        if not self._con_updated_at or not self.ultima_actualizacion:
+            return 0
+
+        marca, tope = self.ultima_actualizacion, self.ultimo_id
+        total = 0
+        inicio = 0
+        try:
+            while True:
+                resultado = self.supabase.table(self.tabla).select(self.columnas)\
+                    .gt('updated_at', marca).lte('id', tope)\
+                    .order('updated_at').order('id')\
+                    .range(inicio, inicio + self.tamano_pagina - 1).execute()
+                filas = resultado.data or []
+                if filas:
+                    self._aplicar_filas(filas)
+                    self._avanzar_marcas(filas)
+                    total += len(filas)
+                if len(filas) < self.tamano_pagina:
+                    break
+                inicio += self.tamano_pagina
+        except Exception as e:
+            # Sólo un esquema sin migrar desactiva el seguimiento; un fallo de red se
+            # reintenta en la próxima sincronización desde la marca alcanzada
+            if not es_error_esquema(e):
+                logger.warning(f"⚠️ {self.tabla}: error descargando modificaciones, se reintentará ({e})")
+            else:
+                logger.warning(f"⚠️ {self.tabla}: sin columna updated_at, no se siguen modificaciones ({e})")
+                self._con_updated_at = False
+
+        self.filas_descargadas += total
+        return total
+
+    def _maxima_lapida(self) -> int:
+        """Id de la lápida más reciente de la tabla (0 si no hay o no existe la tabla)"""
+        if not self._con_lapidas:
+            return 0
+        try:
+            resultado = self.supabase.table(TABLA_LAPIDAS).select('id')\
+                .eq('tabla', self.tabla).order('id', desc=True).limit(1).execute()
+            return resultado.data[0]['id'] if resultado.data else 0
+        except Exception as e:
+            if not es_error_esquema(e):
+                # Transitorio: la recarga completa falla y se repite (sin marca no se pueden seguir las bajas)
+                raise
+            logger.warning(f"⚠️ Tabla {TABLA_LAPIDAS} no disponible, se usará reconciliación ({e})")
+            self._con_lapidas = False
+            return 0
+
+    def _aplicar_lapidas(self) -> int:
+        """Eliminar del índice las filas borradas desde la última lápida vista"""
+        if not self._con_lapidas:
+            return 0
+
+        eliminadas = 0
+        try:
+            while True:
+                resultado = self.supabase.table(TABLA_LAPIDAS).select('id, fila_id')\
+                    .eq('tabla', self.tabla).gt('id', self.ultima_lapida)\
+                    .order('id').limit(self.tamano_pagina).execute()
+                lapidas = resultado.data or []
+                if not lapidas:
+                    break
+
+                eliminadas += self._eliminar_ids([l['fila_id'] for l in lapidas])
+                self.ultima_lapida = lapidas[-1]['id']
+                if len(lapidas) < self.tamano_pagina:
+                    break
+        except Exception as e:
+            if not es_error_esquema(e):
+                logger.warning(f"⚠️ {self.tabla}: error leyendo lápidas, se reintentará ({e})")
+            else:
+                logger.warning(f"⚠️ Tabla {TABLA_LAPIDAS} no disponible, se usará reconciliación ({e})")
+                self._con_lapidas = False
+
+        return eliminadas
+
+    def reconciliar(self) -> int:
+        """Eliminar del índice los ids que ya no existen en la tabla y descargar los que faltan"""
+        with self._lock:
+            return self._reconciliar()
+
+    def _reconciliar(self) -> int:
+        """
+        Comparar los ids locales con los remotos (sólo se descarga la columna id)
+
+        Los huérfanos se eliminan y los ids remotos bajo la marca que faltan en el
+        índice (confirmados fuera de orden, fuera de la ventana) se descargan.
+        """
+        remotos = []
+        ultimo = 0
+        while True:
+            resultado = self.supabase.table(self.tabla).select('id')\
+                .gt('id', ultimo).order('id').limit(self.tamano_pagina).execute()
+            pagina = [f['id'] for f in resultado.data or []]
+            remotos.extend(pagina)
+            if len(pagina) < self.tamano_pagina:
+                break
+            ultimo = pagina[-1]
+
+        # Las filas insertadas después del recorrido (id mayor) no se tocan
+        locales = self.indice.ids()
+        tope = remotos[-1] if remotos else 0
+        huerfanos = np.setdiff1d(locales[locales <= tope], np.asarray(remotos, dtype=np.int64))
+        if not remotos:
+            huerfanos = locales
+
+        # Las de id mayor que la marca llegarán con el próximo delta de nuevas
+        remotos = np.asarray(remotos, dtype=np.int64)
+        faltantes = np.setdiff1d(remotos[remotos <= self.ultimo_id], locales)
+
+        self._ultima_reconciliacion = time.time()
+        eliminadas = self._eliminar_ids(huerfanos)
+        recuperadas = self._descargar_ids(faltantes) if len(faltantes) else 0
+        if eliminadas or recuperadas:
+            logger.info(f"🔄 {self.tabla}: reconciliación eliminó {eliminadas} filas y recuperó {recuperadas}")
+        return eliminadas
+
+    # ------------------------------------------------------------------
+    # Snapshot local
+    # ------------------------------------------------------------------
+
+    def _registrar_cambios(self, cambios: int):
+        """Escribir el snapshot si hubo cambios y pasó el intervalo mínimo"""
+        self._cambios_sin_snapshot += cambios
+        if self._cambios_sin_snapshot and time.time() - self._ultimo_snapshot >= self.intervalo_snapshot:
+            self.guardar_snapshot()
+
+    def guardar_snapshot(self) -> bool:
+        """Escribir el índice y las marcas de agua en disco (reemplazo atómico)"""
+        if not self.ruta_snapshot:
+            return False
+        try:
+            estado = self.indice.exportar()
+            meta = {
+                'firma': self.firma,
+                'ultimo_id': self.ultimo_id,
+                'ultima_actualizacion': self.ultima_actualizacion,
+                'ultima_lapida': self.ultima_lapida,
+                'nombres_categoria': estado['nombres_categoria'],
+                'filas': estado['filas']
+            }
+            buffer = io.BytesIO()
+            np.savez(
+                buffer,
+                matriz=estado['matriz'],
+                escalas=estado['escalas'],
+                ids=estado['ids'],
+                categorias=estado['categorias'],
+                meta=np.frombuffer(json.dumps(meta, default=str).encode('utf-8'), dtype=np.uint8)
+            )
+
+            directorio = os.path.dirname(self.ruta_snapshot)
+            if directorio:
+                os.makedirs(directorio, exist_ok=True)
+            temporal = f"{self.ruta_snapshot}.tmp"
+            with open(temporal, 'wb') as archivo:
+                archivo.write(buffer.getvalue())
+                archivo.flush()
+                os.fsync(archivo.fileno())
+            os.replace(temporal, self.ruta_snapshot)
+
+            self._ultimo_snapshot = time.time()
+            self._cambios_sin_snapshot = 0
+            logger.info(f"💾 Snapshot de {self.tabla} guardado ({len(estado['ids'])} filas)")
+            return True
+        except Exception as e:
+            logger.error(f"❌ Error guardando snapshot de {self.tabla}: {e}")
+            return False
+
+    def _cargar_snapshot(self) -> bool:
+        """Restaurar el índice y las marcas de agua desde disco si el snapshot es válido"""
+        if not self.ruta_snapshot or not os.path.exists(self.ruta_snapshot):
+            return False
+        try:
+            with np.load(self.ruta_snapshot) as datos:
+                meta = json.loads(datos['meta'].tobytes().decode('utf-8'))
+                if meta.get('firma') != self.firma:
+                    logger.info(f"♻️ Snapshot de {self.tabla} descartado: firma distinta")
+                    return False
+
+                self.indice.importar({
+                    'precision': self.indice.precision,
+                    'dimension': self.indice.dimension,
+                    'matriz': datos['matriz'],
+                    'escalas': datos['escalas'],
+                    'ids': datos['ids'],
+                    'categorias': datos['categorias'],
+                    'nombres_categoria': meta['nombres_categoria'],
+                    'filas': meta['filas']
+                })
+                for destino in self._destinos_en_memoria():
+                    destino.vaciar()
+                    destino.actualizar(meta['filas'])
+
+            self.ultimo_id = meta['ultimo_id']
+            self.ultima_actualizacion = meta['ultima_actualizacion']
+            self.ultima_lapida = meta['ultima_lapida']
+            self.cargado = True
+            self._ultimo_snapshot = time.time()
+            logger.info(f"✅ Snapshot de {self.tabla} cargado ({len(self.indice)} filas, id > {self.ultimo_id} pendiente)")
+            return True
+        except Exception as e:
+            logger.error(f"❌ Snapshot de {self.tabla} inválido, recarga completa: {e}")
+            self.indice.vaciar()
+            return False
+
+    def estadisticas(self) -> Dict:
+        """Estado de la sincronización"""
+        return {
+            'tabla': self.tabla,
+            'cargado': self.cargado,
+            'filas_indice': len(self.indice),
+            'ultimo_id': self.ultimo_id,
+            'ultima_actualizacion': self.ultima_actualizacion,
+            'ultima_lapida': self.ultima_lapida,
+            'lapidas_activas': self._con_lapidas,
+            'updated_at_activo': self._con_updated_at,
+            'sincronizaciones': self.sincronizaciones,
+            'filas_descargadas': self.filas_descargadas,
+            'snapshot': self.ruta_snapshot
+        }
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+📮 ARIA WRITE-BEHIND
+===================
+
+Cola de escritura diferida para los inserts en Supabase. La petición sólo deja
+las filas en memoria; un hilo las envía como inserts masivos cuando se juntan
+N filas o pasan T milisegundos desde la más antigua.
+
+Características:
+✅ Cola acotada: si está llena, encolar() devuelve False y el llamador escribe directo
+✅ Inserts masivos por tabla (una llamada HTTP por lote)
+✅ Reintentos con espera exponencial ante fallos transitorios
+✅ Clave estable por lote: un reintento tras un timeout ya confirmado no recuenta frecuencias
+✅ Vaciado explícito y al cerrar (atexit)
+✅ Métricas de profundidad, lotes, reintentos y filas descartadas
+
+Fecha: 25 de octubre de 2025
+"""
+
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ARIAWriteBehindQueue:
+    """Cola acotada de filas pendientes con un hilo que las inserta por lotes"""
+
+    def __init__(self,
+                 insertar: Callable[[str, List[Dict], str], List[Dict]],
+                 al_insertar: Optional[Callable[[str, List[Dict]], None]] = None,
+                 capacidad: int = 10000,
+                 tamano_lote: int = 64,
+                 intervalo_ms: float = 500,
+                 reintentos: int = 5,
+                 espera_base: float = 0.5):
+        """
+        Arrancar el hilo de escritura
+
+        Args:
+            insertar: Función (tabla, filas, clave del lote) -> filas creadas; debe lanzar
+                      excepción si falla. La clave es la misma en todos los reintentos del lote
+            al_insertar: Llamada con (tabla, filas creadas) tras cada insert correcto
+            capacidad: Filas máximas pendientes en memoria
+            tamano_lote: Filas por insert (y umbral que dispara el envío)
+            intervalo_ms: Espera máxima de una fila antes de enviarse
+            reintentos: Reintentos de un lote antes de descartarlo
+            espera_base: Segundos de espera antes del primer reintento (se duplica en cada uno)
+        """
+        self.insertar = insertar
+        self.al_insertar = al_insertar
+        self.capacidad = capacidad
+        self.tamano_lote = tamano_lote
+        self.intervalo = intervalo_ms / 1000.0
+        self.reintentos = reintentos
+        self.espera_base = espera_base
+
+        self._pendientes: Dict[str, Deque[Dict]] = {}
+        self._total = 0
+        self._en_vuelo = 0
+        self._desde = 0.0
+        self._forzar = False
+        self._activo = True
+        self._condicion = threading.Condition()
+
+        self.filas_insertadas = 0
+        self.filas_descartadas = 0
+        self.filas_rechazadas = 0
+        self.lotes = 0
+        self.reintentos_hechos = 0
+        self.max_profundidad = 0
+
+        self._hilo = threading.Thread(target=self._bucle, name='aria-write-behind', daemon=True)
+        self._hilo.start()
+
+    @property
+    def profundidad(self) -> int:
+        """Filas pendientes (en cola y en vuelo)"""
+        return self._total + self._en_vuelo
+
+    def encolar(self, tabla: str, filas: List[Dict]) -> bool:
+        """
+        Dejar filas pendientes de insertar
+
+        Returns:
+            bool: False si no caben todas (no se encola ninguna) o la cola está cerrada
+        """
+        if not filas:
+            return True
+        with self._condicion:
+            if not self._activo or self._total + len(filas) > self.capacidad:
+                self.filas_rechazadas += len(filas)
+                return False
+            if not self._total:
+                self._desde = time.monotonic()
+            self._pendientes.setdefault(tabla, deque()).extend(filas)
+            self._total += len(filas)
+            self.max_profundidad = max(self.max_profundidad, self.profundidad)
+            if self._total >= self.tamano_lote:
+                self._condicion.notify_all()
+        return True
+
+    def vaciar(self, timeout: Optional[float] = None) -> bool:
+        """
+        Enviar ya todo lo pendiente y esperar a que termine
+
+        Returns:
+            bool: True si la cola quedó vacía antes del timeout
+        """
+        limite = None if timeout is None else time.monotonic() + timeout
+        with self._condicion:
+            self._forzar = True
+            self._condicion.notify_all()
+            while self.profundidad:
+                restante = None if limite is None else limite - time.monotonic()
+                if restante is not None and restante <= 0:
+                    return False
+                self._condicion.wait(restante)
+        return True
+
+    def cerrar(self, timeout: float = 30.0):
+        """Vaciar la cola y detener el hilo (las filas nuevas se rechazan)"""
+        if not self._activo:
+            return
+        if not self.vaciar(timeout):
+            logger.warning(f"⚠️ Cierre con {self.profundidad} filas sin escribir")
+        with self._condicion:
+            self._activo = False
+            self._condicion.notify_all()
+        self._hilo.join(timeout=5)
+
+    def _tomar_lotes(self) -> List:
+        """Sacar hasta tamano_lote filas de cada tabla (con el candado tomado)"""
+        lotes = []
+        for tabla, cola in self._pendientes.items():
+            if cola:
+                filas = [cola.popleft() for _ in range(min(len(cola), self.tamano_lote))]
+                lotes.append((tabla, filas))
+                self._total -= len(filas)
+                self._en_vuelo += len(filas)
+        if not self._total:
+            self._forzar = False
+        return lotes
+
+    def _bucle(self):
+        """Hilo de escritura"""
+        while True:
+            with self._condicion:
+                while self._activo and not self._forzar and self._total < self.tamano_lote:
+                    if self._total:
+                        restante = self._desde + self.intervalo - time.monotonic()
+                        if restante <= 0:
+                            break
+                        self._condicion.wait(restante)
+                    else:
+                        self._condicion.wait()
+                if not self._total:
+                    if not self._activo:
+                        return
+                    self._forzar = False
+                    continue
+                lotes = self._tomar_lotes()
+
+            for tabla, filas in lotes:
+                self._escribir(tabla, filas)
+                with self._condicion:
+                    self._en_vuelo -= len(filas)
+                    self._condicion.notify_all()
+
+    def _escribir(self, tabla: str, filas: List[Dict]):
+        """Insertar un lote reintentando con espera exponencial"""
+        # Un timeout no dice si el servidor confirmó el lote: el reintento lleva la misma
+        # clave y el upsert no vuelve a sumar 'frecuencia' a las filas que ya contó
+        # (sólo si ningún otro lote las tocó entre medias)
+        clave = uuid.uuid4().hex
+        for intento in range(self.reintentos + 1):
+            try:
+                insertadas = self.insertar(tabla, filas, clave)
+                break
+            except Exception as e:
+                if intento == self.reintentos:
+                    self.filas_descartadas += len(filas)
+                    logger.error(f"❌ {len(filas)} filas de {tabla} descartadas tras {intento + 1} intentos: {e}")
+                    return
+                self.reintentos_hechos += 1
+                espera = self.espera_base * (2 ** intento)
+                logger.warning(f"⚠️ Insert diferido en {tabla} falló ({e}); reintento en {espera:.1f}s")
+                time.sleep(espera)
+
+        self.lotes += 1
+        self.filas_insertadas += len(insertadas)
+        if self.al_insertar and insertadas:
+            try:
+                self.al_insertar(tabla, insertadas)
+            except Exception as e:
+                logger.warning(f"⚠️ Error aplicando filas insertadas de {tabla}: {e}")
+
+    def estadisticas(self) -> Dict:
+        """Métricas de la cola"""
+        return {
+            'profundidad': self.profundidad,
+            'max_profundidad': self.max_profundidad,
+            'capacidad': self.capacidad,
+            'filas_insertadas': self.filas_insertadas,
+            'filas_descartadas': self.filas_descartadas,
+            'filas_rechazadas': self.filas_rechazadas,
+            'lotes': self.lotes,
+            'reintentos': self.reintentos_hechos,
+            'activa': self._activo
+        }
@@ -12,6 +12,11 @@ import logging
 from typing import Dict, Optional, List
 from datetime import datetime
 
+try:
+    from core.aria_metrics import DURACION_APIS, ERRORES_APIS, cronometrar
+except ImportError:
+    from aria_metrics import DURACION_APIS, ERRORES_APIS, cronometrar
+
 try:
     from supabase import create_client, Client
     import os
@@ -45,6 +50,10 @@ class EmotionDetectorSupabase:
         self.emotion_cache = {}
         self.config_cache = {}
         
+        # Si se asigna (p. ej. la cola de trabajos del servidor), el historial
+        # se entrega aquí en lugar de insertarse durante la detección
+        self.diferir_historial = None
+        
         # Cargar emociones desde Supabase
         self._load_emotions_from_supabase()
         self._load_config_from_supabase()
@@ -158,7 +167,8 @@ class EmotionDetectorSupabase:
                 "show_original_response": False
             }
             
-            response = requests.post(self.url, json=payload, headers=self.headers, timeout=10)
+            with cronometrar(DURACION_APIS, 'edenai', errores=ERRORES_APIS):
+                response = requests.post(self.url, json=payload, headers=self.headers, timeout=10)
             
             if response.status_code == 200:
                 result = response.json()
@@ -167,7 +177,7 @@ class EmotionDetectorSupabase:
                 # Mapear usando datos de Supabase
                 aria_emotion = self._map_to_aria_emotion_supabase(emotion_data)
                 
-                # Registrar en historial si está disponible
+                # Registrar en historial si está disponible (o dejarlo en la cola)
                 self._save_emotion_history(text, emotion_data, aria_emotion, user_context)
                 
                 return {
@@ -185,6 +195,7 @@ class EmotionDetectorSupabase:
                     'source': 'supabase'
                 }
             else:
+                ERRORES_APIS.incrementar('edenai')
                 return self._fallback_emotion(text, user_context)
                 
         except Exception as e:
@@ -254,16 +265,24 @@ class EmotionDetectorSupabase:
             
             # Guardar en tabla de historial (si existe)
             # Nota: Por ahora lo guardamos en la tabla de conocimiento
-            supabase.table("aria_knowledge").insert({
+            fila = {
                 'concept': f"emotion_history_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
                 'description': json.dumps(history_data),
                 'category': 'emotion_history',
                 'confidence': emotion_data.get('confidence', 0.5)
-            }).execute()
+            }
+            if self.diferir_historial:
+                self.diferir_historial(fila)
+            else:
+                self.guardar_historial(fila)
             
         except Exception as e:
             print(f"⚠️ Error guardando historial emocional: {e}")
     
+    def guardar_historial(self, fila: Dict):
+        """Insertar una fila de historial emocional (lanza excepción si falla)"""
+        supabase.table("aria_knowledge").insert(fila).execute()
+    
     def _fallback_emotion(self, text: str, context: str) -> Dict:
         """Sistema de emociones fallback usando datos de Supabase"""
         
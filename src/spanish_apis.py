@@ -18,6 +18,8 @@ import urllib.parse
 from datetime import datetime
 import logging
 
+from core.aria_metrics import DURACION_APIS, ERRORES_APIS
+
 # Configurar logging
 logger = logging.getLogger(__name__)
 
@@ -60,6 +62,7 @@ class ARIASpanishAPIs:
         """
         Búsqueda comprehensiva usando múltiples APIs españolas
         """
+        inicio = time.perf_counter()
         results = {
             'query': query,
             'timestamp': datetime.now().isoformat(),
@@ -114,7 +117,9 @@ class ARIASpanishAPIs:
             logger.error(f"Error en búsqueda comprehensiva: {e}")
             results['success'] = False
             results['error'] = str(e)
+            ERRORES_APIS.incrementar('spanish_apis')
         
+        DURACION_APIS.observar(time.perf_counter() - inicio, 'spanish_apis')
         return results
     
     def _search_duckduckgo(self, query: str, max_results: int = 3) -> List[Dict]: